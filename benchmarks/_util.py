@@ -0,0 +1,27 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import argparse
+import time
+
+clock = time.perf_counter
+
+def best_of(func, repeat):
+    """ The shortest time of repeat calls of func() (in seconds) """
+    times = []
+    for i in range(repeat):
+        start = clock()
+        func()
+        times.append(clock() - start)
+    return min(times)
+
+def argument_parser(description, rows=None):
+    """ A parser with the --repeat option and, given the default number
+        of rows, --rows and --interval of the generated log data """
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    if rows is not None:
+        parser.add_argument('--rows', type=int, default=rows, help='Number of log rows to generate')
+        parser.add_argument('--interval', type=int, default=60, help='Logging interval in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per measurement (the best is reported)')
+    return parser
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""
+Compare the size and load time of stored log data:
+the former list of dict rows, the raw LogData arrays
+and the compressed encoding of opus20.codec.
+
+The log data is generated by Opus20FakeServer.synthetic_log_frames().
+"""
+
+import pickle
+
+from _util import argument_parser, best_of
+from opus20 import Opus20FakeServer, LogData
+from opus20 import codec
+
+def raw_state(data):
+    return data.ts.tobytes(), {channel: values.tobytes() for channel, values in data.columns.items()}
+
+def main():
+    parser = argument_parser(__doc__, rows=100000)
+    args = parser.parse_args()
+
+    data = LogData()
+    for frame in Opus20FakeServer.synthetic_log_frames(args.rows, interval=args.interval, seed=0):
+        frame.validate()
+        data.extend(frame.get_log_data())
+
+    dict_rows = list(data)
+    candidates = [
+      # the former PickleStore format: a list of dicts pickled with protocol 2
+      ('dict rows (pickle)', pickle.dumps(dict_rows, 2), pickle.loads),
+      ('LogData raw arrays', pickle.dumps(raw_state(data)), pickle.loads),
+      ('LogData codec',      data.encode(), LogData.decode),
+    ]
+
+    print("{} rows, {} channels, numpy: {}".format(len(data), len(data.channels), codec.np is not None))
+    print("{:22s} {:>12s} {:>9s} {:>11s}".format('format', 'size [B]', 'B / row', 'load [ms]'))
+    for name, blob, load in candidates:
+        seconds = best_of(lambda: load(blob), args.repeat)
+        print("{:22s} {:12d} {:9.2f} {:11.1f}".format(name, len(blob), len(blob) / len(data), seconds * 1000))
+
+if __name__ == "__main__": main()
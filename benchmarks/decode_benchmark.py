@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Compare the decoding of log data answer frames: the former row by
+row decoder (a dict per row, one read_channel_value() per value) with
+the columnar decoder Frame.get_log_columns(), unpacked with struct and
+with numpy (if installed), and with Frame.get_log_data().
+
+The frames are generated by Opus20FakeServer.synthetic_log_frames().
+"""
+
+import math
+import struct
+from datetime import datetime, timedelta
+
+from _util import argument_parser, best_of
+from opus20 import Frame, Opus20FakeServer
+from opus20 import codec
+
+def row_log_data(frame):
+    """ Frame.get_log_data() before the columnar decoder: a list of dict rows """
+    payload = frame.props.payload
+    is_final, begin, end, interval, num_blocks = struct.unpack('<xx?xxxxiiIH', payload[0:21])
+    ts = datetime.fromtimestamp(begin)
+    interval = timedelta(seconds=interval)
+    offset = 21
+    table = []
+    for i in range(num_blocks):
+        num_entries = payload[offset]
+        offset += 1
+        row = {'ts': ts}
+        ts = ts + interval
+        for j in range(num_entries):
+            channel_value = Frame.read_channel_value(payload, offset)
+            row[channel_value.channel] = channel_value.value
+            offset += 9
+        table.append(row)
+    return table
+
+def log_data_columns(data):
+    columns = {'ts': data.ts}
+    columns.update(data.columns)
+    return columns
+
+def same_values(rows, columns):
+    """ Whether the columns hold the values and timestamps of the rows """
+    if len(rows) != len(columns['ts']): return False
+    for i, row in enumerate(rows):
+        if datetime.fromtimestamp(int(columns['ts'][i])) != row['ts']: return False
+        for channel, value in row.items():
+            if channel == 'ts': continue
+            decoded = float(columns[channel][i])
+            if decoded != value and not (math.isnan(decoded) and math.isnan(value)): return False
+    return True
+
+def main():
+    parser = argument_parser(__doc__, rows=30000)
+    args = parser.parse_args()
+
+    frames = list(Opus20FakeServer.synthetic_log_frames(args.rows, interval=args.interval, seed=0))
+    for frame in frames:
+        frame.validate()
+
+    candidates = [
+      ('rows (former)',   row_log_data),
+      ('columns, struct', lambda frame: frame.get_log_columns(use_numpy=False)),
+    ]
+    if codec.np is not None:
+        candidates.append(('columns, numpy', lambda frame: frame.get_log_columns(use_numpy=True)))
+    candidates.append(('get_log_data',    lambda frame: log_data_columns(frame.get_log_data())))
+
+    for frame in frames:
+        rows = row_log_data(frame)
+        for name, decode in candidates[1:]:
+            if not same_values(rows, decode(frame)):
+                raise SystemExit("{} differs from the former decoder".format(name))
+
+    print("{} rows in {} frames, numpy: {}".format(args.rows, len(frames), codec.np is not None))
+    print("{:18s} {:>11s} {:>12s} {:>9s}".format('decoder', 'time [ms]', 'rows / s', 'speedup'))
+    baseline = None
+    for name, decode in candidates:
+        seconds = best_of(lambda: [decode(frame) for frame in frames], args.repeat)
+        baseline = baseline or seconds
+        print("{:18s} {:11.1f} {:12.0f} {:9.1f}".format(name, seconds * 1000, args.rows / seconds, baseline / seconds))
+
+if __name__ == "__main__": main()
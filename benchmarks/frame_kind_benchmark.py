@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Compare the lookup of Frame.kind with the prebuilt _FRAME_KIND_INDEX
+against the former linear scan over FRAME_KINDS (with the table built
+per lookup, as Frame.kind used to do, and with the module level table).
+
+The frames are one request or answer of every entry of FRAME_KINDS
+and a log data answer of Opus20FakeServer.synthetic_log_frames().
+"""
+
+
+from _util import argument_parser, best_of
+from opus20 import Frame, Opus20FakeServer
+from opus20.opus20 import FRAME_KINDS, Object
+
+def linear_scan(frame, frame_kinds=FRAME_KINDS):
+    """ Frame.kind before the index: the first matching entry """
+    props = frame.props
+    if props.verc != 0x10: return None
+    for knd in frame_kinds:
+        if knd.cmd != props.cmd: continue
+        if knd.payload_length != None and knd.payload_length != len(props.payload):
+            continue
+        if len(knd.payload_check) > len(props.payload): continue
+        payload_matches = True
+        for i in range(len(knd.payload_check)):
+            ref_byte = knd.payload_check[i]
+            check_byte = props.payload[i]
+            if ref_byte != None and ref_byte != check_byte:
+                payload_matches = False
+                break
+        if payload_matches: return knd
+    return None
+
+def linear_scan_rebuilt(frame):
+    """ The linear scan over a table built for every lookup """
+    return linear_scan(frame, [Object(**knd.to_dict()) for knd in FRAME_KINDS])
+
+def index_lookup(frame):
+    return frame.kind
+
+def sample_frames():
+    frames = []
+    for knd in FRAME_KINDS:
+        length = knd.payload_length if knd.payload_length is not None else len(knd.payload_check) + 4
+        payload = bytes(knd.payload_check) + bytes(length - len(knd.payload_check))
+        frames.append(Frame.from_cmd_and_payload(knd.cmd, payload))
+    frames.append(next(Opus20FakeServer.synthetic_log_frames(1500, seed=0)))
+    for frame in frames:
+        frame.validate()
+    return frames
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--lookups', type=int, default=20000, help='Number of lookups per measurement')
+    args = parser.parse_args()
+
+    frames = sample_frames()
+    lookups = [frames[i % len(frames)] for i in range(args.lookups)]
+    log_answers = [frames[-1]] * args.lookups
+
+    candidates = [
+      ('linear scan (per call)', linear_scan_rebuilt),
+      ('linear scan',            linear_scan),
+      ('index',                  index_lookup),
+    ]
+
+    for frame in frames:
+        found = [func(frame) for name, func in candidates]
+        names = [knd.name if knd else None for knd in found]
+        if len(set(names)) != 1:
+            raise SystemExit("The lookups disagree on a frame: {}".format(names))
+
+    print("{} lookups, {} frame kinds".format(args.lookups, len(FRAME_KINDS)))
+    print("{:24s} {:>16s} {:>16s}".format('lookup', 'all [us/frame]', 'log [us/frame]'))
+    for name, func in candidates:
+        mixed = best_of(lambda: [func(frame) for frame in lookups], args.repeat)
+        log = best_of(lambda: [func(frame) for frame in log_answers], args.repeat)
+        print("{:24s} {:16.2f} {:16.2f}".format(name, mixed / args.lookups * 1e6, log / args.lookups * 1e6))
+
+if __name__ == "__main__": main()
@@ -1,9 +1,15 @@
 
-from .opus20 import Opus20, Frame, PickleStore
+from .opus20 import Opus20, Frame, MetadataCache
 from .opus20 import CHANNEL_SPEC as OPUS20_CHANNEL_SPEC
 from .opus20 import Opus20Exception, Opus20ConnectionException
 from .opus20 import Object
 from .opus20 import discover_OPUS20_devices
+from .asyncclient import AsyncOpus20
+from .fleet import FleetPoller
+from .logdata import LogData
+from .stores import LogStore, Rollups, PickleStore, SegmentStore, SqliteStore, ColumnStore, open_log_store
+from .export import iter_export, export_log_data
+from .sync import LogSync
 from .fakeserver import Opus20FakeServer
 
 from .webapp import PlotWebServer
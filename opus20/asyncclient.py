@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+import asyncio
+import struct
+import logging
+
+from .opus20 import Frame, FrameReassembler, hex_formatter
+from .logdata import LogData
+from .opus20 import Opus20Exception, Opus20ConnectionException, FrameValidationException
+
+logger = logging.getLogger(__name__)
+
+class AsyncOpus20(object):
+    """
+    An asyncio version of the Opus20 class.
+
+    It offers the same operations as Opus20 (as coroutines) and uses
+    the same Frame encoding and decoding. Create an instance with
+
+        o20 = await AsyncOpus20.create(host)
+
+    which - like Opus20() - asks the device for its channels and status.
+
+    Every operation accepts an optional timeout (in seconds) overriding
+    the one given at creation. A query that times out or gets cancelled
+    closes the connection as the stream may contain a partial answer.
+    The next query connects again.
+    """
+
+    def __init__(self, host, port=52015, timeout=5.):
+
+        self.reader = None
+        self.writer = None
+        self.frames = FrameReassembler()
+        self.lock = asyncio.Lock()
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.device_id = None
+        self.available_channels = None
+
+    @classmethod
+    async def create(cls, host, port=52015, timeout=5.):
+        o20 = cls(host, port=port, timeout=timeout)
+        try:
+            await o20.request_supported_channels()
+            await o20.request_device_status()
+        except:
+            o20.disconnect()
+            raise
+        return o20
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self, timeout=None):
+        if timeout is None: timeout = self.timeout
+        try:
+            connection = asyncio.open_connection(self.host, self.port)
+            self.reader, self.writer = await asyncio.wait_for(connection, timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise Opus20ConnectionException("Connection to host {} could not be established: {}".format(self.host, e))
+        # leftovers of a previous connection must not end up in new frames
+        self.frames.clear()
+
+    def disconnect(self):
+        """ Closes the connection without waiting for it to be closed """
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except:
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        writer = self.writer
+        self.disconnect()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except:
+                pass
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def query_frame(self, frame, timeout=None, retry=True):
+        assert type(frame) == Frame
+        return await self.query_bytes(frame.data, timeout=timeout, retry=retry)
+
+    async def query_bytes(self, data : bytes, timeout=None, retry=True):
+        """ Sends data and returns the (validated) answer frame. With retry,
+            the request is sent again if the answer was invalid. Requests that
+            change the state of the device (like the one for the next frame of
+            a log download) must not be repeated, see Opus20.query_bytes(). """
+        if timeout is None: timeout = self.timeout
+        async with self.lock:
+            try:
+                return await asyncio.wait_for(self._query_bytes(data, timeout, tries=3 if retry else 1), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # the answer may be half-read, the stream is of no use anymore
+                self.disconnect()
+                raise
+
+    async def _query_bytes(self, data, timeout, tries=3):
+        if not self.connected: await self.connect(timeout)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending the following {} bytes now: {}".format(len(data), hex_formatter(data)))
+        frame = None
+        num_tries = tries
+        while num_tries:
+            self.writer.write(data)
+            await self.writer.drain()
+            answer = await self._read_frame()
+            try:
+                answer.validate()
+                frame = answer
+                break
+            except FrameValidationException as e:
+                logger.warning("The frame couldn't be validated: " + str(e))
+            num_tries -= 1
+            logger.warning("remaining tries: {}".format(num_tries))
+        if frame is None: raise Opus20Exception("Couldn't get a valid answer.")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received the following {} bytes as answer: {}".format(len(frame.data), hex_formatter(frame.data)))
+        return frame
+
+    async def _read_frame(self):
+        while True:
+            frame = self.frames.pop_frame()
+            if frame is not None: return frame
+            missing = self.frames.missing_bytes()
+            data = await self.reader.read(max(missing, FrameReassembler.RECV_SIZE))
+            if not data:
+                self.disconnect()
+                raise Opus20ConnectionException("Connection closed by peer while waiting for {} more bytes".format(missing))
+            self.frames.feed(data)
+
+    async def request_supported_channels(self, timeout=None):
+        frame = Frame.from_cmd_and_payload(0x31, b"\x16")
+        answer = await self.query_frame(frame, timeout=timeout)
+        self.available_channels = answer.available_channels()
+
+    async def request_channel_properties(self, channel: int, timeout=None):
+        query_frame = Frame.from_cmd_and_payload(0x31, b"\x30" + struct.pack('<H', channel))
+        answer_frame = await self.query_frame(query_frame, timeout=timeout)
+        return answer_frame.channel_properties()
+
+    async def request_device_status(self, timeout=None):
+        frame = Frame.from_cmd_and_payload(0x31, b"\x60")
+        answer = await self.query_frame(frame, timeout=timeout)
+        self.device_id = answer.device_id()
+        logger.info("Connected to device with ID: " + self.device_id)
+
+    async def clear_log(self, timeout=None):
+        frame = Frame.from_cmd_and_payload(0x46, b"")
+        answer = await self.query_frame(frame, timeout=timeout)
+        assert answer.props.cmd == 0x46
+        answer.assert_status()
+
+    async def start_logging(self, timeout=None):
+        await self.set_logging_state(True, timeout=timeout)
+
+    async def stop_logging(self, timeout=None):
+        await self.set_logging_state(False, timeout=timeout)
+
+    async def set_logging_state(self, enable_logging=True, timeout=None):
+        enable_logging = b"\x01" if enable_logging else b"\x00"
+        frame = Frame.from_cmd_and_payload(0x45, b"\x43" + enable_logging)
+        answer = await self.query_frame(frame, timeout=timeout)
+        assert answer.props.cmd == 0x45
+        answer.assert_status()
+
+    async def get_logging_state(self, timeout=None):
+        frame = Frame.from_cmd_and_payload(0x44, b"\x43")
+        answer = await self.query_frame(frame, timeout=timeout)
+        return answer.logging_state()
+
+    async def set_channel_logging_state(self, channel, enable_logging=True, timeout=None):
+        payload = b"\x22" + struct.pack('<H?', channel, enable_logging)
+        frame = Frame.from_cmd_and_payload(0x45, payload)
+        answer = await self.query_frame(frame, timeout=timeout)
+        return answer.channel_logging_state_written()
+
+    async def get_channel_logging_state(self, channel, timeout=None):
+        payload = b"\x22" + struct.pack('<H', channel)
+        frame = Frame.from_cmd_and_payload(0x44, payload)
+        answer = await self.query_frame(frame, timeout=timeout)
+        channel_state = answer.channel_logging_state()
+        assert channel_state.channel == channel
+        return channel_state.state
+
+    async def channel_value(self, channel: int, timeout=None):
+        query_frame = Frame.from_cmd_and_payload(0x23, struct.pack('<H', channel))
+        answer_frame = await self.query_frame(query_frame, timeout=timeout)
+        return answer_frame.online_data_request_single()
+
+    async def multi_channel_value(self, channels : list, timeout=None):
+        fmt = '<B' + 'H' * len(channels)
+        query_frame = Frame.from_cmd_and_payload(0x2f, struct.pack(fmt, len(channels), *channels))
+        answer_frame = await self.query_frame(query_frame, timeout=timeout)
+        return answer_frame.online_data_request_multiple()
+
+    async def download_logs(self, start_datetime=None, timeout=None):
+        data = LogData()
+        async for batch in self.iter_log_batches(start_datetime=start_datetime, timeout=timeout):
+            data.extend(batch)
+        return data
+
+    async def iter_log_batches(self, start_datetime=None, timeout=None):
+        """ Yields the rows (as LogData) of each answer frame of the log download.
+            The timeout applies to each frame, not to the whole download. """
+        async for data_answer_frame in self.iter_log_frames(start_datetime=start_datetime, timeout=timeout):
+            yield data_answer_frame.decode()
+
+    async def iter_log_columns(self, start_datetime=None, use_numpy=None, timeout=None):
+        async for data_answer_frame in self.iter_log_frames(start_datetime=start_datetime, timeout=timeout):
+            yield data_answer_frame.get_log_columns(use_numpy=use_numpy)
+
+    async def iter_log_frames(self, start_datetime=None, timeout=None):
+        if start_datetime:
+            # see Opus20.iter_log_frames() for the additional second
+            ts = int(start_datetime.timestamp()) + 1
+        else:
+            ts = 0
+        init_frame = Frame.from_cmd_and_payload(0x24, b'\x10' + struct.pack('<i', ts) + b'\x00\x00\x00\x00\x00')
+        init_answer_frame = await self.query_frame(init_frame, timeout=timeout)
+        num_answer_frames = init_answer_frame.num_log_frames()
+        data_request_frame = Frame.from_cmd_and_payload(0x24, b'\x20\x01')
+        for i in range(num_answer_frames):
+            # (each request makes the device move on to the next frame: never repeated)
+            yield await self.query_frame(data_request_frame, timeout=timeout, retry=False)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+A compressed encoding for log data (timestamps + float32 channels).
+
+The series of an OPUS20 are logged at a regular interval and vary
+slowly, so the encoding borrows the transforms of Facebook's Gorilla:
+
+  * timestamps are stored as delta-of-delta (zero for a regular interval)
+  * the bits of each float32 value are XORed with the previous value
+    (few bits differ between neighbouring values)
+
+Instead of Gorilla's bit-level variable length codes (which are slow to
+produce and read in pure Python), the transformed words are split into
+byte planes (all most significant bytes first, ...) and deflated with
+zlib: runs of zero bytes compress about as well and both steps run in C.
+
+A stream consists of a header and independent blocks of up to
+BLOCK_ROWS rows each, so it can be decoded block by block:
+
+    header: MAGIC (4 bytes), version (1 byte)
+    block:  num_rows (u32), num_channels (u16), compressed size (u32),
+            the channel numbers (u16 each), zlib(planes of ts + channels)
+"""
+
+import struct
+import zlib
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'O20C'
+VERSION = 1
+BLOCK_ROWS = 4096
+HEADER = struct.Struct('<4sB')
+BLOCK_HEADER = struct.Struct('<IHI')
+
+class CodecException(NameError):
+    pass
+
+def encode(ts, columns, block_rows=BLOCK_ROWS, level=6, header=True):
+    """ Encodes the timestamps ts (array('q')) and the columns
+        {channel: array('f')} of the same length. Returns bytes.
+        Without the header, the blocks can be appended to a stream. """
+    chunks = [HEADER.pack(MAGIC, VERSION)] if header else []
+    channels = list(columns)
+    for start in range(0, len(ts), block_rows):
+        stop = min(start + block_rows, len(ts))
+        planes = [_byte_planes(_delta_of_delta(ts[start:stop]), 8)]
+        planes += [_byte_planes(_xor_previous(columns[channel][start:stop]), 4) for channel in channels]
+        payload = zlib.compress(b''.join(planes), level)
+        chunks.append(BLOCK_HEADER.pack(stop - start, len(channels), len(payload)))
+        chunks.append(struct.pack('<{}H'.format(len(channels)), *channels))
+        chunks.append(payload)
+    return b''.join(chunks)
+
+def iter_decode(stream):
+    """ Decodes an encoded stream (bytes or a binary file object) block
+        by block, yielding (ts, columns) as array('q') / {channel: array('f')} """
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        data, offset = memoryview(stream), 0
+        def read(size):
+            nonlocal offset
+            chunk = bytes(data[offset:offset+size])
+            offset += len(chunk)
+            return chunk
+    else:
+        read = stream.read
+    magic, version = HEADER.unpack(_read_exactly(read, HEADER.size))
+    if magic != MAGIC: raise CodecException("Not an encoded log data stream.")
+    if version != VERSION: raise CodecException("Unsupported encoding version: {}".format(version))
+    while True:
+        head = read(BLOCK_HEADER.size)
+        if not head: return
+        if len(head) < BLOCK_HEADER.size: raise CodecException("Truncated block header.")
+        num_rows, num_channels, size = BLOCK_HEADER.unpack(head)
+        channels = struct.unpack('<{}H'.format(num_channels), _read_exactly(read, 2 * num_channels))
+        planes = zlib.decompress(_read_exactly(read, size))
+        if len(planes) != num_rows * (8 + 4 * num_channels): raise CodecException("Corrupt block.")
+        ts = _undo_delta_of_delta(_join_byte_planes(planes[:8*num_rows], 8, 'q'))
+        columns = {}
+        for i, channel in enumerate(channels):
+            start = num_rows * (8 + 4 * i)
+            columns[channel] = _undo_xor_previous(_join_byte_planes(planes[start:start+4*num_rows], 4, 'I'))
+        yield ts, columns
+
+def decode(stream):
+    """ Decodes a whole stream into (ts, columns) """
+    ts, columns = array('q'), {}
+    for block_ts, block_columns in iter_decode(stream):
+        for channel in block_columns:
+            if channel not in columns: columns[channel] = array('f', [float('nan')]) * len(ts)
+        for channel, values in columns.items():
+            values.extend(block_columns.get(channel, array('f', [float('nan')]) * len(block_ts)))
+        ts.extend(block_ts)
+    return ts, columns
+
+def _read_exactly(read, size):
+    chunk = read(size)
+    if len(chunk) != size: raise CodecException("Unexpected end of the stream.")
+    return chunk
+
+def _delta_of_delta(ts):
+    if np is not None:
+        values = np.frombuffer(ts, dtype=np.int64)
+        return np.diff(values, n=2, prepend=[0, 0]).astype('<i8').tobytes() if len(values) else b''
+    result = array('q')
+    prev, prev_delta = 0, 0
+    for value in ts:
+        delta = value - prev
+        result.append(delta - prev_delta)
+        prev, prev_delta = value, delta
+    return result.tobytes()
+
+def _undo_delta_of_delta(words):
+    if np is not None:
+        values = np.cumsum(np.cumsum(np.frombuffer(words, dtype=np.int64)))
+        return array('q', values.astype(np.int64).tobytes())
+    result = array('q')
+    value, delta = 0, 0
+    for dod in words:
+        delta += dod
+        value += delta
+        result.append(value)
+    return result
+
+def _xor_previous(values):
+    if np is not None:
+        words = np.frombuffer(values, dtype=np.uint32)
+        result = words.copy()
+        result[1:] ^= words[:-1]
+        return result.tobytes()
+    words = array('I', values.tobytes())
+    return (words[:1] + array('I', (a ^ b for a, b in zip(words[1:], words)))).tobytes()
+
+def _undo_xor_previous(words):
+    if np is not None:
+        values = np.bitwise_xor.accumulate(np.frombuffer(words, dtype=np.uint32))
+        return array('f', values.tobytes())
+    result = array('I')
+    value = 0
+    for word in words:
+        value ^= word
+        result.append(value)
+    return array('f', result.tobytes())
+
+def _byte_planes(data, width):
+    """ The bytes of the width-byte little endian words in data, grouped
+        by significance (most significant byte of all words first) """
+    return b''.join(data[i::width] for i in reversed(range(width)))
+
+def _join_byte_planes(planes, width, typecode):
+    """ Reverses _byte_planes(), returns an array of typecode """
+    count = len(planes) // width
+    words = bytearray(len(planes))
+    for i in range(width):
+        plane = width - 1 - i
+        words[i::width] = planes[plane*count:(plane+1)*count]
+    return array(typecode, bytes(words))
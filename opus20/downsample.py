@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+Downsampling of time series for plotting (requires numpy).
+
+  lttb()    Largest-Triangle-Three-Buckets: keeps the points that shape
+            the line (one per bucket, the one spanning the largest
+            triangle with its neighbours)
+  minmax()  keeps the smallest and the largest value of each bucket
+            (no spike gets lost)
+
+Both return indices into the input, downsample() applies them to a
+series. Only the loop over the buckets of lttb() runs in Python, the
+work within a bucket is done by numpy.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def lttb(x, y, n_out):
+    """ The indices of the n_out points of (x, y) selected by LTTB
+        (x sorted, no NaN) """
+    n = len(x)
+    if n_out >= n: return np.arange(n)
+    if n_out < 3: return np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # the first and the last point are kept, the others are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    # the third point of each triangle: the average of the next bucket
+    next_x = np.append((np.add.reduceat(x[:n-1], edges[:-1]) / sizes)[1:], x[-1])
+    next_y = np.append((np.add.reduceat(y[:n-1], edges[:-1]) / sizes)[1:], y[-1])
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i+1]
+        # (twice) the areas of the triangles a, candidate, next bucket
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i+1] = a
+    return selected
+
+def minmax(y, n_out, y_max=None):
+    """ The indices of the minimum of y and the maximum of y_max (default:
+        y) in each of n_out / 2 buckets as (min_indices, max_indices) """
+    y_max = y if y_max is None else y_max
+    n = len(y)
+    if n <= n_out: return np.arange(n), np.arange(n)
+    buckets = max(n_out // 2, 1)
+    bucket = np.arange(n) * buckets // n
+    first = np.flatnonzero(np.diff(bucket)) + 1
+    first = np.insert(first, 0, 0)
+    last = np.append(first[1:], n) - 1
+    # sorted by bucket, then by value: the first / last index of a bucket
+    mins = np.lexsort((y, bucket))[first]
+    maxs = np.lexsort((y_max, bucket))[last]
+    return mins, maxs
+
+METHODS = ('lttb', 'minmax')
+
+def downsample(ts, values, points, method='lttb', max_values=None):
+    """ (ts, values) of a series (numpy arrays, NaN = missing value)
+        downsampled to about points points with one of METHODS. minmax
+        takes the maxima from max_values if given (like the max of rollup
+        buckets whose min are the values). """
+    if method not in METHODS: raise ValueError("Unknown downsampling method: {}".format(method))
+    valid = ~np.isnan(values)
+    ts, values = ts[valid], values[valid]
+    if method == 'lttb':
+        index = lttb(ts, values, points)
+        return ts[index], values[index]
+    max_values = values if max_values is None else max_values[valid]
+    mins, maxs = minmax(values, points, max_values)
+    ts = np.concatenate((ts[mins], ts[maxs]))
+    values = np.concatenate((values[mins], max_values[maxs]))
+    # in time order (the minimum first for the same ts), without duplicates
+    order = np.argsort(ts, kind='stable')
+    ts, values = ts[order], values[order]
+    keep = np.ones(len(ts), dtype=bool)
+    keep[1:] = (ts[1:] != ts[:-1]) | (values[1:] != values[:-1])
+    return ts[keep], values[keep]
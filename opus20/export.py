@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""
+Streaming export of the log data in a LogStore.
+
+The rows are read with LogStore.iter_range() one batch at a time and
+each batch is encoded and written before the next one is read, so the
+memory used doesn't depend on the size of the exported range.
+
+Formats:
+
+  csv       a header line and one line per row (missing values are empty)
+  ndjson    one JSON object per row (missing values are null)
+  columnar  the compressed binary encoding of the codec module, one block
+            per batch (read it with LogData.decode() / LogData.iter_decode())
+
+The rows of csv and ndjson carry the UNIX timestamp 'ts', the local time
+'time' (ISO 8601 with UTC offset) and the values of the channels labeled
+with their name and unit from CHANNEL_SPEC, e.g. 'AVG temperature [°C]'.
+"""
+
+import io
+import csv
+import json
+from datetime import datetime
+
+from .opus20 import CHANNEL_SPEC, Opus20Exception
+from .stores import LogStore
+from . import codec
+
+FORMATS = ('csv', 'ndjson', 'columnar')
+
+def channel_label(channel):
+    """ The label of a channel in the exported rows """
+    if channel in CHANNEL_SPEC:
+        return "{name} [{unit}]".format(**CHANNEL_SPEC[channel])
+    return "channel {}".format(channel)
+
+def iter_export(store, device_id, fmt='csv', start=None, end=None, channels=None, batch_rows=LogStore.BATCH_ROWS):
+    """ Yields the rows of device_id with start <= ts <= end (datetimes,
+        None = unbounded), reduced to channels, encoded in fmt as chunks
+        of bytes (one per batch). Raises a ValueError if some of the
+        channels aren't stored for device_id. """
+    if fmt not in FORMATS: raise Opus20Exception("Unknown export format: {}".format(fmt))
+    if channels is not None:
+        stored = store.get_channels(device_id)
+        unknown = [channel for channel in channels if channel not in stored]
+        if unknown:
+            raise ValueError("No data for channel(s) {} of device {} (stored: {})".format(
+                ', '.join(str(channel) for channel in unknown), device_id, ', '.join(str(channel) for channel in stored) or 'none'))
+    encode = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks, 'columnar': _columnar_chunks}[fmt]
+    return encode(store.iter_range(device_id, start, end, channels, batch_rows=batch_rows), channels)
+
+def export_log_data(store, device_id, fp, fmt='csv', start=None, end=None, channels=None, batch_rows=LogStore.BATCH_ROWS):
+    """ Writes iter_export() to the binary file object fp
+        (like sys.stdout.buffer). Returns the number of bytes written. """
+    size = 0
+    for chunk in iter_export(store, device_id, fmt, start, end, channels, batch_rows):
+        fp.write(chunk)
+        size += len(chunk)
+    fp.flush()
+    return size
+
+def _rows(batch, channels):
+    """ (ts, local time, values...) of the rows in batch, None for missing values """
+    columns = [batch.columns.get(channel, ()) for channel in channels]
+    for i, ts in enumerate(batch.ts):
+        values = (float('{:.7g}'.format(column[i])) if i < len(column) and column[i] == column[i] else None
+                  for column in columns)
+        yield (ts, datetime.fromtimestamp(ts).astimezone().isoformat()) + tuple(values)
+
+def _csv_chunks(batches, channels):
+    writer, buffer = None, io.StringIO()
+    for batch in batches:
+        if writer is None:
+            # the first batch decides the columns if none were selected
+            channels = batch.channels if channels is None else list(channels)
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(['ts', 'time'] + [channel_label(channel) for channel in channels])
+        writer.writerows(('' if value is None else value for value in row) for row in _rows(batch, channels))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def _ndjson_chunks(batches, channels):
+    for batch in batches:
+        selected = batch.channels if channels is None else channels
+        keys = ['ts', 'time'] + [channel_label(channel) for channel in selected]
+        lines = [json.dumps(dict(zip(keys, row)), ensure_ascii=False) + '\n' for row in _rows(batch, selected)]
+        yield ''.join(lines).encode('utf-8')
+
+def _columnar_chunks(batches, channels):
+    header = True
+    for batch in batches:
+        yield codec.encode(batch.ts, batch.columns, header=header)
+        header = False
+    if header:
+        # an empty range: the header alone is a valid (empty) stream
+        yield codec.encode([], {})
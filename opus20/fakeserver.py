@@ -1,9 +1,11 @@
 
 
 from datetime import datetime, timedelta
+import random
 import socket
+import struct
 
-from .opus20 import Frame
+from .opus20 import Frame, FrameReassembler, Opus20ConnectionException
 
 class Opus20FakeServer(object):
     """
@@ -24,10 +26,12 @@ class Opus20FakeServer(object):
             while True:
                 conn, addr = self.s.accept()
                 print('Connected by', addr)
+                reader = FrameReassembler()
                 while True:
-                    data = conn.recv(1024)
-                    if not data: break
-                    input_frame = Frame(data)
+                    try:
+                        input_frame = reader.read_frame(conn)
+                    except Opus20ConnectionException:
+                        break
                     output_frame = self.react_to_input_frame(input_frame)
                     conn.sendall(output_frame.data)
                 conn.close()
@@ -53,6 +57,25 @@ class Opus20FakeServer(object):
             output_frame = Frame.from_cmd_and_payload(in_props.cmd, b"\x10")
         return output_frame
 
+    @staticmethod
+    def synthetic_log_frames(num_rows, begin=1440000000, interval=60,
+                             channels=(160, 260, 265, 170), rows_per_frame=1500, seed=None):
+        """ Generate log data answer frames (cmd 0x24) of num_rows regularly
+            spaced rows with slowly varying (random walk) values, as the
+            device sends them when downloading the log. """
+        rnd = random.Random(seed)
+        values = {channel: rnd.uniform(10., 50.) for channel in channels}
+        for start in range(0, num_rows, rows_per_frame):
+            n = min(rows_per_frame, num_rows - start)
+            first = begin + start * interval
+            payload = [bytes([0x00, 0x20]), struct.pack('<?xxxxiiIH', start + n >= num_rows, first, first + (n - 1) * interval, interval, n)]
+            for i in range(n):
+                payload.append(bytes([len(channels)]))
+                for channel in channels:
+                    values[channel] += rnd.gauss(0., 0.05)
+                    payload.append(struct.pack('<BBHBf', 8, 0, channel, 0x16, round(values[channel], 2)))
+            yield Frame.from_cmd_and_payload(0x24, b''.join(payload))
+
     def feed_with_communication_log(self, l2p_frames_file):
         """ Feed the fake server with l2p frames stored in a communication log file """
         num_incoming, num_outgoing = 0, 0
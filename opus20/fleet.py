@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from .opus20 import Object, discover_OPUS20_devices
+from .asyncclient import AsyncOpus20
+
+clock = time.perf_counter
+logger = logging.getLogger(__name__)
+
+class FleetPoller(object):
+    """
+    Reads the current values of many OPUS20 devices concurrently.
+
+    All devices are queried from a single asyncio event loop with at most
+    max_concurrency queries in flight. Each device has its own deadline:
+    a device that doesn't answer in time (or fails otherwise) shows up
+    with an error in the snapshot but doesn't hold up the others.
+
+    Hosts are given as 'hostname' or 'hostname:port'.
+    """
+
+    DEFAULT_CHANNELS = (0x0064, 0x006E, 0x00C8, 0x00CD, 0x2724)
+
+    def __init__(self, hosts, channels=DEFAULT_CHANNELS, timeout=5., deadline=None, max_concurrency=64):
+        self.hosts = list(hosts)
+        self.channels = list(channels)
+        self.timeout = timeout
+        self.deadline = deadline if deadline is not None else timeout
+        self.max_concurrency = max_concurrency
+        self._devices = {}
+
+    @classmethod
+    def from_device_ids(cls, device_ids, bind_addr="", **kwargs):
+        """ Finds the devices with the given IDs via network discovery """
+        found = {}
+        def callback(answer):
+            frm, addr, answer_time = answer
+            found[frm.decode()['device_id']] = addr[0]
+        discover_OPUS20_devices(callback, bind_addr=bind_addr)
+        missing = [device_id for device_id in device_ids if device_id not in found]
+        if missing: logger.warning("Could not discover the following devices: " + ", ".join(missing))
+        return cls([found[device_id] for device_id in device_ids if device_id in found], **kwargs)
+
+    @staticmethod
+    def _split_host(host):
+        hostname, _, port = host.rpartition(':')
+        if hostname and port.isdigit(): return hostname, int(port)
+        return host, 52015
+
+    async def _read_device(self, host):
+        device = self._devices.get(host)
+        if device is None:
+            hostname, port = self._split_host(host)
+            device = await AsyncOpus20.create(hostname, port=port, timeout=self.timeout)
+            self._devices[host] = device
+        return device, await device.multi_channel_value(self.channels)
+
+    async def _poll_host(self, host, semaphore):
+        result = Object(host=host, device_id=None, values=None, error=None, latency=None)
+        async with semaphore:
+            start = clock()
+            try:
+                device, values = await asyncio.wait_for(self._read_device(host), self.deadline)
+                result.device_id = device.device_id
+                result.values = dict(zip(self.channels, values))
+            except Exception as e:
+                result.error = "{}: {}".format(type(e).__name__, e) if str(e) else type(e).__name__
+                logger.warning("Polling {} failed: {}".format(host, result.error))
+                # start over with a fresh connection next round
+                device = self._devices.pop(host, None)
+                if device is not None: device.disconnect()
+            result.latency = clock() - start
+        return result
+
+    async def poll_async(self):
+        """ Polls all devices once and returns a snapshot:
+            Object(ts=..., duration=..., devices={host: Object(host=..., device_id=...,
+                   values={channel: value}, error=..., latency=...)}) """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        ts = datetime.now().replace(microsecond=0)
+        start = clock()
+        results = await asyncio.gather(*[self._poll_host(host, semaphore) for host in self.hosts])
+        return Object(ts=ts, duration=clock()-start, devices={result.host: result for result in results})
+
+    async def run_async(self, callback, interval=10., rounds=None):
+        """ Polls all devices every interval seconds, keeping the connections
+            open in between, and calls callback(snapshot) after each round. """
+        try:
+            while rounds is None or rounds > 0:
+                started = clock()
+                callback(await self.poll_async())
+                if rounds is not None:
+                    rounds -= 1
+                    if not rounds: break
+                await asyncio.sleep(max(interval - (clock() - started), 0))
+        finally:
+            await self.close()
+
+    async def close(self):
+        devices, self._devices = self._devices, {}
+        await asyncio.gather(*[device.close() for device in devices.values()])
+
+    def poll(self):
+        """ Polls all devices once (blocking) """
+        async def poll_and_close():
+            try:
+                return await self.poll_async()
+            finally:
+                await self.close()
+        return asyncio.run(poll_and_close())
+
+    def run(self, callback, interval=10., rounds=None):
+        """ Blocking version of run_async() """
+        asyncio.run(self.run_async(callback, interval=interval, rounds=rounds))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""
+LogData, the container of the log data of a device: the decoded log
+frames, the batches of a download and the rows read from a store.
+"""
+
+import bisect
+from array import array
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import codec
+
+NAN = float('nan')
+
+class LogData(object):
+    """
+    A compact container for log data: the timestamps are kept in an
+    array('q') (UNIX time in seconds) and the values of each channel in
+    an array('f') (NaN = no value), about 24 bytes per row with four
+    channels instead of several hundred for a dict.
+
+    It acts as a sequence of rows in the dict form used throughout this
+    package ({'ts': datetime, channel: value, ...}): indexing and
+    iterating yield such dicts, slicing yields a LogData.
+    """
+
+    __slots__ = ('ts', 'columns')
+
+    def __init__(self, ts=None, columns=None):
+        self.ts = array('q') if ts is None else ts
+        self.columns = {} if columns is None else columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ A LogData from dict rows (or rows itself if it is one) """
+        if isinstance(rows, LogData): return rows
+        data = cls()
+        data.extend(rows)
+        return data
+
+    @classmethod
+    def from_columns(cls, columns):
+        """ A LogData from {'ts': ..., channel: ...} as returned by
+            Frame.get_log_columns() (array.array or numpy arrays) """
+        ts = _as_array('q', columns['ts'])
+        return cls(ts, {channel: _as_array('f', values) for channel, values in columns.items() if channel != 'ts'})
+
+    @property
+    def channels(self):
+        return list(self.columns)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LogData(self.ts[index], {channel: values[index] for channel, values in self.columns.items()})
+        entry = {'ts': datetime.fromtimestamp(self.ts[index])}
+        for channel, values in self.columns.items():
+            value = values[index]
+            # NaN != NaN
+            if value == value: entry[channel] = value
+        return entry
+
+    def __iter__(self):
+        columns = list(self.columns.items())
+        for i, ts in enumerate(self.ts):
+            entry = {'ts': datetime.fromtimestamp(ts)}
+            for channel, values in columns:
+                value = values[i]
+                if value == value: entry[channel] = value
+            yield entry
+
+    def __repr__(self):
+        return "LogData({} rows, channels: {})".format(len(self), self.channels)
+
+    def __getstate__(self):
+        # pickled in the compressed encoding of the codec module
+        return self.encode()
+
+    def __setstate__(self, state):
+        if isinstance(state, bytes):
+            self.ts, self.columns = codec.decode(state)
+            return
+        # the raw arrays pickled by earlier versions
+        ts, columns = state
+        self.ts = array('q')
+        self.ts.frombytes(ts)
+        self.columns = {}
+        for channel, values in columns.items():
+            self.columns[channel] = array('f')
+            self.columns[channel].frombytes(values)
+
+    def encode(self, block_rows=codec.BLOCK_ROWS):
+        """ The rows compressed with codec.encode() """
+        return codec.encode(self.ts, self.columns, block_rows=block_rows)
+
+    @classmethod
+    def decode(cls, stream):
+        """ A LogData from the output of encode() (bytes or a binary file) """
+        return cls(*codec.decode(stream))
+
+    @classmethod
+    def iter_decode(cls, stream):
+        """ Like decode() but yields a LogData per encoded block """
+        for ts, columns in codec.iter_decode(stream):
+            yield cls(ts, columns)
+
+    def select(self, channels):
+        """ A copy reduced to the given channels """
+        return LogData(array('q', self.ts), {channel: array('f', self.columns[channel]) for channel in channels if channel in self.columns})
+
+    def bisect(self, ts, right=False):
+        """ The index to insert the datetime ts at, left or right of the
+            rows with an equal timestamp (the rows have to be sorted) """
+        ts = int(ts.timestamp())
+        return bisect.bisect_right(self.ts, ts) if right else bisect.bisect_left(self.ts, ts)
+
+    def append(self, entry):
+        self.extend((entry,))
+
+    def extend(self, rows):
+        """ Appends the rows (dicts or a LogData) as they are """
+        num_rows = len(self.ts)
+        if isinstance(rows, LogData):
+            for channel in rows.columns:
+                if channel not in self.columns: self.columns[channel] = array('f', [NAN]) * num_rows
+            self.ts.extend(rows.ts)
+            for channel, values in self.columns.items():
+                if channel in rows.columns: values.extend(rows.columns[channel])
+                else: values.extend(array('f', [NAN]) * len(rows.ts))
+            return
+        for entry in rows:
+            self.ts.append(int(entry['ts'].timestamp()))
+            for channel in entry:
+                if channel != 'ts' and channel not in self.columns:
+                    self.columns[channel] = array('f', [NAN]) * num_rows
+            for channel, values in self.columns.items():
+                values.append(entry.get(channel, NAN))
+            num_rows += 1
+
+    def merge(self, rows):
+        """ Merges rows (dicts or a LogData) into this sorted LogData, a
+            row with a timestamp that is already there is merged into the
+            old one (its values win). Returns the number of rows added. """
+        new = LogData.from_rows(rows)
+        if not len(new): return 0
+        increasing = all(a < b for a, b in zip(new.ts, new.ts[1:]))
+        if increasing and (not len(self.ts) or new.ts[0] > self.ts[-1]):
+            # the usual case: the new rows are strictly newer
+            self.extend(new)
+            return len(new)
+        num_rows = len(self.ts)
+        start = bisect.bisect_left(self.ts, min(new.ts))
+        tail = self[start:]
+        del self.ts[start:]
+        for values in self.columns.values(): del values[start:]
+        # merged on the UNIX timestamps, not on the naive datetimes of the
+        # dict rows: those repeat in the hour the clocks are set back
+        order = range(len(new)) if increasing else sorted(range(len(new)), key=new.ts.__getitem__)
+        channels = list(tail.columns) + [channel for channel in new.columns if channel not in tail.columns]
+        merged = LogData(array('q'), {channel: array('f') for channel in channels})
+        i = j = 0
+        while i < len(tail) or j < len(order):
+            if j == len(order) or (i < len(tail) and tail.ts[i] <= new.ts[order[j]]):
+                source, index = tail, i; i += 1
+            else:
+                source, index = new, order[j]; j += 1
+            if not len(merged.ts) or merged.ts[-1] != source.ts[index]:
+                merged.ts.append(source.ts[index])
+                for values in merged.columns.values(): values.append(NAN)
+            for channel, values in source.columns.items():
+                value = values[index]
+                if value == value: merged.columns[channel][-1] = value
+        self.extend(merged)
+        return len(self.ts) - num_rows
+
+    def to_frame(self):
+        """ A pandas DataFrame indexed by ts with one column per channel """
+        import pandas as pd
+        # copies: the arrays can't grow while numpy holds on to their buffers
+        columns = {channel: np.array(values, dtype=np.float32) for channel, values in self.columns.items()}
+        return pd.DataFrame(columns, index=local_datetime_index(np.array(self.ts, dtype=np.int64)))
+
+def _as_array(typecode, values):
+    if isinstance(values, array) and values.typecode == typecode: return values
+    result = array(typecode)
+    if np is not None and isinstance(values, np.ndarray):
+        result.frombytes(np.ascontiguousarray(values, dtype=np.int64 if typecode == 'q' else np.float32).tobytes())
+    else:
+        result.extend(values)
+    return result
+
+def local_datetime_index(ts):
+    """ A pandas DatetimeIndex named 'ts' with the naive local times of
+        the UNIX timestamps ts (like the datetimes of the dict rows) """
+    import pandas as pd
+    from dateutil.tz import tzlocal
+    index = pd.to_datetime(ts, unit='s', utc=True).tz_convert(tzlocal()).tz_localize(None)
+    return index.rename('ts')
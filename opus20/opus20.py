@@ -1,37 +1,110 @@
 #!/usr/bin/env python
 
 import socket
-import select
 import pdb
 import struct
 import time
 import logging
 from datetime import datetime, timedelta
 import pickle
+import os
 import threading
 import ipaddress
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .logdata import LogData
 
 clock = time.perf_counter
 logger = logging.getLogger(__name__)
 
 class Opus20(object):
 
-    def __init__(self, host, port=52015, timeout=5.):
+    MAX_RECONNECT_BACKOFF = 30.
+    # requests in flight for the bulk metadata queries (unless pipeline_depth is given)
+    METADATA_PIPELINE_DEPTH = 8
+
+    def __init__(self, host, port=52015, timeout=5., keepalive=None, reconnect_tries=3, reconnect_backoff=0.5, metadata_cache=None, pipeline_depth=None):
+        """ keepalive: idle time in seconds after which TCP keepalive probes
+                       are sent on the connection (None = OS default / off)
+            reconnect_tries: connection attempts before giving up
+            reconnect_backoff: delay before the second attempt, doubled for
+                               each further attempt
+            metadata_cache: a MetadataCache. If it holds fresh metadata for
+                            host:port, no query is sent to the device here.
+            pipeline_depth: max. number of requests query_frames() sends
+                            before reading the answers (1 = no pipelining,
+                            None = METADATA_PIPELINE_DEPTH for the channel
+                            metadata of describe_channels(), 1 otherwise) """
 
         self.s = None
+        self.reader = FrameReassembler()
 
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.keepalive = keepalive
+        self.reconnect_tries = reconnect_tries
+        self.reconnect_backoff = reconnect_backoff
+        self.stats = Object(connects=0, reconnects=0, queries=0, failed_queries=0,
+                            last_rtt=None, max_rtt=0., total_rtt=0.)
+
+        self.pipeline_depth = pipeline_depth
+        # memoized channel metadata, see describe_channels()
+        self._channel_properties = {}
+        self._channel_logging_states = {}
+
+        self.metadata_cache = metadata_cache
+        metadata = metadata_cache.get(host, port) if metadata_cache else None
+        if metadata:
+            self.available_channels = metadata['available_channels']
+            self.device_id = metadata['device_id']
+            logger.info("Using cached metadata of device with ID: " + self.device_id)
+        else:
+            self.refresh_metadata()
 
+    def refresh_metadata(self):
+        """ Asks the device for its channels and ID (and updates the cache) """
         self.request_supported_channels()
         self.request_device_status()
+        if self.metadata_cache:
+            self.metadata_cache.put(self.host, self.port, device_id=self.device_id, available_channels=self.available_channels)
 
     def connect(self):
         try:
             self.s = socket.create_connection((self.host, self.port), self.timeout)
-        except (ConnectionRefusedError, socket.gaierror) as e:
+        except OSError as e:
             raise Opus20ConnectionException("Connection to host {} could not be established: {}".format(self.host, e))
+        if self.keepalive: self._enable_keepalive(self.keepalive)
+        # leftovers of a previous connection must not end up in new frames
+        self.reader.clear()
+        if self.stats.connects: self.stats.reconnects += 1
+        self.stats.connects += 1
+
+    def _enable_keepalive(self, idle):
+        self.s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # the finer settings are not available on every platform
+        for option, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', max(int(idle) // 3, 1)), ('TCP_KEEPCNT', 3)):
+            if hasattr(socket, option):
+                self.s.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), max(int(value), 1))
+
+    def connect_with_backoff(self):
+        """ Calls connect() up to reconnect_tries times with an
+            exponentially growing delay between the attempts. """
+        delay = self.reconnect_backoff
+        for attempt in range(1, max(self.reconnect_tries, 1) + 1):
+            try:
+                self.connect()
+                return
+            except Opus20ConnectionException as e:
+                if attempt >= self.reconnect_tries: raise
+                logger.warning("{} Trying again in {:.2f} s.".format(e, delay))
+                time.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_BACKOFF)
 
     def disconnect(self):
         try:
@@ -47,58 +120,193 @@ class Opus20(object):
 
     @property
     def connected(self):
+        """ Checks (without blocking) if the connection is still usable.
+            A socket closed by the device is readable and returns b'' """
         if not self.s: return False
         try:
-            ready_to_read, ready_to_write, in_error = \
-                select.select([self.s,], [self.s,], [], 5)
-        except select.error:
+            self.s.setblocking(False)
+            try:
+                alive = self.s.recv(1, socket.MSG_PEEK) != b''
+            finally:
+                self.s.settimeout(self.timeout)
+        except (BlockingIOError, InterruptedError):
+            # nothing to read: the connection is idle but alive
+            return True
+        except OSError:
+            alive = False
+        if not alive:
+            logger.info("The connection to {} was closed by the device.".format(self.host))
             self.disconnect()
-            return False
-        return True
+        return alive
 
-    def query_frame(self, frame):
+    def query_frame(self, frame, retry=True):
         assert type(frame) == Frame
-        return self.query_bytes(frame.data)
+        return self.query_bytes(frame.data, retry=retry)
+
+    def query_bytes(self, data : bytes, retry=True):
+        """ Sends data and returns the (validated) answer frame. With retry,
+            the request is sent again if the answer was invalid or on a new
+            connection if the connection broke. Requests that change the state
+            of the device (like the one for the next frame of a log download)
+            must not be repeated: the device may have answered them already. """
+        start = clock()
+        self.stats.queries += 1
+        try:
+            if not self.connected: self.connect_with_backoff()
+            try:
+                frame = self._query_bytes(data, tries=3 if retry else 1)
+            except socket.timeout:
+                # a late answer would end up as the answer to the next query
+                self.disconnect()
+                raise
+            except (Opus20ConnectionException, ConnectionError) as e:
+                # The connection broke while we were talking to the device
+                # (the liveness check can't notice all of those in advance).
+                if not retry:
+                    self.disconnect()
+                    raise
+                logger.warning("Lost the connection to {} ({}), reconnecting.".format(self.host, e))
+                self.disconnect()
+                self.connect_with_backoff()
+                frame = self._query_bytes(data)
+        except:
+            self.stats.failed_queries += 1
+            raise
+        rtt = clock() - start
+        self.stats.last_rtt = rtt
+        self.stats.total_rtt += rtt
+        self.stats.max_rtt = max(self.stats.max_rtt, rtt)
+        return frame
 
-    def query_bytes(self, data : bytes):
-        if not self.connected: self.connect()
-        logger.debug("Sending the following {} bytes now: {}".format(len(data), hex_formatter(data)))
+    def _query_bytes(self, data : bytes, tries=3):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending the following {} bytes now: {}".format(len(data), hex_formatter(data)))
         frame = None
-        num_tries = 3
+        num_tries = tries
         while num_tries:
+            self.s.sendall(data)
+            # A reply split across TCP segments is reassembled by the reader,
+            # we only ask again if we received a complete but invalid frame.
+            answer = self.reader.read_frame(self.s)
             try:
-                self.s.sendall(data)
-                answer = self.s.recv(1024)
-                frame = Frame(answer)
-                frame.validate()
-                break
-            except IncompleteDataException:
-                answer += self.s.recv(1024)
-                frame = Frame(answer)
-                frame.validate()
+                answer.validate()
+                frame = answer
                 break
             except FrameValidationException as e:
                 logger.warning("The frame couldn't be validated: " + str(e))
             num_tries -= 1
             logger.warning("remaining tries: {}".format(num_tries))
-        if not frame.props: raise NameError("Couldn't get a valid answer.")
-        logger.debug("Received the following {} bytes as answer: {}".format(len(frame.data), hex_formatter(frame.data)))
+        if frame is None: raise Opus20Exception("Couldn't get a valid answer.")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received the following {} bytes as answer: {}".format(len(frame.data), hex_formatter(frame.data)))
         return frame
 
+    def query_frames(self, frames, depth=None):
+        """ Sends the frames and returns the answers in the same order.
+            Up to depth (default: pipeline_depth) requests are sent at once
+            before the answers are read, saving round trips on slow links. """
+        answers = []
+        depth = max(depth or self.pipeline_depth or 1, 1)
+        for i in range(0, len(frames), depth):
+            chunk = frames[i:i+depth]
+            if len(chunk) == 1:
+                answers.append(self.query_frame(chunk[0]))
+            else:
+                answers += self._query_pipelined(chunk)
+        return answers
+
+    def _query_pipelined(self, frames):
+        start = clock()
+        if not self.connected: self.connect_with_backoff()
+        try:
+            self.s.sendall(b''.join(frame.data for frame in frames))
+            answers = [self.reader.read_frame(self.s) for frame in frames]
+        except (socket.timeout, Opus20ConnectionException, ConnectionError) as e:
+            # answers may still be on their way, start over one by one
+            logger.warning("Pipelined query failed ({}), querying one by one.".format(e))
+            self.disconnect()
+            return [self.query_frame(frame) for frame in frames]
+        rtt = clock() - start
+        self.stats.queries += len(frames)
+        self.stats.last_rtt = rtt / len(frames)
+        self.stats.total_rtt += rtt
+        self.stats.max_rtt = max(self.stats.max_rtt, rtt)
+        for i, answer in enumerate(answers):
+            try:
+                answer.validate()
+            except FrameValidationException as e:
+                logger.warning("The frame couldn't be validated: " + str(e))
+                answers[i] = self.query_frame(frames[i])
+        return answers
+
+    def session_stats(self):
+        """ Connection counters and round trip times (in seconds) of the queries """
+        stats = self.stats.to_dict()
+        num_ok = stats['queries'] - stats['failed_queries']
+        stats['avg_rtt'] = stats['total_rtt'] / num_ok if num_ok else None
+        return stats
+
     def request_supported_channels(self):
         frame = Frame.from_cmd_and_payload(0x31, b"\x16")
         answer = self.query_frame(frame)
         self.available_channels = answer.available_channels()
 
     def request_channel_properties(self, channel: int):
-        query_frame = Frame.from_cmd_and_payload(0x31, b"\x30" + struct.pack('<H', channel))
-        answer_frame = self.query_frame(query_frame)
-        return answer_frame.channel_properties()
+        return self.request_channels_properties([channel])[channel]
+
+    def request_channels_properties(self, channels: list):
+        """ Returns {channel: properties} using the memoized or cached
+            properties where possible and querying the device for the rest """
+        properties = {}
+        missing = []
+        for channel in channels:
+            if channel not in self._channel_properties and self.metadata_cache:
+                cached = self.metadata_cache.get_channel_properties(self.host, self.port, channel)
+                if cached: self._channel_properties[channel] = cached
+            if channel in self._channel_properties:
+                properties[channel] = self._channel_properties[channel]
+            else:
+                missing.append(channel)
+        frames = [Frame.from_cmd_and_payload(0x31, b"\x30" + struct.pack('<H', channel)) for channel in missing]
+        for channel, answer_frame in zip(missing, self.query_frames(frames, self._metadata_depth)):
+            channel_properties = answer_frame.channel_properties()
+            assert channel_properties.channel == channel
+            self._channel_properties[channel] = properties[channel] = channel_properties
+            if self.metadata_cache:
+                self.metadata_cache.put_channel_properties(self.host, self.port, channel_properties)
+        return properties
+
+    @property
+    def _metadata_depth(self):
+        return self.pipeline_depth or self.METADATA_PIPELINE_DEPTH
+
+    def describe_channels(self, with_properties=True, refresh=False):
+        """ Describes all available channels with a list of
+            Object(channel=..., logging=..., [name=..., unit=..., ...])
+
+            The answers of the device are memoized. The logging state of a
+            channel is asked for again after set_channel_logging_state()
+            (or for all channels with refresh=True). """
+        if refresh: self._channel_logging_states.clear()
+        channels = self.available_channels
+        missing = [channel for channel in channels if channel not in self._channel_logging_states]
+        frames = [Frame.from_cmd_and_payload(0x44, b"\x22" + struct.pack('<H', channel)) for channel in missing]
+        for channel, answer_frame in zip(missing, self.query_frames(frames, self._metadata_depth)):
+            channel_state = answer_frame.channel_logging_state()
+            assert channel_state.channel == channel
+            self._channel_logging_states[channel] = channel_state.state
+        properties = self.request_channels_properties(channels) if with_properties else {}
+        descriptions = []
+        for channel in channels:
+            description = properties[channel].to_dict() if channel in properties else {}
+            description.update(channel=channel, logging=self._channel_logging_states[channel])
+            descriptions.append(Object(**description))
+        return descriptions
 
     def request_device_status(self):
         frame = Frame.from_cmd_and_payload(0x31, b"\x60")
         answer = self.query_frame(frame)
-        self.device_id = ''.join("{:02X}".format(byte) for byte in answer.props.payload[2:2+6])
+        self.device_id = answer.device_id()
         logger.info("Connected to device with ID: " + self.device_id)
 
     def sync_datetime(self, new_datetime=None, tz_offset=None):
@@ -140,40 +348,23 @@ class Opus20(object):
     def get_logging_state(self):
         frame = Frame.from_cmd_and_payload(0x44, b"\x43")
         answer = self.query_frame(frame)
-        answer.validate()
-        props = answer.props
-        assert len(props.payload) == 3
-        sub_cmd, state = struct.unpack('<xB?', props.payload)
-        assert props.cmd == 0x44
-        answer.assert_status()
-        assert sub_cmd == 0x43
-        return state
+        return answer.logging_state()
 
     def set_channel_logging_state(self, channel, enable_logging=True):
         payload = b"\x22" + struct.pack('<H?', channel, enable_logging)
         frame = Frame.from_cmd_and_payload(0x45, payload)
+        # the memoized state is outdated now, no matter what the answer is
+        self._channel_logging_states.pop(channel, None)
         answer = self.query_frame(frame)
-        answer.validate()
-        props = answer.props
-        assert props.cmd == 0x45
-        assert len(props.payload) == 6
-        assert props.payload[1] == 0x22
-        answer.assert_status()
-        return struct.unpack('<I', props.payload[2:6])[0]
+        return answer.channel_logging_state_written()
 
     def get_channel_logging_state(self, channel):
         payload = b"\x22" + struct.pack('<H', channel)
         frame = Frame.from_cmd_and_payload(0x44, payload)
         answer = self.query_frame(frame)
-        answer.validate()
-        props = answer.props
-        assert len(props.payload) == 5
-        sub_cmd, nch, state = struct.unpack('<xBH?', props.payload)
-        assert props.cmd == 0x44
-        answer.assert_status()
-        assert sub_cmd == 0x22
-        assert nch == channel
-        return state
+        channel_state = answer.channel_logging_state()
+        assert channel_state.channel == channel
+        return channel_state.state
 
     def channel_value(self, channel: int):
         query_frame = Frame.from_cmd_and_payload(0x23, struct.pack('<H', channel))
@@ -187,6 +378,35 @@ class Opus20(object):
         return answer_frame.online_data_request_multiple()
 
     def download_logs(self, start_datetime=None):
+        data = LogData()
+        for batch in self.iter_log_batches(start_datetime=start_datetime):
+            data.extend(batch)
+        return data
+
+    def iter_logs(self, start_datetime=None):
+        """ Like download_logs() but yields the rows one by one """
+        for batch in self.iter_log_batches(start_datetime=start_datetime):
+            yield from batch
+
+    def iter_log_batches(self, start_datetime=None):
+        """ Downloads the logs and yields the rows of each answer frame
+            (as LogData) as soon as it is decoded (instead of collecting them all). """
+        for data_answer_frame in self.iter_log_frames(start_datetime=start_datetime):
+            yield data_answer_frame.decode()
+
+    def iter_log_columns(self, start_datetime=None, use_numpy=None):
+        """ Like iter_log_batches() but yields the data of each answer frame
+            column-wise as returned by Frame.get_log_columns() """
+        for data_answer_frame in self.iter_log_frames(start_datetime=start_datetime):
+            yield data_answer_frame.get_log_columns(use_numpy=use_numpy)
+
+    def iter_log_frames(self, start_datetime=None):
+        """ Initiates a log download and yields the validated answer frames.
+            The frames are requested one after the other without retries (a
+            repeated request could skip a frame): a broken connection ends the
+            download with an exception, start it over from the last stored row.
+            Other queries may be made between the frames, but not on a new
+            connection (the device wouldn't continue the download on it). """
         if start_datetime:
             # We convert to UNIX time and add one second
             # ( otherwise the same 'last' datapoint could be fetched
@@ -196,16 +416,96 @@ class Opus20(object):
             ts = 0
         init_frame = Frame.from_cmd_and_payload(0x24, b'\x10' + struct.pack('<i', ts) + b'\x00\x00\x00\x00\x00')
         init_answer_frame = self.query_frame(init_frame)
-        init_answer_frame.validate()
-        init_answer_frame.kind
-        num_answer_frames = struct.unpack('<I', init_answer_frame.props.payload[2:2+4])[0]
+        connects = self.stats.connects
+        num_answer_frames = init_answer_frame.num_log_frames()
         data_request_frame = Frame.from_cmd_and_payload(0x24, b'\x20\x01')
-        data = []
         for i in range(num_answer_frames):
-            data_answer_frame = self.query_frame(data_request_frame)
+            if self.stats.connects != connects or not self.connected:
+                raise Opus20ConnectionException("The connection to {} was lost during the log download".format(self.host))
+            data_answer_frame = self.query_frame(data_request_frame, retry=False)
             data_answer_frame.validate()
-            data += data_answer_frame.kind.func()
-        return data
+            yield data_answer_frame
+
+class MetadataCache(object):
+    """
+    An on-disk cache for the metadata of OPUS20 devices: device ID,
+    available channels and channel properties, keyed by host:port.
+
+    Entries older than ttl seconds are ignored. Use invalidate() to
+    drop entries explicitly (e.g. after replacing a device).
+    """
+
+    PICKLE_VERSION = 2
+    DEFAULT_TTL = 24 * 3600
+
+    def __init__(self, cache_file=None, ttl=DEFAULT_TTL):
+        if cache_file is None: cache_file = self.default_cache_file()
+        self.cache_file = cache_file
+        self.ttl = ttl
+
+    @staticmethod
+    def default_cache_file():
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_dir, 'opus20', 'metadata.pickle')
+
+    @staticmethod
+    def _key(host, port):
+        return '{}:{}'.format(host, port)
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Ignoring unreadable metadata cache {}: {}".format(self.cache_file, e))
+            return {}
+
+    def _store(self, entries):
+        directory = os.path.dirname(self.cache_file)
+        if directory: os.makedirs(directory, exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(self.cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(entries, f, self.PICKLE_VERSION)
+        os.replace(tmp_file, self.cache_file)
+
+    def get(self, host, port):
+        """ Returns the cached metadata dict or None if missing or expired """
+        entry = self._load().get(self._key(host, port))
+        if not entry or time.time() - entry['ts'] > self.ttl: return None
+        return entry
+
+    def put(self, host, port, device_id, available_channels):
+        entries = self._load()
+        entries[self._key(host, port)] = {
+          'ts': time.time(),
+          'device_id': device_id,
+          'available_channels': list(available_channels),
+          'channel_properties': {},
+        }
+        self._store(entries)
+
+    def get_channel_properties(self, host, port, channel):
+        entry = self.get(host, port)
+        if not entry or channel not in entry['channel_properties']: return None
+        return Object(**entry['channel_properties'][channel])
+
+    def put_channel_properties(self, host, port, properties):
+        entries = self._load()
+        entry = entries.get(self._key(host, port))
+        # only complete entries get channel properties attached
+        if not entry: return
+        entry['channel_properties'][properties.channel] = properties.to_dict()
+        self._store(entries)
+
+    def invalidate(self, host=None, port=52015):
+        """ Drops the entry for host:port or all entries if host is None """
+        entries = self._load()
+        if host is None:
+            entries = {}
+        else:
+            entries.pop(self._key(host, port), None)
+        self._store(entries)
 
 class Opus20Exception(NameError):
     """ An exception concerning Opu20 """
@@ -219,61 +519,94 @@ class FrameValidationException(Opus20Exception):
 class IncompleteDataException(FrameValidationException):
     """ received incomplete data """
 
-class LogStore(object):
-
-    def __init__(self):
-        raise NotImplementedError()
-
-    def max_ts(self):
-        raise NotImplementedError()
+class FrameReassembler(object):
+    """ Reassembles l2p frames from a byte stream (e.g. a TCP connection).
 
-    def get_device_ids(self):
-        raise NotImplementedError()
+        Received bytes are collected in a buffer until the length declared
+        in the SHORT/LONG frame header has arrived. Bytes beyond the end of
+        a frame are kept for the next one. Garbage in front of a frame
+        header is discarded. """
 
-    def get_data(self, device_id=None):
-        raise NotImplementedError()
+    RECV_SIZE = 4096
 
-    def add_data(self):
-        raise NotImplementedError()
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scratch = bytearray(self.RECV_SIZE)
+
+    def clear(self):
+        del self._buffer[:]
+
+    def feed(self, data: bytes):
+        self._buffer += data
+
+    def _frame_length(self):
+        """ The total length of the frame at the start of the buffer
+            or None if not enough of it has been received yet. """
+        buf = self._buffer
+        while len(buf) >= 8:
+            header = buf[0:6]
+            if header == Frame.HEADER_SHORT:
+                return 12 + buf[6]
+            if header == Frame.HEADER_LONG:
+                return 13 + buf[6] + (buf[7] << 8)
+            # skip to the next byte that could start a header
+            skip = buf.find(Frame.HEADER_SHORT[0:1], 1)
+            if skip < 0: skip = len(buf)
+            logger.warning("Discarding {} bytes of unexpected data: {}".format(skip, hex_formatter(buf[0:skip])))
+            del buf[0:skip]
+        return None
 
-    def persist(self):
-        raise NotImplementedError()
+    def missing_bytes(self):
+        """ The number of bytes still needed to complete the current frame
+            (or its header, if the frame length is not yet known). """
+        length = self._frame_length()
+        if length is None: return 8 - len(self._buffer)
+        return max(length - len(self._buffer), 0)
+
+    def pop_frame(self):
+        """ Returns the next complete Frame from the buffer or None """
+        length = self._frame_length()
+        if length is None or len(self._buffer) < length: return None
+        frame = Frame(bytes(self._buffer[0:length]))
+        del self._buffer[0:length]
+        return frame
 
-class PickleStore(LogStore):
+    def read_frame(self, sock):
+        """ Receives from sock until a complete Frame is available and returns it """
+        while True:
+            frame = self.pop_frame()
+            if frame is not None: return frame
+            missing = self.missing_bytes()
+            if len(self._scratch) < missing:
+                self._scratch = bytearray(missing)
+            with memoryview(self._scratch) as view:
+                num = sock.recv_into(view)
+                if not num:
+                    raise Opus20ConnectionException("Connection closed by peer while waiting for {} more bytes".format(missing))
+                self._buffer += view[0:num]
+
+class FrameProps(object):
+    """ The basic properties of a validated Frame.
+        payload is a memoryview into the data of the frame. """
+
+    __slots__ = ('cmd', 'verc', 'length', 'payload', 'frame_style', 'chksum_found')
+
+    def __init__(self, cmd, verc, length, payload, frame_style, chksum_found):
+        self.cmd = cmd
+        self.verc = verc
+        self.length = length
+        self.payload = payload
+        self.frame_style = frame_style
+        self.chksum_found = chksum_found
 
-    PICKLE_VERSION = 2
+    def __getitem__(self, key):
+        return getattr(self, key)
 
-    def __init__(self, pickle_file: str):
-        self.pickle_file = pickle_file
+    def __repr__(self):
+        return "FrameProps({})".format(self.to_dict())
 
-        try:
-            with open(self.pickle_file, 'rb') as f:
-                self._data = pickle.load(f)
-        except FileNotFoundError:
-            self._data = {}
-
-    def max_ts(self):
-        max_ts = dict()
-        for device_id in self._data:
-            ts_list = [entry['ts'] for entry in self._data[device_id]]
-            max_ts[device_id] = max(ts_list)
-        return max_ts
-
-    def get_device_ids(self):
-        return tuple(self._data.keys())
-
-    def get_data(self, device_id=None):
-        if not device_id: return self._data
-        return self._data[device_id]
-
-    def add_data(self, device_id, new_data):
-        if device_id not in self._data:
-            self._data[device_id] = []
-        self._data[device_id] += new_data
-
-    def persist(self):
-        with open(self.pickle_file, 'wb') as f:
-            pickle.dump(self._data, f, self.PICKLE_VERSION)
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
 
 class Frame(object):
 
@@ -286,13 +619,28 @@ class Frame(object):
     SHORT_FRAME = 0x10
     LONG_FRAME  = 0x20
 
+    __slots__ = ('_data', '_props')
+
     def __init__(self, data=bytes()):
         self.data = data
 
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        # (re)assigning the data invalidates previously validated props
+        self._props = None
+
     @classmethod
     def from_cmd_and_payload(cls, cmd, payload, verc=0x10):
-        data = cls.HEADER_SHORT
-        data += bytes([2+len(payload)])
+        length = 2 + len(payload)
+        if length <= 0xFF:
+            data = cls.HEADER_SHORT + bytes([length])
+        else:
+            data = cls.HEADER_LONG + struct.pack('<H', length)
         data += cls.STX
         data += bytes([cmd, verc]) + payload
         data += cls.ETX
@@ -301,13 +649,17 @@ class Frame(object):
         data += bytes([crc & 0xFF, crc >> 8])
         data += cls.EOT
 
-        frame = Frame()
-        frame.data = data
-        return frame
+        return cls(data)
 
     def validate(self):
+        """ Checks the l2p frame in self.data and creates self.props .
+            No data is copied: the CRC is computed on a memoryview of the
+            frame and props.payload is a memoryview into self.data .
+            Validating an already validated frame is a no-op. """
+
+        if self._props is not None: return True
 
-        data = self.data
+        data = memoryview(self.data)
 
         if len(data) < 12:
             logger.warning("message incomplete? Expected at least 12 bytes, got {}. ".format(len(data)))
@@ -316,24 +668,24 @@ class Frame(object):
         frame_style = None
         offset = 0
         # check header
-        if data[0:6] == self.HEADER_SHORT:
+        header = data[0:6]
+        if header == self.HEADER_SHORT:
             frame_style = self.SHORT_FRAME
-        elif data[0:6] == self.HEADER_LONG:
+        elif header == self.HEADER_LONG:
             frame_style = self.LONG_FRAME
         else:
-            raise FrameValidationException("l2p-header incorrect: " + str(data[0:6]))
+            raise FrameValidationException("l2p-header incorrect: " + str(bytes(header)))
 
         # length of payload
         length = 0
         if frame_style == self.SHORT_FRAME:
             length = data[6]
         elif frame_style == self.LONG_FRAME:
-            length = struct.unpack('<H', data[6:8])[0]
+            length = data[6] + (data[7] << 8)
             offset += 1
-        logger.debug("length of payload={}".format(length))
         if len(data) < 12 + offset + length:
             # This 'problem' can occur regularly, thus we don't use .warning() but .info()
-            logger.debug("message incomplete? Expected {} bytes, got {}. ".format(12+length, len(data)) + str(data))
+            logger.debug("message incomplete? Expected %d bytes, got %d.", 12+offset+length, len(data))
             raise IncompleteDataException()
 
         # stx ok?
@@ -342,38 +694,32 @@ class Frame(object):
         # cmd/verc
         cmd = data[8+offset]
         verc = data[9+offset]
-        logger.debug("CMD=[0x{:02X}] VERC=[0x{:02X}]".format(cmd, verc))
-
-        # payload
-        payload = data[10+offset:10+offset+length-2]
-        logger.debug("Payload=[" + hex_formatter(payload) + "]")
 
         # etx ok?
         if data[8+offset+length] != 0x03: raise FrameValidationException("l2p-etx incorrect")
 
         # chksum ok?
-        frame = data[0:9+offset+length]
-        chksum_calc = crc16(frame)
+        chksum_calc = crc16(data[0:9+offset+length])
         # The byte order is LO HI
-        chksum_calc = bytes([chksum_calc & 0xFF, chksum_calc >> 8])
-        chksum_found = data[9+offset+length:9+offset+length+2]
+        chksum_found = data[9+offset+length] + (data[10+offset+length] << 8)
         if chksum_calc != chksum_found:
             logger.warning("Checksum: WRONG!")
-            raise FrameValidationException("l2p chksum incorrect: {} vs. {}".format(chksum_calc, chksum_found))
-        else:
-            logger.debug("Checksum: OK")
+            raise FrameValidationException("l2p chksum incorrect: 0x{:04X} vs. 0x{:04X}".format(chksum_calc, chksum_found))
 
         # eot ok?
         if data[11+offset+length] != 0x04: raise FrameValidationException("l2p-eot incorrect")
 
-        props = Object()
-        props.cmd = cmd
-        props.verc = verc
-        props.length = length
-        props.payload = payload
-        props.frame_style = frame_style
-        props.chksum_found = chksum_found
-        self._props = props
+        # payload
+        payload = data[10+offset:10+offset+length-2]
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("length of payload={}".format(length))
+            logger.debug("CMD=[0x{:02X}] VERC=[0x{:02X}]".format(cmd, verc))
+            logger.debug("Payload=[" + hex_formatter(payload) + "]")
+            logger.debug("Checksum: OK")
+
+        self._props = FrameProps(cmd, verc, length, payload, frame_style,
+                                 bytes([chksum_found & 0xFF, chksum_found >> 8]))
 
         return True
 
@@ -398,117 +744,52 @@ class Frame(object):
     def props(self):
         """ returns an object containing the basic properties of the Frame.
             This object is created when calling Frame.validate() . """
-        try:
-            return self._props
-        except:
+        if self._props is None:
             raise NameError('Props not available yet. Check Frame.validate() first.')
+        return self._props
 
 
     @property
     def kind(self):
-        FRAME_KINDS = [
-          #
-          Object(cmd=0x1E, payload_check=[],            payload_length=   0, name='network discovery request'),
-          Object(cmd=0x1E, payload_check=[0x00],        payload_length=  35, name='network discovery answer',                   func=self.discovery_result),
-          #
-          Object(cmd=0x23, payload_check=[],            payload_length=   2, name='online single channel request'),
-          Object(cmd=0x23, payload_check=[0x00,],       payload_length=   8, name='online single channel answer',               func=self.online_data_request_single),
-          #
-          Object(cmd=0x24, payload_check=[0x10,],       payload_length=  10, name='initiate log download request'),
-          Object(cmd=0x24, payload_check=[0x00, 0x10],  payload_length=  10, name='initiate log download answer'),
-          #
-          Object(cmd=0x24, payload_check=[0x20, 0x01],  payload_length=   2, name='log download data request'),
-          Object(cmd=0x24, payload_check=[0x00, 0x20],  payload_length=None, name='log download data answer',                   func=self.get_log_data),
-          #
-          Object(cmd=0x27, payload_check=[],            payload_length=   8, name='update time request'),
-          Object(cmd=0x27, payload_check=[0x00,],       payload_length=   1, name='update time answer'),
-          #
-          Object(cmd=0x2F, payload_check=[],            payload_length=   2, name='online multiple channel request'),
-          Object(cmd=0x2F, payload_check=[0x00,],       payload_length=None, name='online multiple channel answer',             func=self.online_data_request_multiple),
-          #
-          Object(cmd=0x31, payload_check=[0x16,],       payload_length=   1, name='channel list request'),
-          Object(cmd=0x31, payload_check=[0x00, 0x16,], payload_length=None, name='channel list answer',                        func=self.available_channels),
-          #
-          Object(cmd=0x31, payload_check=[0x17,],       payload_length=   1, name='channel group list request'),
-          Object(cmd=0x31, payload_check=[0x00, 0x17,], payload_length=None, name='channel group list answer'),
-          #
-          Object(cmd=0x31, payload_check=[0x30,],       payload_length=   3, name='information on specific channel request'),
-          Object(cmd=0x31, payload_check=[0x00, 0x30,], payload_length=  85, name='information on specific channel answer',     func=self.channel_properties),
-          #
-          Object(cmd=0x31, payload_check=[0x10,],       payload_length=   1, name='advanced status request 0x10 (?)'),
-          Object(cmd=0x31, payload_check=[0x00, 0x10,], payload_length=None, name='advanced status answer 0x10 (?)'),
-          #
-          Object(cmd=0x31, payload_check=[0x13,],       payload_length=   1, name='advanced status request 0x13 (?)'),
-          Object(cmd=0x31, payload_check=[0x00, 0x13,], payload_length=None, name='advanced status answer 0x13 (?)'),
-          #
-          Object(cmd=0x31, payload_check=[0x60,],       payload_length=   1, name='device status request'),
-          Object(cmd=0x31, payload_check=[0x00, 0x60,], payload_length=  10, name='device status answer'),
-          #
-          Object(cmd=0x44, payload_check=[0x12,],       payload_length=   2, name='[r] value range of channel group request'),
-          Object(cmd=0x44, payload_check=[0x00, 0x12],  payload_length=  18, name='[r] value range of channel group answer'),
-          #
-          Object(cmd=0x44, payload_check=[0x22,],       payload_length=   3, name='[r] enable/disable logging of specific channel request'),
-          Object(cmd=0x44, payload_check=[0x00, 0x22],  payload_length=   5, name='[r] enable/disable logging of specific channel answer'),
-          Object(cmd=0x45, payload_check=[0x22,],       payload_length=   4, name='[w] enable/disable logging of specific channel request'),
-          Object(cmd=0x45, payload_check=[0x00, 0x22],  payload_length=   6, name='[w] enable/disable logging of specific channel answer'),
-          #
-          Object(cmd=0x44, payload_check=[0x41,],       payload_length=   1, name='[r] measuring/logging interval request'),
-          Object(cmd=0x44, payload_check=[0x00, 0x41],  payload_length=  14, name='[r] measuring/logging interval answer'),
-          Object(cmd=0x45, payload_check=[0x41,],       payload_length=   9, name='[w] measuring/logging interval request'),
-          Object(cmd=0x45, payload_check=[0x00, 0x41],  payload_length=   8, name='[w] measuring/logging interval answer'),
-          #
-          Object(cmd=0x44, payload_check=[0x43,],       payload_length=   1, name='[r] enable/disable logging request'),
-          Object(cmd=0x44, payload_check=[0x00, 0x43],  payload_length=   3, name='[r] enable/disable logging answer'),
-          Object(cmd=0x45, payload_check=[0x43,],       payload_length=   2, name='[w] enable/disable logging request'),
-          Object(cmd=0x45, payload_check=[0x00,],       payload_length=   1, name='[w] enable/disable logging answer'),
-          #
-          Object(cmd=0x46, payload_check=[],            payload_length=   0, name='clear log request'),
-          Object(cmd=0x46, payload_check=[0x00,],       payload_length=   1, name='clear log answer'),
-          #
-          ## Commands I don't understand right now:
-          # 31/31 : channel group specific, a 2+1+1+n-byte answer, the n-bytes are counting upwards
-          # 44/11 : channel group specific, a 2+1+1-byte answer (single flat?)
-          # 44/13 : channel group specific, a 2+1+1+4-byte answer with a float value of 0.0
-          # 44/21 : channel group specific, 2+81-byte answer with mostly 0x00 values
-          # 44/31 : global, 2+80-byte answer with mostly 0x00 values
-          # 44/61 : global, a 2+1-byte answer with 0x00 (single flag?)
-          # 44/62 : global, a 2+1-byte answer with 0x00 (single flag?)
-          # 44/70 : global, a 2+2-byte answer with 0x00 0x00
-          # 44/81 : global, contains the device ID like 31/60
-        ]
-
+        """ returns the entry of FRAME_KINDS describing this frame (or None).
+            The lookup uses the prebuilt _FRAME_KIND_INDEX and picks the same
+            entry a linear scan of FRAME_KINDS would pick first. """
         props = self.props
 
         # all frames I have seen so far use verc = 0x10
         if props.verc != 0x10: return None
 
-        for knd in FRAME_KINDS:
-            if knd.cmd != props.cmd: continue
-            if knd.payload_length != None and knd.payload_length != len(props.payload):
-                continue
-            if len(knd.payload_check) > len(props.payload): continue
-            payload_matches = True
-            for i in range(len(knd.payload_check)):
-                ref_byte = knd.payload_check[i]
-                check_byte = props.payload[i]
-                if ref_byte != None and ref_byte != check_byte:
-                    payload_matches = False
-                    break
-            if payload_matches: return knd
-        return None
+        cmd, payload = props.cmd, props.payload
+        lengths = (len(payload), None)
+        best = None
+        for num_check_bytes in _FRAME_KIND_CHECK_LENGTHS:
+            if num_check_bytes > len(payload): break
+            check = bytes(payload[0:num_check_bytes])
+            for length in lengths:
+                hit = _FRAME_KIND_INDEX.get((cmd, check, length))
+                if hit and (best is None or hit[0] < best[0]): best = hit
+        return best[1] if best else None
+
+    def decode(self):
+        """ decodes the frame with the decoder registered for its kind """
+        knd = self.kind
+        decoder = getattr(knd, 'decoder', None)
+        if decoder is None:
+            raise Opus20Exception("No decoder available for this frame (kind: {})".format(knd.name if knd else 'unknown'))
+        return decoder(self)
 
     def discovery_result(self):
         props = self.props
 
         assert props.cmd == 0x1E
         assert len(props.payload) == 35
-        answer.assert_status()
+        self.assert_status()
 
         dr = Object()
         dr.device_id = ''.join("{:02X}".format(byte) for byte in props.payload[1:1+6])
-        dr.ip = ipaddress.IPv4Address(props.payload[9:9+4])
-        dr.gw = ipaddress.IPv4Address(props.payload[13:13+4])
-        dr.mask = ipaddress.IPv4Address(props.payload[17:17+4])
+        dr.ip = ipaddress.IPv4Address(bytes(props.payload[9:9+4]))
+        dr.gw = ipaddress.IPv4Address(bytes(props.payload[13:13+4]))
+        dr.mask = ipaddress.IPv4Address(bytes(props.payload[17:17+4]))
         dr.net = ipaddress.IPv4Network('{}/{}'.format(dr.ip, dr.mask), strict=False)
         return dr.to_dict()
 
@@ -548,6 +829,53 @@ class Frame(object):
         kind = KIND_MAP[kind]
         return Object(channel=channel, name=name, group=group, unit=unit, kind=kind, min=min, max=max)
 
+    def device_id(self):
+        # cmd="31 10 60" (device status)
+        props = self.props
+        assert len(props.payload) == 10
+        assert props.cmd == 0x31
+        self.assert_status()
+        assert props.payload[1] == 0x60
+        return ''.join("{:02X}".format(byte) for byte in props.payload[2:2+6])
+
+    def logging_state(self):
+        # cmd="44 10 43" (is logging enabled?)
+        props = self.props
+        assert len(props.payload) == 3
+        sub_cmd, state = struct.unpack('<xB?', props.payload)
+        assert props.cmd == 0x44
+        self.assert_status()
+        assert sub_cmd == 0x43
+        return state
+
+    def channel_logging_state(self):
+        # cmd="44 10 22" (is logging enabled for a specific channel?)
+        props = self.props
+        assert len(props.payload) == 5
+        sub_cmd, channel, state = struct.unpack('<xBH?', props.payload)
+        assert props.cmd == 0x44
+        self.assert_status()
+        assert sub_cmd == 0x22
+        return Object(channel=channel, state=state)
+
+    def channel_logging_state_written(self):
+        # cmd="45 10 22" (enable/disable logging for a specific channel)
+        props = self.props
+        assert props.cmd == 0x45
+        assert len(props.payload) == 6
+        assert props.payload[1] == 0x22
+        self.assert_status()
+        return struct.unpack('<I', props.payload[2:6])[0]
+
+    def num_log_frames(self):
+        # cmd="24 10 10" (initiate log download)
+        props = self.props
+        assert props.cmd == 0x24
+        assert len(props.payload) == 10
+        assert props.payload[1] == 0x10
+        self.assert_status()
+        return struct.unpack('<I', props.payload[2:2+4])[0]
+
     def online_data_request_single(self):
         # cmd="23 10" (online data request, one channel)
 
@@ -585,63 +913,136 @@ class Frame(object):
         return values
 
     def get_log_data(self):
+        """ The log data as LogData (decoded column-wise, see get_log_columns()) """
+        data = LogData.from_columns(self.get_log_columns(use_numpy=False))
+        if logger.isEnabledFor(logging.DEBUG):
+            is_final, begin, end, interval, num_blocks = self.LOG_HEADER.unpack_from(self.props.payload, 0)
+            logger.debug(str((is_final, datetime.fromtimestamp(begin), datetime.fromtimestamp(end), timedelta(seconds=interval), num_blocks)))
+        return data
+
+    LOG_HEADER = struct.Struct('<xx?xxxxiiIH')
+
+    def get_log_columns(self, use_numpy=None):
+        """ Like get_log_data() but returns the log data column-wise:
+            {'ts': UNIX timestamps (int64), channel: values (float32), ...}
+
+            If all blocks share the same layout (the usual case), they are
+            unpacked in one go: with a numpy structured dtype if numpy is
+            available (or use_numpy is True) and with struct.iter_unpack()
+            otherwise. Irregular blocks are decoded one by one and missing
+            values are filled with NaN. The columns are numpy arrays or
+            array.array('q') / array.array('f') respectively. """
         props = self.props
 
         assert props.length >= 21, 'message too short for a log data message'
         assert props.cmd == 0x24 and props.payload[1] == 0x20
         self.assert_status()
 
-        is_final, begin, end, interval, num_blocks = struct.unpack('<xx?xxxxiiIH', props.payload[0:21])
-        begin = datetime.fromtimestamp(begin)
-        end   = datetime.fromtimestamp(end)
-        interval = timedelta(seconds=interval)
-        logger.debug(str((is_final, begin, end, interval, num_blocks)))
+        if use_numpy is None: use_numpy = np is not None
+
+        is_final, begin, end, interval, num_blocks = self.LOG_HEADER.unpack_from(props.payload, 0)
+        blocks = props.payload[21:]
+
+        columns = None
+        if num_blocks and len(blocks):
+            num_entries = blocks[0]
+            if len(blocks) == num_blocks * (1 + 9 * num_entries):
+                if use_numpy:
+                    columns = self._regular_log_columns_numpy(blocks, num_blocks, num_entries)
+                else:
+                    columns = self._regular_log_columns_struct(blocks, num_entries)
+        if columns is None:
+            logger.debug("irregular log data blocks, decoding them one by one")
+            columns = self._irregular_log_columns(blocks, num_blocks)
+            if use_numpy:
+                columns = {channel: np.array(values, dtype=np.float32) for channel, values in columns.items()}
+            else:
+                columns = {channel: array('f', values) for channel, values in columns.items()}
+
+        if use_numpy:
+            ts = begin + np.arange(num_blocks, dtype=np.int64) * interval
+        else:
+            ts = array('q', (begin + i * interval for i in range(num_blocks)))
+        result = {'ts': ts}
+        result.update(columns)
+        return result
+
+    @staticmethod
+    def _regular_log_columns_numpy(blocks, num_blocks, num_entries):
+        entry = np.dtype([('length', 'u1'), ('status', 'u1'), ('channel', '<u2'), ('dtype', 'u1'), ('value', '<f4')])
+        block = np.dtype([('num_entries', 'u1'), ('entries', entry, (num_entries,))])
+        records = np.frombuffer(blocks, dtype=block, count=num_blocks)
+        entries = records['entries']
+        channels = entries['channel'][0]
+        if not ((records['num_entries'] == num_entries).all() and
+                (entries['length'] == 8).all() and
+                (entries['status'] == 0).all() and
+                (entries['dtype'] == 0x16).all() and
+                (entries['channel'] == channels).all()):
+            return None
+        values = entries['value']
+        return {int(channel): values[:, j].astype(np.float32) for j, channel in enumerate(channels)}
+
+    @staticmethod
+    def _regular_log_columns_struct(blocks, num_entries):
+        fields = list(zip(*struct.iter_unpack('<B' + 'BBHBf' * num_entries, blocks)))
+        if set(fields[0]) != {num_entries}: return None
+        columns = {}
+        for j in range(num_entries):
+            length, status, channel, dtype, value = fields[1+5*j:1+5*j+5]
+            if set(length) != {8} or set(status) != {0} or set(dtype) != {0x16} or len(set(channel)) != 1:
+                return None
+            columns[channel[0]] = array('f', value)
+        return columns
 
-        ts = begin
-        offset = 21
-        table = []
+    @classmethod
+    def _irregular_log_columns(cls, blocks, num_blocks):
+        columns = {}
+        offset = 0
         for i in range(num_blocks):
-            num_entries = props.payload[offset]
+            num_entries = blocks[offset]
             offset += 1
-            row = {'ts': ts}
-            ts = ts + interval
             for j in range(num_entries):
-                channel_value = Frame.read_channel_value(props.payload, offset)
-                row[channel_value.channel] = channel_value.value
+                channel_value = cls.read_channel_value(blocks, offset)
+                if channel_value.channel not in columns:
+                    columns[channel_value.channel] = [float('nan')] * num_blocks
+                columns[channel_value.channel][i] = channel_value.value
                 offset += 9
-            table.append(row)
-        return table
+        return columns
 
     @classmethod
     def read_channel_value(cls, buf: bytes, offset: int, length=None, status=None):
+        debug = logger.isEnabledFor(logging.DEBUG)
         if length is None:
             length = buf[offset]
-            logger.debug("SubLen={} ({})".format(length, offset))
-            logger.debug("SubPayload: " + hex_formatter(buf[offset:offset+1+length]))
+            if debug:
+                logger.debug("SubLen={} ({})".format(length, offset))
+                logger.debug("SubPayload: " + hex_formatter(buf[offset:offset+1+length]))
             offset += 1
 
         if status is None:
             status = buf[offset]
-            logger.debug("SubStatus={}: ({})".format(status, offset))
+            if debug: logger.debug("SubStatus={}: ({})".format(status, offset))
             offset += 1
             if status != 0: raise FrameValidationException('Bad status of channel value: 0x{:02X}'.format(status))
 
         channel = buf[offset] + (buf[offset+1] << 8)
-        if channel in CHANNEL_SPEC:
-            logger.debug("channel: {} ({:04X}) {}".format(channel, channel, CHANNEL_SPEC[channel]['name']))
-        else:
-            logger.debug("channel: {} ({:04X}) unknown?!".format(channel, channel))
+        if debug:
+            if channel in CHANNEL_SPEC:
+                logger.debug("channel: {} ({:04X}) {}".format(channel, channel, CHANNEL_SPEC[channel]['name']))
+            else:
+                logger.debug("channel: {} ({:04X}) unknown?!".format(channel, channel))
         offset += 2
 
         dtype = buf[offset]
-        logger.debug("DataType=[0x{:02X}]".format(dtype))
+        if debug: logger.debug("DataType=[0x{:02X}]".format(dtype))
         offset += 1
         if dtype == 0x16:
-            value = struct.unpack('<f', buf[offset:offset+4])[0]
+            value = struct.unpack_from('<f', buf, offset)[0]
             offset += 4
         else:
             raise NameError("Data type 0x{:02X} not implemented".format(dtype))
-        logger.debug("Returned Value: " + str(value))
+        if debug: logger.debug("Returned Value: " + str(value))
 
         return Object(channel=channel, value=value, dtype=dtype, length=length, status=status)
 
@@ -697,47 +1098,49 @@ def discover_OPUS20_devices(callback, bind_addr=""):
 
     myUDPintsockThread.join()
 
+# https://en.wikipedia.org/wiki/Cyclic_redundancy_check
+CRC16_TABLE = (
+  0x0000, 0x1189, 0x2312, 0x329B, 0x4624, 0x57AD, 0x6536, 0x74BF,
+  0x8C48, 0x9DC1, 0xAF5A, 0xBED3, 0xCA6C, 0xDBE5, 0xE97E, 0xF8F7,
+  0x1081, 0x0108, 0x3393, 0x221A, 0x56A5, 0x472C, 0x75B7, 0x643E,
+  0x9CC9, 0x8D40, 0xBFDB, 0xAE52, 0xDAED, 0xCB64, 0xF9FF, 0xE876,
+  0x2102, 0x308B, 0x0210, 0x1399, 0x6726, 0x76AF, 0x4434, 0x55BD,
+  0xAD4A, 0xBCC3, 0x8E58, 0x9FD1, 0xEB6E, 0xFAE7, 0xC87C, 0xD9F5,
+  0x3183, 0x200A, 0x1291, 0x0318, 0x77A7, 0x662E, 0x54B5, 0x453C,
+  0xBDCB, 0xAC42, 0x9ED9, 0x8F50, 0xFBEF, 0xEA66, 0xD8FD, 0xC974,
+  0x4204, 0x538D, 0x6116, 0x709F, 0x0420, 0x15A9, 0x2732, 0x36BB,
+  0xCE4C, 0xDFC5, 0xED5E, 0xFCD7, 0x8868, 0x99E1, 0xAB7A, 0xBAF3,
+  0x5285, 0x430C, 0x7197, 0x601E, 0x14A1, 0x0528, 0x37B3, 0x263A,
+  0xDECD, 0xCF44, 0xFDDF, 0xEC56, 0x98E9, 0x8960, 0xBBFB, 0xAA72,
+  0x6306, 0x728F, 0x4014, 0x519D, 0x2522, 0x34AB, 0x0630, 0x17B9,
+  0xEF4E, 0xFEC7, 0xCC5C, 0xDDD5, 0xA96A, 0xB8E3, 0x8A78, 0x9BF1,
+  0x7387, 0x620E, 0x5095, 0x411C, 0x35A3, 0x242A, 0x16B1, 0x0738,
+  0xFFCF, 0xEE46, 0xDCDD, 0xCD54, 0xB9EB, 0xA862, 0x9AF9, 0x8B70,
+  0x8408, 0x9581, 0xA71A, 0xB693, 0xC22C, 0xD3A5, 0xE13E, 0xF0B7,
+  0x0840, 0x19C9, 0x2B52, 0x3ADB, 0x4E64, 0x5FED, 0x6D76, 0x7CFF,
+  0x9489, 0x8500, 0xB79B, 0xA612, 0xD2AD, 0xC324, 0xF1BF, 0xE036,
+  0x18C1, 0x0948, 0x3BD3, 0x2A5A, 0x5EE5, 0x4F6C, 0x7DF7, 0x6C7E,
+  0xA50A, 0xB483, 0x8618, 0x9791, 0xE32E, 0xF2A7, 0xC03C, 0xD1B5,
+  0x2942, 0x38CB, 0x0A50, 0x1BD9, 0x6F66, 0x7EEF, 0x4C74, 0x5DFD,
+  0xB58B, 0xA402, 0x9699, 0x8710, 0xF3AF, 0xE226, 0xD0BD, 0xC134,
+  0x39C3, 0x284A, 0x1AD1, 0x0B58, 0x7FE7, 0x6E6E, 0x5CF5, 0x4D7C,
+  0xC60C, 0xD785, 0xE51E, 0xF497, 0x8028, 0x91A1, 0xA33A, 0xB2B3,
+  0x4A44, 0x5BCD, 0x6956, 0x78DF, 0x0C60, 0x1DE9, 0x2F72, 0x3EFB,
+  0xD68D, 0xC704, 0xF59F, 0xE416, 0x90A9, 0x8120, 0xB3BB, 0xA232,
+  0x5AC5, 0x4B4C, 0x79D7, 0x685E, 0x1CE1, 0x0D68, 0x3FF3, 0x2E7A,
+  0xE70E, 0xF687, 0xC41C, 0xD595, 0xA12A, 0xB0A3, 0x8238, 0x93B1,
+  0x6B46, 0x7ACF, 0x4854, 0x59DD, 0x2D62, 0x3CEB, 0x0E70, 0x1FF9,
+  0xF78F, 0xE606, 0xD49D, 0xC514, 0xB1AB, 0xA022, 0x92B9, 0x8330,
+  0x7BC7, 0x6A4E, 0x58D5, 0x495C, 0x3DE3, 0x2C6A, 0x1EF1, 0x0F78,
+)
+
 def crc16(data : bytes):
-    """ Calculates a CRC-16 CCITT checksum. data should be of type bytes() """
-    # https://en.wikipedia.org/wiki/Cyclic_redundancy_check
-    crc16_table = [
-        0x0000, 0x1189, 0x2312, 0x329B, 0x4624, 0x57AD, 0x6536, 0x74BF,
-        0x8C48, 0x9DC1, 0xAF5A, 0xBED3, 0xCA6C, 0xDBE5, 0xE97E, 0xF8F7,
-        0x1081, 0x0108, 0x3393, 0x221A, 0x56A5, 0x472C, 0x75B7, 0x643E,
-        0x9CC9, 0x8D40, 0xBFDB, 0xAE52, 0xDAED, 0xCB64, 0xF9FF, 0xE876,
-        0x2102, 0x308B, 0x0210, 0x1399, 0x6726, 0x76AF, 0x4434, 0x55BD,
-        0xAD4A, 0xBCC3, 0x8E58, 0x9FD1, 0xEB6E, 0xFAE7, 0xC87C, 0xD9F5,
-        0x3183, 0x200A, 0x1291, 0x0318, 0x77A7, 0x662E, 0x54B5, 0x453C,
-        0xBDCB, 0xAC42, 0x9ED9, 0x8F50, 0xFBEF, 0xEA66, 0xD8FD, 0xC974,
-        0x4204, 0x538D, 0x6116, 0x709F, 0x0420, 0x15A9, 0x2732, 0x36BB,
-        0xCE4C, 0xDFC5, 0xED5E, 0xFCD7, 0x8868, 0x99E1, 0xAB7A, 0xBAF3,
-        0x5285, 0x430C, 0x7197, 0x601E, 0x14A1, 0x0528, 0x37B3, 0x263A,
-        0xDECD, 0xCF44, 0xFDDF, 0xEC56, 0x98E9, 0x8960, 0xBBFB, 0xAA72,
-        0x6306, 0x728F, 0x4014, 0x519D, 0x2522, 0x34AB, 0x0630, 0x17B9,
-        0xEF4E, 0xFEC7, 0xCC5C, 0xDDD5, 0xA96A, 0xB8E3, 0x8A78, 0x9BF1,
-        0x7387, 0x620E, 0x5095, 0x411C, 0x35A3, 0x242A, 0x16B1, 0x0738,
-        0xFFCF, 0xEE46, 0xDCDD, 0xCD54, 0xB9EB, 0xA862, 0x9AF9, 0x8B70,
-        0x8408, 0x9581, 0xA71A, 0xB693, 0xC22C, 0xD3A5, 0xE13E, 0xF0B7,
-        0x0840, 0x19C9, 0x2B52, 0x3ADB, 0x4E64, 0x5FED, 0x6D76, 0x7CFF,
-        0x9489, 0x8500, 0xB79B, 0xA612, 0xD2AD, 0xC324, 0xF1BF, 0xE036,
-        0x18C1, 0x0948, 0x3BD3, 0x2A5A, 0x5EE5, 0x4F6C, 0x7DF7, 0x6C7E,
-        0xA50A, 0xB483, 0x8618, 0x9791, 0xE32E, 0xF2A7, 0xC03C, 0xD1B5,
-        0x2942, 0x38CB, 0x0A50, 0x1BD9, 0x6F66, 0x7EEF, 0x4C74, 0x5DFD,
-        0xB58B, 0xA402, 0x9699, 0x8710, 0xF3AF, 0xE226, 0xD0BD, 0xC134,
-        0x39C3, 0x284A, 0x1AD1, 0x0B58, 0x7FE7, 0x6E6E, 0x5CF5, 0x4D7C,
-        0xC60C, 0xD785, 0xE51E, 0xF497, 0x8028, 0x91A1, 0xA33A, 0xB2B3,
-        0x4A44, 0x5BCD, 0x6956, 0x78DF, 0x0C60, 0x1DE9, 0x2F72, 0x3EFB,
-        0xD68D, 0xC704, 0xF59F, 0xE416, 0x90A9, 0x8120, 0xB3BB, 0xA232,
-        0x5AC5, 0x4B4C, 0x79D7, 0x685E, 0x1CE1, 0x0D68, 0x3FF3, 0x2E7A,
-        0xE70E, 0xF687, 0xC41C, 0xD595, 0xA12A, 0xB0A3, 0x8238, 0x93B1,
-        0x6B46, 0x7ACF, 0x4854, 0x59DD, 0x2D62, 0x3CEB, 0x0E70, 0x1FF9,
-        0xF78F, 0xE606, 0xD49D, 0xC514, 0xB1AB, 0xA022, 0x92B9, 0x8330,
-        0x7BC7, 0x6A4E, 0x58D5, 0x495C, 0x3DE3, 0x2C6A, 0x1EF1, 0x0F78,
-    ]
+    """ Calculates a CRC-16 CCITT checksum. data can be any bytes-like object
+        (bytes, bytearray, memoryview); it is not copied. """
+    table = CRC16_TABLE
     crc_buff = 0xffff
-    for i in range(len(data)):
-        c = data[i]
-        crc_buff = (crc_buff >> 8) ^ crc16_table[ (c ^ ( crc_buff & 0xFF )) ]
+    for c in data:
+        crc_buff = (crc_buff >> 8) ^ table[c ^ (crc_buff & 0xFF)]
     return crc_buff
 
 CHANNEL_SPEC = {
@@ -845,3 +1248,85 @@ class Object(object):
             setattr(o, key, val)
         return o
 
+FRAME_KINDS = [
+  #
+  Object(cmd=0x1E, payload_check=[],            payload_length=   0, name='network discovery request'),
+  Object(cmd=0x1E, payload_check=[0x00],        payload_length=  35, name='network discovery answer',                   decoder=Frame.discovery_result),
+  #
+  Object(cmd=0x23, payload_check=[],            payload_length=   2, name='online single channel request'),
+  Object(cmd=0x23, payload_check=[0x00,],       payload_length=   8, name='online single channel answer',               decoder=Frame.online_data_request_single),
+  #
+  Object(cmd=0x24, payload_check=[0x10,],       payload_length=  10, name='initiate log download request'),
+  Object(cmd=0x24, payload_check=[0x00, 0x10],  payload_length=  10, name='initiate log download answer',               decoder=Frame.num_log_frames),
+  #
+  Object(cmd=0x24, payload_check=[0x20, 0x01],  payload_length=   2, name='log download data request'),
+  Object(cmd=0x24, payload_check=[0x00, 0x20],  payload_length=None, name='log download data answer',                   decoder=Frame.get_log_data),
+  #
+  Object(cmd=0x27, payload_check=[],            payload_length=   8, name='update time request'),
+  Object(cmd=0x27, payload_check=[0x00,],       payload_length=   1, name='update time answer'),
+  #
+  Object(cmd=0x2F, payload_check=[],            payload_length=   2, name='online multiple channel request'),
+  Object(cmd=0x2F, payload_check=[0x00,],       payload_length=None, name='online multiple channel answer',             decoder=Frame.online_data_request_multiple),
+  #
+  Object(cmd=0x31, payload_check=[0x16,],       payload_length=   1, name='channel list request'),
+  Object(cmd=0x31, payload_check=[0x00, 0x16,], payload_length=None, name='channel list answer',                        decoder=Frame.available_channels),
+  #
+  Object(cmd=0x31, payload_check=[0x17,],       payload_length=   1, name='channel group list request'),
+  Object(cmd=0x31, payload_check=[0x00, 0x17,], payload_length=None, name='channel group list answer'),
+  #
+  Object(cmd=0x31, payload_check=[0x30,],       payload_length=   3, name='information on specific channel request'),
+  Object(cmd=0x31, payload_check=[0x00, 0x30,], payload_length=  85, name='information on specific channel answer',     decoder=Frame.channel_properties),
+  #
+  Object(cmd=0x31, payload_check=[0x10,],       payload_length=   1, name='advanced status request 0x10 (?)'),
+  Object(cmd=0x31, payload_check=[0x00, 0x10,], payload_length=None, name='advanced status answer 0x10 (?)'),
+  #
+  Object(cmd=0x31, payload_check=[0x13,],       payload_length=   1, name='advanced status request 0x13 (?)'),
+  Object(cmd=0x31, payload_check=[0x00, 0x13,], payload_length=None, name='advanced status answer 0x13 (?)'),
+  #
+  Object(cmd=0x31, payload_check=[0x60,],       payload_length=   1, name='device status request'),
+  Object(cmd=0x31, payload_check=[0x00, 0x60,], payload_length=  10, name='device status answer',                       decoder=Frame.device_id),
+  #
+  Object(cmd=0x44, payload_check=[0x12,],       payload_length=   2, name='[r] value range of channel group request'),
+  Object(cmd=0x44, payload_check=[0x00, 0x12],  payload_length=  18, name='[r] value range of channel group answer'),
+  #
+  Object(cmd=0x44, payload_check=[0x22,],       payload_length=   3, name='[r] enable/disable logging of specific channel request'),
+  Object(cmd=0x44, payload_check=[0x00, 0x22],  payload_length=   5, name='[r] enable/disable logging of specific channel answer', decoder=Frame.channel_logging_state),
+  Object(cmd=0x45, payload_check=[0x22,],       payload_length=   4, name='[w] enable/disable logging of specific channel request'),
+  Object(cmd=0x45, payload_check=[0x00, 0x22],  payload_length=   6, name='[w] enable/disable logging of specific channel answer', decoder=Frame.channel_logging_state_written),
+  #
+  Object(cmd=0x44, payload_check=[0x41,],       payload_length=   1, name='[r] measuring/logging interval request'),
+  Object(cmd=0x44, payload_check=[0x00, 0x41],  payload_length=  14, name='[r] measuring/logging interval answer'),
+  Object(cmd=0x45, payload_check=[0x41,],       payload_length=   9, name='[w] measuring/logging interval request'),
+  Object(cmd=0x45, payload_check=[0x00, 0x41],  payload_length=   8, name='[w] measuring/logging interval answer'),
+  #
+  Object(cmd=0x44, payload_check=[0x43,],       payload_length=   1, name='[r] enable/disable logging request'),
+  Object(cmd=0x44, payload_check=[0x00, 0x43],  payload_length=   3, name='[r] enable/disable logging answer',          decoder=Frame.logging_state),
+  Object(cmd=0x45, payload_check=[0x43,],       payload_length=   2, name='[w] enable/disable logging request'),
+  Object(cmd=0x45, payload_check=[0x00,],       payload_length=   1, name='[w] enable/disable logging answer'),
+  #
+  Object(cmd=0x46, payload_check=[],            payload_length=   0, name='clear log request'),
+  Object(cmd=0x46, payload_check=[0x00,],       payload_length=   1, name='clear log answer'),
+  #
+  ## Commands I don't understand right now:
+  # 31/31 : channel group specific, a 2+1+1+n-byte answer, the n-bytes are counting upwards
+  # 44/11 : channel group specific, a 2+1+1-byte answer (single flat?)
+  # 44/13 : channel group specific, a 2+1+1+4-byte answer with a float value of 0.0
+  # 44/21 : channel group specific, 2+81-byte answer with mostly 0x00 values
+  # 44/31 : global, 2+80-byte answer with mostly 0x00 values
+  # 44/61 : global, a 2+1-byte answer with 0x00 (single flag?)
+  # 44/62 : global, a 2+1-byte answer with 0x00 (single flag?)
+  # 44/70 : global, a 2+2-byte answer with 0x00 0x00
+  # 44/81 : global, contains the device ID like 31/60
+]
+
+def _build_frame_kind_index(frame_kinds):
+    """ Maps (cmd, payload_check bytes, payload_length) to (position, kind).
+        Only the first entry for a key is kept, just like a linear scan would do. """
+    index = {}
+    for position, knd in enumerate(frame_kinds):
+        key = (knd.cmd, bytes(knd.payload_check), knd.payload_length)
+        index.setdefault(key, (position, knd))
+    return index
+
+_FRAME_KIND_INDEX = _build_frame_kind_index(FRAME_KINDS)
+_FRAME_KIND_CHECK_LENGTHS = sorted(set(len(knd.payload_check) for knd in FRAME_KINDS))
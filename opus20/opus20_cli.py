@@ -6,7 +6,10 @@ import time
 import argparse
 import logging
 
-from opus20 import Opus20, OPUS20_CHANNEL_SPEC, PickleStore, Opus20ConnectionException
+from datetime import datetime
+
+from opus20 import Opus20, OPUS20_CHANNEL_SPEC, MetadataCache, Opus20ConnectionException, LogSync, open_log_store
+from opus20.export import FORMATS as EXPORT_FORMATS, iter_export, export_log_data
 
 clock = time.perf_counter
 logger = logging.getLogger('opus20_cli')
@@ -17,19 +20,78 @@ def extended_int(string):
     else:
         return int(string)
 
+def local_datetime(string):
+    for fmt in ('%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(string, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("not a date / time like 2015-08-19 or 2015-08-19 12:00: " + string)
+
+def export_main(argv):
+    """ opus20_cli export: works on a log store only, no device needed """
+    parser = argparse.ArgumentParser(prog='opus20_cli export', description="Export the log data of a device from a log store")
+    parser.add_argument('persistance_file', help='the log store (see the download command)')
+    parser.add_argument('--device', '-d', help='the device ID (default: the only device in the store)')
+    parser.add_argument('--start', type=local_datetime, help='export rows from this (local) time on, e.g. 2015-08-19 or "2015-08-19 12:00"')
+    parser.add_argument('--end', type=local_datetime, help='export rows up to this (local) time')
+    parser.add_argument('--channels', '-c', type=extended_int, nargs='+', help='the channels to export (default: all)')
+    parser.add_argument('--format', '-f', choices=EXPORT_FORMATS, default='csv', help='the output format (default: %(default)s)')
+    parser.add_argument('--output', '-o', default='-', help='the output file (default: - for stdout)')
+    parser.add_argument('--loglevel', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help='Sets the verbosity of this script')
+    args = parser.parse_args(argv)
+
+    if args.loglevel:
+        logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
+
+    start = clock()
+    ps = open_log_store(args.persistance_file)
+    device_ids = ps.get_device_ids()
+    device_id = args.device
+    if device_id is None:
+        if len(device_ids) != 1: parser.error('please select a device with --device: {}'.format(', '.join(device_ids) or 'the store is empty'))
+        device_id = device_ids[0]
+    elif device_id not in device_ids:
+        parser.error('no data for device {} in {}'.format(device_id, args.persistance_file))
+    try:
+        # (no rows are read yet: this only checks the channels before the output file is created)
+        iter_export(ps, device_id, args.format, channels=args.channels)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output == '-':
+        size = export_log_data(ps, device_id, sys.stdout.buffer, args.format, args.start, args.end, args.channels)
+    else:
+        with open(args.output, 'wb') as f:
+            size = export_log_data(ps, device_id, f, args.format, args.start, args.end, args.channels)
+    end = clock()
+    logger.info("exported {} bytes in {:.6f} seconds.".format(size, end-start))
+
 def main():
 
-    parser = argparse.ArgumentParser(description="CLI for the Lufft OPUS20. Note that the subcommands provide their own --help!")
+    # the export command reads a log store and doesn't take a host
+    if sys.argv[1:2] == ['export']:
+        return export_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description="CLI for the Lufft OPUS20. Note that the subcommands provide their own --help!",
+                                     epilog="To export the log data from a log store, run: %(prog)s export --help")
     parser.add_argument('host', help='hostname of the device')
     parser.add_argument('--port', '-p', type=int, help='TCP port of the OPUS20')
     parser.add_argument('--timeout', '-t', type=float, help='Timeout of the TCP connection in seconds')
+    parser.add_argument('--pipeline', type=int, help='Max. number of requests to send before reading the answers '
+                                                     '(default: {} for the channel metadata, 1 otherwise; 1 disables pipelining)'.format(Opus20.METADATA_PIPELINE_DEPTH))
+    parser.add_argument('--metadata-cache', '-m', nargs='?', const=MetadataCache.default_cache_file(), metavar='FILE',
+                        help='Cache the device metadata (ID, channels) in FILE (default: %(const)s)')
+    parser.add_argument('--metadata-ttl', type=float, default=MetadataCache.DEFAULT_TTL, help='Max. age of cached metadata in seconds')
+    parser.add_argument('--refresh-metadata', action='store_true', help='Ignore the cached metadata and ask the device again')
     parser.add_argument('--loglevel', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help='Sets the verbosity of this script')
     subparsers = parser.add_subparsers(title='commands', help='', dest='cmd')
     parser_list = subparsers.add_parser('list', help='list all possible measurement channels')
     parser_get = subparsers.add_parser('get', help='get the value(s) of specific channel(s)')
     parser_get.add_argument('channel', type=extended_int, nargs='+', help='The selected channel(s)')
     parser_download = subparsers.add_parser('download', help='download the logs and store them locally')
-    parser_download.add_argument('persistance_file', help='file to store the logs in')
+    parser_download.add_argument('persistance_file', help='file to store the logs in (or a directory for an append-only segment store)')
+    parser_download.add_argument('--follow', '-f', action='store_true', help='keep downloading the new log data (until interrupted)')
+    parser_download.add_argument('--every', type=float, help='with --follow: seconds between two downloads (default: the logging interval of the device)')
     parser_logging = subparsers.add_parser('logging', help='change or query global logging settings (start, stop, clear)')
     subsubparsers = parser_logging.add_subparsers(help='Action to perform w/ respect to logging', dest='action')
     parser_logging_action_status = subsubparsers.add_parser('status', help='Query the current logging status of the device')
@@ -54,12 +116,16 @@ def main():
         kwargs = {}
         if args.port: kwargs['port'] = args.port
         if args.timeout: kwargs['timeout'] = args.timeout
+        if args.pipeline: kwargs['pipeline_depth'] = args.pipeline
+        if args.metadata_cache:
+            kwargs['metadata_cache'] = MetadataCache(args.metadata_cache, ttl=args.metadata_ttl)
+            if args.refresh_metadata: kwargs['metadata_cache'].invalidate(args.host, args.port or 52015)
         o20 = Opus20(args.host, **kwargs)
 
         if args.cmd == 'list':
-            for channel in o20.available_channels:
-                log_enabled = o20.get_channel_logging_state(channel)
-                log_enabled = 'yes' if log_enabled else 'no'
+            for description in o20.describe_channels(with_properties=False):
+                channel = description.channel
+                log_enabled = 'yes' if description.logging else 'no'
                 fmt = "Channel {:5d} (0x{:04X}): {name:22s}  unit: {unit:4s}  offset: {offset:5s}  logging: {log_enabled}"
                 print(fmt.format(channel, channel, log_enabled=log_enabled, **OPUS20_CHANNEL_SPEC[channel]))
         if args.cmd == 'get':
@@ -69,14 +135,16 @@ def main():
             else:
                 print("{:.3f}".format(o20.channel_value(args.channel[0])))
         if args.cmd == 'download':
-            ps = PickleStore(args.persistance_file)
-            try:
-                max_ts = ps.max_ts()[o20.device_id]
-            except KeyError:
-                max_ts = None
-            log_data = o20.download_logs(start_datetime=max_ts)
-            ps.add_data(o20.device_id, log_data)
-            ps.persist()
+            ps = open_log_store(args.persistance_file)
+            log_sync = LogSync(o20, ps, every=args.every)
+            if args.follow:
+                log_sync.start()
+                try:
+                    while True: time.sleep(3600)
+                except KeyboardInterrupt:
+                    log_sync.stop()
+            else:
+                log_sync.sync()
         if args.cmd == 'logging':
             def logging_in_words(): return 'enabled' if o20.get_logging_state() else 'disabled'
             if args.action == 'status':
@@ -92,7 +160,7 @@ def main():
         if args.cmd in ('enable', 'disable'):
             enable = args.cmd == 'enable'
             for channel in args.channel:
-                o20.set_channel_logging_state(enable)
+                o20.set_channel_logging_state(channel, enable)
 
     except Opus20ConnectionException as e:
         parser.error(str(e))
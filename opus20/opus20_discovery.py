@@ -24,7 +24,7 @@ def main():
     found_devices = []
     def full_callback(found_devices, answer):
         frm, host, answer_time = answer
-        dev_props = frm.kind.func()
+        dev_props = frm.decode()
         dev_props['answer_time'] = answer_time
         found_devices.append(dev_props)
     callback = functools.partial(full_callback, found_devices)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import argparse
+import logging
+
+from opus20 import FleetPoller, OPUS20_CHANNEL_SPEC
+
+clock = time.perf_counter
+logger = logging.getLogger('opus20_fleet')
+
+def extended_int(string):
+    if string.startswith('0x'):
+        return int(string, 16)
+    else:
+        return int(string)
+
+def print_snapshot(snapshot, as_json=False):
+    if as_json:
+        print(json.dumps({
+          'ts': snapshot.ts.isoformat(),
+          'devices': [
+            {
+              'host': device.host,
+              'device_id': device.device_id,
+              'values': {str(channel): value for channel, value in device.values.items()} if device.values else None,
+              'error': device.error,
+              'latency': device.latency,
+            } for device in snapshot.devices.values()
+          ],
+        }))
+        sys.stdout.flush()
+        return
+    print("Snapshot of {} (took {:.3f} s):".format(snapshot.ts.isoformat(), snapshot.duration))
+    for device in snapshot.devices.values():
+        if device.error:
+            print("  {host:22s} ERROR: {error}".format(**device.to_dict()))
+            continue
+        values = '  '.join("{}: {:.3f}".format(OPUS20_CHANNEL_SPEC[channel]['name'] if channel in OPUS20_CHANNEL_SPEC else channel, value)
+                           for channel, value in device.values.items())
+        print("  {:22s} {}  [{:.1f} ms]  {}".format(device.host, device.device_id, device.latency*1000, values))
+    sys.stdout.flush()
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Read the current values of many Lufft OPUS20 devices at once")
+    parser.add_argument('hosts', nargs='*', help='hostnames of the devices (optionally as host:port)')
+    parser.add_argument('--device-ids', '-i', nargs='+', default=[], help='device IDs to find via network discovery')
+    parser.add_argument('--bind-address', default="", help='the IP to bind to for the network discovery')
+    parser.add_argument('--channels', '-c', type=extended_int, nargs='+', default=list(FleetPoller.DEFAULT_CHANNELS), help='the channels to read')
+    parser.add_argument('--timeout', '-t', type=float, default=5., help='timeout of the TCP connections in seconds')
+    parser.add_argument('--deadline', '-d', type=float, help='max. time in seconds to wait for a single device per round')
+    parser.add_argument('--concurrency', type=int, default=64, help='max. number of devices queried at the same time')
+    parser.add_argument('--interval', type=float, help='poll repeatedly, every INTERVAL seconds')
+    parser.add_argument('--rounds', type=int, help='number of rounds to poll (with --interval)')
+    parser.add_argument('--json', action='store_true', help='print one JSON document per snapshot')
+    parser.add_argument('--loglevel', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help='Sets the verbosity of this script')
+    args = parser.parse_args()
+
+    if not args.hosts and not args.device_ids: parser.error('please provide hosts or device IDs')
+
+    if args.loglevel:
+        logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
+
+    kwargs = dict(channels=args.channels, timeout=args.timeout, deadline=args.deadline, max_concurrency=args.concurrency)
+    poller = FleetPoller(args.hosts, **kwargs)
+    if args.device_ids:
+        poller.hosts += FleetPoller.from_device_ids(args.device_ids, bind_addr=args.bind_address, **kwargs).hosts
+
+    start = clock()
+    def callback(snapshot): print_snapshot(snapshot, as_json=args.json)
+    try:
+        if args.interval:
+            poller.run(callback, interval=args.interval, rounds=args.rounds)
+        else:
+            callback(poller.poll())
+    except KeyboardInterrupt:
+        pass
+    end = clock()
+    logger.info("script running time (net): {:.6f} seconds.".format(end-start))
+
+if __name__ == "__main__": main()
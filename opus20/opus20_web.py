@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 # local deps
-from opus20.webapp import PlotWebServer
+from opus20.webapp import PlotWebServer, ThreadingWSGIServer
 
 # std lib
 import argparse
@@ -17,6 +17,13 @@ def main():
     parser.add_argument('--port', '-p', type=int, help='port of the device for TCP connections')
     parser.add_argument('--timeout', '-t', type=float, help='timeout for the TCP connection')
     parser.add_argument('--loglevel', '-l', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help='log level')
+    parser.add_argument('--store', '-s', default='/tmp/opus20-plot-server.pickle', help='file (or directory) to store the log data in')
+    parser.add_argument('--plot-cache-mb', type=float, default=PlotWebServer.PLOT_CACHE_BYTES / 1024**2, help='max. size of the rendered plots to keep in memory (in MiB)')
+    parser.add_argument('--render-workers', type=int, default=PlotWebServer.RENDER_WORKERS, help='number of processes rendering plots')
+    parser.add_argument('--max-pending-renders', type=int, default=PlotWebServer.MAX_PENDING_RENDERS, help='max. number of plots to render at a time (more get a 503)')
+    parser.add_argument('--status-interval', type=float, default=PlotWebServer.STATUS_INTERVAL, help='seconds between two reads of the current values')
+    parser.add_argument('--sync-interval', type=float, help='seconds between two downloads of the new log data (default: the logging interval of the device)')
+    parser.add_argument('--no-sync', action='store_true', help="don't download the log data in the background (only when asked for on the plots page)")
     parser.add_argument('--debug', '-d', action='store_true', help='enable debugging')
     args = parser.parse_args()
 
@@ -29,15 +36,21 @@ def main():
         if args.port: kwargs['port'] = args.port
         if args.timeout: kwargs['timeout'] = args.timeout
         kwargs['debug'] = args.debug
-        plot_server = PlotWebServer(args.host, '/tmp/opus20-plot-server.pickle', **kwargs)
-        plot_server.run(host='0.0.0.0', port=45067, debug=args.debug)
+        kwargs['plot_cache_bytes'] = int(args.plot_cache_mb * 1024**2)
+        kwargs['render_workers'] = args.render_workers
+        kwargs['max_pending_renders'] = args.max_pending_renders
+        kwargs['status_interval'] = args.status_interval
+        kwargs['sync_interval'] = args.sync_interval
+        kwargs['sync'] = not args.no_sync
+        plot_server = PlotWebServer(args.host, args.store, **kwargs)
+        plot_server.run(host='0.0.0.0', port=45067, debug=args.debug, server_class=ThreadingWSGIServer)
 
     except ConnectionRefusedError as e:
         parser.error("Could not connect to host {}: {}".format(args.host, e))
 
     finally:
         try:
-            plot_server.disconnect_opus20()
+            plot_server.shutdown()
         except:
             pass
 
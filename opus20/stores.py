@@ -0,0 +1,1312 @@
+#!/usr/bin/env python
+
+"""
+The stores of the log data: the LogStore base class with the Rollups
+it keeps up to date, the PickleStore and the SegmentStore, SqliteStore
+and ColumnStore. open_log_store() picks one by the file name.
+"""
+
+import os
+import json
+import struct
+import pickle
+import sqlite3
+import bisect
+import zlib
+import contextlib
+import logging
+from array import array
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .opus20 import Object
+from .logdata import LogData, NAN, local_datetime_index
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+COLUMN_STORE_SUFFIX = '.columns'
+
+class RollupTier(object):
+    """ The buckets of one tier: their start (UNIX time) and per channel
+        the min, max, sum and count of the values in each bucket """
+
+    __slots__ = ('width', 'ts', 'min', 'max', 'sum', 'count')
+
+    def __init__(self, width, channels=()):
+        self.width = width
+        self.ts = array('q')
+        self.min, self.max, self.sum, self.count = {}, {}, {}, {}
+        for channel in channels: self._add_channel(channel)
+
+    @classmethod
+    def from_log_data(cls, data):
+        """ The rows of a LogData as buckets of width 1 """
+        tier = cls(1)
+        tier.ts = array('q', data.ts)
+        for channel, values in data.columns.items():
+            tier.min[channel] = tier.max[channel] = values
+            tier.sum[channel] = array('d', values)
+            tier.count[channel] = array('I', (value == value for value in values))
+        return tier
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, index):
+        """ the buckets in the slice index """
+        tier = RollupTier(self.width)
+        tier.ts = self.ts[index]
+        for name in ('min', 'max', 'sum', 'count'):
+            getattr(tier, name).update({channel: values[index] for channel, values in getattr(self, name).items()})
+        return tier
+
+    def _add_channel(self, channel):
+        num_buckets = len(self.ts)
+        self.min[channel] = array('f', [NAN]) * num_buckets
+        self.max[channel] = array('f', [NAN]) * num_buckets
+        self.sum[channel] = array('d', [0.]) * num_buckets
+        self.count[channel] = array('I', [0]) * num_buckets
+
+    def aggregate(self, width):
+        """ The buckets of this tier aggregated into buckets of width """
+        result = RollupTier(width, self.count)
+        channels = [(self.min[channel], self.max[channel], self.sum[channel], self.count[channel],
+                     result.min[channel], result.max[channel], result.sum[channel], result.count[channel])
+                    for channel in self.count]
+        for i, ts in enumerate(self.ts):
+            bucket = ts - ts % width
+            if not result.ts or result.ts[-1] != bucket:
+                result.ts.append(bucket)
+                for _, _, _, _, r_min, r_max, r_sum, r_count in channels:
+                    r_min.append(NAN); r_max.append(NAN); r_sum.append(0.); r_count.append(0)
+            for s_min, s_max, s_sum, s_count, r_min, r_max, r_sum, r_count in channels:
+                if not s_count[i]: continue
+                if r_count[-1]:
+                    if s_min[i] < r_min[-1]: r_min[-1] = s_min[i]
+                    if s_max[i] > r_max[-1]: r_max[-1] = s_max[i]
+                else:
+                    r_min[-1], r_max[-1] = s_min[i], s_max[i]
+                r_sum[-1] += s_sum[i]
+                r_count[-1] += s_count[i]
+        return result
+
+    def splice(self, part, combine=False):
+        """ Replaces the buckets in the time span of part with the ones of
+            part. With combine, the values of a bucket that is already there
+            are added to the one of part instead (for new rows). """
+        if not len(part): return
+        for channel in part.count:
+            if channel not in self.count: self._add_channel(channel)
+        for channel in self.count:
+            if channel not in part.count: part._add_channel(channel)
+        lo = bisect.bisect_left(self.ts, part.ts[0])
+        hi = bisect.bisect_right(self.ts, part.ts[-1])
+        if combine:
+            for i in range(lo, hi):
+                j = bisect.bisect_left(part.ts, self.ts[i])
+                for channel, count in self.count.items():
+                    if not count[i]: continue
+                    if part.count[channel][j]:
+                        part.min[channel][j] = min(part.min[channel][j], self.min[channel][i])
+                        part.max[channel][j] = max(part.max[channel][j], self.max[channel][i])
+                    else:
+                        part.min[channel][j], part.max[channel][j] = self.min[channel][i], self.max[channel][i]
+                    part.sum[channel][j] += self.sum[channel][i]
+                    part.count[channel][j] += count[i]
+        self.ts[lo:hi] = part.ts
+        for name in ('min', 'max', 'sum', 'count'):
+            values, part_values = getattr(self, name), getattr(part, name)
+            for channel in values: values[channel][lo:hi] = part_values[channel]
+
+    def to_log_data(self, channels=None):
+        """ Object(avg=..., min=..., max=...) with a LogData each """
+        channels = [channel for channel in (self.count if channels is None else channels) if channel in self.count]
+        result = Object()
+        for name in ('avg', 'min', 'max'):
+            columns = {}
+            for channel in channels:
+                if name == 'avg':
+                    columns[channel] = array('f', (total / count if count else NAN for total, count in zip(self.sum[channel], self.count[channel])))
+                else:
+                    columns[channel] = array('f', getattr(self, name)[channel])
+            setattr(result, name, LogData(array('q', self.ts), columns))
+        return result
+
+    def __getstate__(self):
+        # the arrays are deflated, the last element marks the compressed state
+        return (self.width, zlib.compress(self.ts.tobytes()),
+                {name: {channel: zlib.compress(values.tobytes()) for channel, values in getattr(self, name).items()}
+                 for name in ('min', 'max', 'sum', 'count')}, 'zlib')
+
+    def __setstate__(self, state):
+        self.width, ts, columns = state[:3]
+        unpack = zlib.decompress if len(state) > 3 else bytes
+        self.ts = array('q')
+        self.ts.frombytes(unpack(ts))
+        for name, typecode in (('min', 'f'), ('max', 'f'), ('sum', 'd'), ('count', 'I')):
+            setattr(self, name, {})
+            for channel, values in columns[name].items():
+                getattr(self, name)[channel] = array(typecode)
+                getattr(self, name)[channel].frombytes(unpack(values))
+
+class Rollups(object):
+    """
+    Min / max / avg aggregates of the log data of each device in tiers of
+    increasing bucket width (by default 1 min, 10 min, 1 h and 1 day).
+
+    update() adds rows to the finest tier and re-aggregates only the
+    buckets of the coarser tiers they touch. query() picks the coarsest
+    tier that still has a given number of buckets in a time range, so
+    a plot of years of data only has to handle a few thousand points.
+    The bucket widths have to be multiples of each other.
+    """
+
+    TIERS = (60, 600, 3600, 86400)
+
+    def __init__(self, tiers=TIERS):
+        self.tiers = tuple(tiers)
+        # device_id -> [RollupTier, ...]
+        self._devices = {}
+        # device_id -> (rows, max_ts) of the store data the rollups cover
+        self.sources = {}
+
+    def get_device_ids(self):
+        return tuple(self._devices)
+
+    def get_tiers(self, device_id):
+        return self._devices[device_id]
+
+    def update(self, device_id, data, replace=False):
+        """ Adds data (a LogData with rows that are newer than the ones
+            added before) to the rollups of device_id. With replace, data
+            instead has to hold all rows of the finest buckets it touches,
+            whose values then replace the aggregates of these buckets. """
+        if not len(data): return
+        if device_id not in self._devices:
+            self._devices[device_id] = [RollupTier(width) for width in self.tiers]
+        source = RollupTier.from_log_data(data)
+        tiers = self._devices[device_id]
+        for tier, next_width in zip(tiers, self.tiers[1:] + (None,)):
+            part = source.aggregate(tier.width)
+            tier.splice(part, combine=not replace)
+            if next_width is None: break
+            # the next tier is built from all buckets of this tier within
+            # the (wider) buckets it touches
+            first, last = part.ts[0], part.ts[-1]
+            lo = bisect.bisect_left(tier.ts, first - first % next_width)
+            hi = bisect.bisect_right(tier.ts, last - last % next_width + next_width - 1)
+            source = tier[lo:hi]
+            replace = True
+
+    def rebuild(self, device_id, data):
+        """ Builds the rollups of device_id from all of its rows """
+        self._devices.pop(device_id, None)
+        self.update(device_id, data, replace=True)
+
+    def query(self, device_id, start=None, end=None, min_points=700, channels=None):
+        """ Returns Object(interval=..., avg=..., min=..., max=...) with
+            the buckets of the coarsest tier that has at least min_points
+            buckets with start <= ts <= end (the bucket values as LogData),
+            or None if there is no such tier. """
+        for tier in reversed(self._devices.get(device_id, [])):
+            lo = 0 if start is None else bisect.bisect_left(tier.ts, int(start.timestamp()) - int(start.timestamp()) % tier.width)
+            hi = len(tier.ts) if end is None else bisect.bisect_right(tier.ts, int(end.timestamp()))
+            if hi - lo >= min_points:
+                result = tier[lo:hi].to_log_data(channels)
+                result.interval = tier.width
+                return result
+        return None
+
+    @classmethod
+    def load(cls, rollup_file, tiers=TIERS):
+        try:
+            with open(rollup_file, 'rb') as f:
+                rollups = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return cls(tiers)
+        except (AttributeError, ImportError):
+            # written by a version that kept the classes elsewhere (they are rebuilt)
+            return cls(tiers)
+        if rollups.tiers != tuple(tiers): return cls(tiers)
+        return rollups
+
+    def save(self, rollup_file, protocol=3):
+        tmp_file = '{}.{}.tmp'.format(rollup_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(self, f, protocol)
+        os.replace(tmp_file, rollup_file)
+
+@contextlib.contextmanager
+def file_lock(lock_file, exclusive=True):
+    """ Holds an advisory lock (flock) on lock_file (created if needed):
+        exclusive for writers, shared for readers. Without fcntl (on
+        Windows) this doesn't lock anything. """
+    with open(lock_file, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class LogStore(object):
+    """ The rows of each device are kept sorted by ts with one row per
+        timestamp: add_data() merges rows with a timestamp that is
+        already stored into the stored row. get_data() and get_range()
+        return them as LogData. """
+
+    BATCH_ROWS = 10000
+
+    def __init__(self):
+        raise NotImplementedError()
+
+    def max_ts(self):
+        """ The newest timestamp of each device (the resume point of a download) """
+        return {device_id: stats.max_ts for device_id, stats in self.device_stats().items() if stats.max_ts is not None}
+
+    def device_stats(self):
+        """ Returns {device_id: Object(rows=..., min_ts=..., max_ts=...)}.
+            This generic version scans get_data(), the stores override it
+            with the stats they keep up to date in add_data(). """
+        stats = {}
+        for device_id in self.get_device_ids():
+            stats[device_id] = self._update_stats(None, self.get_data(device_id))
+        return stats
+
+    @staticmethod
+    def _update_stats(stats, rows, added=None):
+        """ Returns the stats Object updated with rows (of which added
+            were new, the others replaced stored rows; default: all) """
+        if stats is None: stats = Object(rows=0, min_ts=None, max_ts=None)
+        rows = LogData.from_rows(rows)
+        stats.rows += len(rows) if added is None else added
+        if len(rows):
+            min_ts, max_ts = datetime.fromtimestamp(min(rows.ts)), datetime.fromtimestamp(max(rows.ts))
+            if stats.min_ts is None or min_ts < stats.min_ts: stats.min_ts = min_ts
+            if stats.max_ts is None or max_ts > stats.max_ts: stats.max_ts = max_ts
+        return stats
+
+    def get_device_ids(self):
+        raise NotImplementedError()
+
+    def get_data(self, device_id=None):
+        raise NotImplementedError()
+
+    def get_channels(self, device_id):
+        """ The channels stored for device_id. This generic version
+            looks at get_data(), the stores override it where they know
+            the channels without reading the rows. """
+        return list(self.get_data(device_id).channels)
+
+    def add_data(self, device_id, new_data):
+        """ Adds the rows new_data (dicts or a LogData) of device_id
+            and updates the rollups accordingly """
+        new_data = LogData.from_rows(new_data)
+        if not len(new_data): return
+        stats = self.device_stats().get(device_id)
+        self._add_rows(device_id, new_data)
+        self._update_rollups(device_id, new_data, stats)
+        self._bump_data_version(device_id)
+
+    def data_version(self, device_id):
+        """ A number that changes whenever rows of device_id are added
+            (by add_data() or picked up by refresh()), to tell whether
+            something derived from them is outdated """
+        return getattr(self, '_data_versions', {}).get(device_id, 0)
+
+    def _bump_data_version(self, device_id):
+        if not hasattr(self, '_data_versions'): self._data_versions = {}
+        self._data_versions[device_id] = self._data_versions.get(device_id, 0) + 1
+
+    def _check_rollups(self, device_id, stats):
+        """ Rebuilds the rollups of device_id from the stored rows unless
+            they cover exactly the rows described by stats (they don't if
+            the rollup file was missing or another process added rows) """
+        rollups = self._load_rollups()
+        source = None if stats is None else (stats.rows, stats.max_ts)
+        if rollups.sources.get(device_id) == source: return
+        logger.info("Building the rollups for device {}".format(device_id))
+        rollups.rebuild(device_id, LogData.from_rows(self.get_data(device_id)) if stats else LogData())
+        rollups.sources[device_id] = source
+
+    def _update_rollups(self, device_id, new_data, stats):
+        """ Updates the rollups with the rows of new_data that were just
+            added (stats: the device_stats() of device_id before that).
+            Rollups of device_id that didn't cover the stored rows already
+            are left as they are (and rebuilt when they are queried). """
+        rollups = self._load_rollups()
+        if rollups.sources.get(device_id) != (None if stats is None else (stats.rows, stats.max_ts)): return
+        ts = new_data.ts
+        if (stats is None or stats.max_ts is None or datetime.fromtimestamp(min(ts)) > stats.max_ts) and \
+           all(a < b for a, b in zip(ts, ts[1:])):
+            rollups.update(device_id, new_data)
+        else:
+            # rows may have been merged into stored ones: aggregate the
+            # finest buckets they touch again from the stored rows
+            width = rollups.tiers[0]
+            first, last = min(ts), max(ts)
+            rows = self.get_range(device_id, datetime.fromtimestamp(first - first % width),
+                                  datetime.fromtimestamp(last - last % width + width - 1))
+            rollups.update(device_id, LogData.from_rows(rows), replace=True)
+        stats = self.device_stats()[device_id]
+        rollups.sources[device_id] = (stats.rows, stats.max_ts)
+
+    def _add_rows(self, device_id, new_data):
+        """ Adds the rows of the LogData new_data to the store """
+        raise NotImplementedError()
+
+    def refresh(self):
+        """ Picks up the rows other processes persisted to the store since
+            it was opened (or last refreshed). Returns True if there were any. """
+        return False
+
+    def _rollup_file(self):
+        """ Where the rollups are persisted (None: kept in memory only) """
+        return None
+
+    def _load_rollups(self):
+        """ The Rollups as read from the rollup file (on first use),
+            whether they cover the stored rows or not """
+        if getattr(self, '_rollups', None) is None:
+            rollup_file = self._rollup_file()
+            self._rollups = Rollups.load(rollup_file) if rollup_file else Rollups()
+        return self._rollups
+
+    @property
+    def rollups(self):
+        """ The Rollups of the data in this store, rebuilt for devices
+            whose data changed without them """
+        rollups = self._load_rollups()
+        for device_id, stats in self.device_stats().items():
+            self._check_rollups(device_id, stats)
+        return rollups
+
+    def _persist_rollups(self):
+        if getattr(self, '_rollups', None) is not None and self._rollup_file():
+            self._rollups.save(self._rollup_file())
+
+    def get_rollup(self, device_id, start=None, end=None, min_points=700, channels=None):
+        """ Returns the min / max / avg values of the coarsest rollup tier
+            with at least min_points buckets in the range (see Rollups.query())
+            or None if the range is too short for any tier. Only the rollups
+            of device_id are rebuilt if they are outdated. """
+        self._check_rollups(device_id, self.device_stats().get(device_id))
+        return self._rollups.query(device_id, start, end, min_points, channels)
+
+    def add_batches(self, device_id, batches):
+        """ Adds the data from an iterable of row lists (like the one
+            returned by Opus20.iter_log_batches()) one batch at a time.
+            Returns the number of rows added. """
+        num_rows = 0
+        for batch in batches:
+            self.add_data(device_id, batch)
+            num_rows += len(batch)
+        return num_rows
+
+    def get_range(self, device_id, start=None, end=None, channels=None):
+        """ Returns the rows of device_id with start <= ts <= end (both
+            datetimes, None = unbounded), reduced to the given channels.
+            This generic version bisects get_data(), stores that can do
+            better override it. """
+        rows = self.get_data(device_id)
+        lo = 0 if start is None else rows.bisect(start)
+        hi = len(rows) if end is None else rows.bisect(end, right=True)
+        return rows[lo:hi] if channels is None else rows[lo:hi].select(channels)
+
+    def iter_range(self, device_id, start=None, end=None, channels=None, batch_rows=BATCH_ROWS):
+        """ Like get_range() but yields the rows as LogData batches of up to
+            batch_rows rows. Stores that can read a range piecewise override
+            it, so the range as a whole is never copied into memory. """
+        rows = self.get_data(device_id)
+        lo = 0 if start is None else rows.bisect(start)
+        hi = len(rows) if end is None else rows.bisect(end, right=True)
+        for offset in range(lo, hi, batch_rows):
+            batch = rows[offset:min(offset + batch_rows, hi)]
+            yield batch if channels is None else batch.select(channels)
+
+    def get_frame(self, device_id, start=None, end=None, channels=None, min_points=None):
+        """ Returns get_range() as a pandas DataFrame indexed by ts
+            with one column per channel. With min_points, the averages
+            of a rollup tier are returned instead if there is one with
+            at least min_points buckets in the range. """
+        rollup = self.get_rollup(device_id, start, end, min_points, channels) if min_points else None
+        if rollup is not None: return rollup.avg.to_frame()
+        return LogData.from_rows(self.get_range(device_id, start, end, channels)).to_frame()
+
+    def persist(self):
+        raise NotImplementedError()
+
+class PickleStore(LogStore):
+    """
+    A LogStore keeping the rows of all devices in a pickle file and
+    some files next to it:
+
+        <file>.journal - the rows persisted since the file was written
+        <file>.stats   - the number of rows and first / last ts per device
+        <file>.rollups - the Rollups
+        <file>.lock    - the lock of the processes sharing the store
+
+    persist() appends the rows added since its last call to the journal
+    and rewrites the pickle file only when the journal has grown larger
+    (to a temporary file replacing it, so a crash never leaves a partial
+    file behind). It holds an exclusive lock and first takes over what
+    other processes persisted in the meantime, so concurrent writers
+    don't lose rows. refresh() reads just the journal records that are
+    new since the last call (or all files if the pickle file changed).
+    """
+
+    # protocol 3 stores bytes (the encoded LogData) as they are
+    PICKLE_VERSION = 3
+    STATS_SUFFIX = '.stats'
+    ROLLUPS_SUFFIX = '.rollups'
+    JOURNAL_SUFFIX = '.journal'
+    LOCK_SUFFIX = '.lock'
+    # each journal record: its size, then the pickled (device_id, rows)
+    RECORD_HEADER = struct.Struct('<I')
+    MIN_COMPACT_SIZE = 1024 * 1024
+
+    def __init__(self, pickle_file: str):
+        self.pickle_file = pickle_file
+        self._data = {}
+        # device_id -> rows added since the last persist()
+        self._pending = {}
+        # the os.stat() of the pickle file read and the journal bytes read
+        self._snapshot = None
+        self._journal_bytes = 0
+        with file_lock(self.pickle_file + self.LOCK_SUFFIX, exclusive=False):
+            self._read_snapshot()
+            self._read_journal()
+            self._stats = self._read_stats()
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _read_snapshot(self):
+        """ Reads the pickle file unless it is unchanged. Returns True if it was read. """
+        signature = self._signature(self.pickle_file)
+        if signature == self._snapshot: return False
+        try:
+            with open(self.pickle_file, 'rb') as f:
+                self._data = pickle.load(f)
+        except FileNotFoundError:
+            self._data = {}
+        # files written by older versions hold (maybe unsorted) lists of dict rows
+        for device_id, rows in self._data.items():
+            if not isinstance(rows, LogData):
+                self._data[device_id] = LogData()
+                self._data[device_id].merge(rows)
+        self._snapshot = signature
+        self._journal_bytes = 0
+        return True
+
+    def _read_journal(self):
+        """ Merges the journal records that weren't read yet, returns
+            (device_id, rows, number of rows added) for each of them """
+        records = []
+        try:
+            f = open(self.pickle_file + self.JOURNAL_SUFFIX, 'rb')
+        except FileNotFoundError:
+            return records
+        with f:
+            f.seek(self._journal_bytes)
+            while True:
+                header = f.read(self.RECORD_HEADER.size)
+                if len(header) < self.RECORD_HEADER.size: break
+                size, = self.RECORD_HEADER.unpack(header)
+                record = f.read(size)
+                # (the end of a record an interrupted persist() didn't finish)
+                if len(record) < size: break
+                device_id, rows = pickle.loads(record)
+                added = self._data.setdefault(device_id, LogData()).merge(rows)
+                records.append((device_id, rows, added))
+                self._journal_bytes += self.RECORD_HEADER.size + size
+        return records
+
+    def _read_stats(self):
+        """ Reads the stats persisted next to the pickle file (they are
+            only trusted if they match the number of rows of each device) """
+        try:
+            with open(self.pickle_file + self.STATS_SUFFIX, 'rb') as f:
+                stats = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            stats = {}
+        for device_id, rows in self._data.items():
+            if device_id not in stats or stats[device_id].rows != len(rows):
+                stats[device_id] = self._update_stats(None, rows)
+        return {device_id: stats[device_id] for device_id in self._data}
+
+    def refresh(self):
+        with file_lock(self.pickle_file + self.LOCK_SUFFIX, exclusive=False):
+            return self._refresh()
+
+    def _refresh(self):
+        if self._read_snapshot():
+            # rewritten by another process: start over with its files
+            self._read_journal()
+            for device_id, rows in self._pending.items():
+                self._data.setdefault(device_id, LogData()).merge(rows)
+            self._stats = self._read_stats()
+            self._rollups = None
+            for device_id in self._data: self._bump_data_version(device_id)
+            return True
+        records = self._read_journal()
+        for device_id, rows, added in records:
+            stats = self._stats.get(device_id)
+            self._stats[device_id] = self._update_stats(Object(**stats.to_dict()) if stats else None, rows, added)
+            if getattr(self, '_rollups', None) is not None:
+                self._update_rollups(device_id, rows, stats)
+            self._bump_data_version(device_id)
+        return bool(records)
+
+    def device_stats(self):
+        return {device_id: Object(**stats.to_dict()) for device_id, stats in self._stats.items()}
+
+    def get_device_ids(self):
+        return tuple(self._data.keys())
+
+    def get_data(self, device_id=None):
+        if not device_id: return self._data
+        return self._data[device_id]
+
+    def _add_rows(self, device_id, new_data):
+        if device_id not in self._data:
+            self._data[device_id] = LogData()
+        added = self._data[device_id].merge(new_data)
+        self._stats[device_id] = self._update_stats(self._stats.get(device_id), new_data, added)
+        self._pending.setdefault(device_id, LogData()).extend(new_data)
+
+    def _rollup_file(self):
+        return self.pickle_file + self.ROLLUPS_SUFFIX
+
+    def persist(self):
+        with file_lock(self.pickle_file + self.LOCK_SUFFIX):
+            self._refresh()
+            if self._pending:
+                self._append_journal()
+            if self._snapshot is None or self._journal_bytes > max(self.MIN_COMPACT_SIZE, self._snapshot[1]):
+                self._dump(self.pickle_file, self._data)
+                self._snapshot = self._signature(self.pickle_file)
+                # the journal records are part of the pickle file now
+                with open(self.pickle_file + self.JOURNAL_SUFFIX, 'wb'):
+                    self._journal_bytes = 0
+            self._dump(self.pickle_file + self.STATS_SUFFIX, self._stats)
+            self._persist_rollups()
+
+    def _append_journal(self):
+        path = self.pickle_file + self.JOURNAL_SUFFIX
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            # drop whatever an interrupted earlier write may have left behind
+            f.truncate(self._journal_bytes)
+            f.seek(self._journal_bytes)
+            for device_id, rows in self._pending.items():
+                record = pickle.dumps((device_id, rows), self.PICKLE_VERSION)
+                f.write(self.RECORD_HEADER.pack(len(record)) + record)
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_bytes = f.tell()
+        self._pending = {}
+
+    def _dump(self, path, obj):
+        """ Pickles obj to a temporary file that replaces path when complete """
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, self.PICKLE_VERSION)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+class SegmentStore(LogStore):
+    """
+    An append-only LogStore keeping the data in a directory:
+
+        manifest.json          - the devices and their segment files
+        <device_id>-000000.seg - one or more segment files per device
+
+    A segment file is a sequence of pickled LogData batches. persist()
+    only appends the rows added since the last call and rewrites the
+    (small) manifest. Opening the store only reads the manifest, the
+    segments of a device are read on the first get_data() for it.
+    Rows that overlap the stored ones are appended all the same and
+    merged into them when the segments are read.
+
+    The manifest records the number of valid bytes of each segment, so
+    a write that got interrupted before the manifest was updated is
+    ignored (and overwritten by the next persist()). persist() holds an
+    exclusive lock and first takes over the manifest other processes
+    wrote in the meantime, refresh() reads the records they appended.
+    """
+
+    MANIFEST_FILE = 'manifest.json'
+    ROLLUPS_FILE = 'rollups.pickle'
+    LOCK_FILE = 'lock'
+    MANIFEST_VERSION = 1
+    PICKLE_VERSION = PickleStore.PICKLE_VERSION
+    SEGMENT_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, directory: str, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self._manifest = self._read_manifest()
+        # device_id -> rows (only for devices whose segments were read)
+        self._loaded = {}
+        # device_id -> rows added since the last persist()
+        self._pending = {}
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.directory, self.MANIFEST_FILE)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {'version': self.MANIFEST_VERSION, 'devices': {}}
+        if manifest.get('version') != self.MANIFEST_VERSION:
+            raise NameError("Unsupported manifest version in {}: {}".format(self._manifest_path, manifest.get('version')))
+        return manifest
+
+    def _write_manifest(self):
+        tmp_path = self._manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+    def _segments(self, device_id):
+        return self._manifest['devices'].get(device_id, {'segments': []})['segments']
+
+    def _read_segments(self, device_id):
+        rows = LogData()
+        for segment in self._segments(device_id):
+            for batch in self._read_segment(segment):
+                rows.merge(batch)
+        return rows
+
+    def _read_segment(self, segment, offset=0):
+        """ Yields the batches of a segment from offset on """
+        with open(os.path.join(self.directory, segment['file']), 'rb') as f:
+            f.seek(offset)
+            while f.tell() < segment['bytes']:
+                yield pickle.load(f)
+
+    def refresh(self):
+        with file_lock(os.path.join(self.directory, self.LOCK_FILE), exclusive=False):
+            return self._refresh()
+
+    def _refresh(self):
+        """ Takes over the manifest on disk and merges the records other
+            processes appended into the rows read already """
+        manifest = self._read_manifest()
+        changed = False
+        for device_id, device in manifest['devices'].items():
+            known = self._segments(device_id)
+            for i, segment in enumerate(device['segments']):
+                offset = known[i]['bytes'] if i < len(known) else 0
+                if segment['bytes'] <= offset: continue
+                changed = True
+                self._bump_data_version(device_id)
+                if device_id in self._loaded:
+                    for batch in self._read_segment(segment, offset):
+                        self._loaded[device_id].merge(batch)
+        if not changed: return False
+        self._manifest = manifest
+        # the stats of devices with pending rows cover those rows, too
+        for device_id, rows in self._pending.items():
+            device = manifest['devices'].setdefault(device_id, {'segments': [], 'rows': 0, 'min_ts': None, 'max_ts': None})
+            min_ts, max_ts = min(rows.ts), max(rows.ts)
+            if device_id not in self._loaded and device['max_ts'] is not None and min_ts <= device['max_ts']:
+                # overlapping the rows of the other processes: count the merged rows
+                self.get_data(device_id)
+            if device_id in self._loaded:
+                ts = self._loaded[device_id].ts
+                device['rows'], device['min_ts'], device['max_ts'] = len(ts), ts[0], ts[-1]
+            else:
+                device['rows'] += len(set(rows.ts))
+                device['min_ts'] = min_ts if device['min_ts'] is None else min(min_ts, device['min_ts'])
+                device['max_ts'] = max_ts if device['max_ts'] is None else max(max_ts, device['max_ts'])
+        # (reread and rebuilt where needed on their next use)
+        self._rollups = None
+        return True
+
+    def device_stats(self):
+        stats = {}
+        for device_id, device in self._manifest['devices'].items():
+            stats[device_id] = Object(rows=device['rows'],
+                                      min_ts=None if device['min_ts'] is None else datetime.fromtimestamp(device['min_ts']),
+                                      max_ts=None if device['max_ts'] is None else datetime.fromtimestamp(device['max_ts']))
+        return stats
+
+    def get_device_ids(self):
+        return tuple(self._manifest['devices'])
+
+    def get_data(self, device_id=None):
+        if not device_id:
+            return {device_id: self.get_data(device_id) for device_id in self.get_device_ids()}
+        if device_id not in self._loaded:
+            if device_id not in self.get_device_ids(): raise KeyError(device_id)
+            rows = self._read_segments(device_id)
+            if device_id in self._pending: rows.merge(self._pending[device_id])
+            self._loaded[device_id] = rows
+        return self._loaded[device_id]
+
+    def _add_rows(self, device_id, new_data):
+        min_ts, max_ts = min(new_data.ts), max(new_data.ts)
+        device = self._manifest['devices'].get(device_id)
+        if device is not None and device['max_ts'] is not None and min_ts <= device['max_ts']:
+            # overlapping rows: count the rows that are actually new
+            added = self.get_data(device_id).merge(new_data)
+        elif device_id in self._loaded:
+            added = self._loaded[device_id].merge(new_data)
+        else:
+            added = len(set(new_data.ts))
+        self._pending.setdefault(device_id, LogData()).extend(new_data)
+        # the stats in the manifest cover the pending rows, too (they are
+        # only written together with the segments by persist())
+        device = self._manifest['devices'].setdefault(device_id, {'segments': [], 'rows': 0, 'min_ts': None, 'max_ts': None})
+        device['rows'] += added
+        device['min_ts'] = min_ts if device['min_ts'] is None else min(min_ts, device['min_ts'])
+        device['max_ts'] = max_ts if device['max_ts'] is None else max(max_ts, device['max_ts'])
+
+    def persist(self):
+        with file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            self._refresh()
+            for device_id, rows in self._pending.items():
+                if len(rows): self._append(device_id, rows)
+            self._pending = {}
+            self._write_manifest()
+            self._persist_rollups()
+
+    def _rollup_file(self):
+        return os.path.join(self.directory, self.ROLLUPS_FILE)
+
+    def _append(self, device_id, rows):
+        segments = self._manifest['devices'][device_id]['segments']
+        if not segments or segments[-1]['bytes'] >= self.segment_size:
+            segments.append({'file': '{}-{:06d}.seg'.format(device_id, len(segments)), 'bytes': 0, 'rows': 0})
+        segment = segments[-1]
+        path = os.path.join(self.directory, segment['file'])
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            # drop whatever an interrupted earlier write may have left behind
+            f.truncate(segment['bytes'])
+            f.seek(segment['bytes'])
+            pickle.dump(rows, f, self.PICKLE_VERSION)
+            f.flush()
+            os.fsync(f.fileno())
+            segment['bytes'] = f.tell()
+        segment['rows'] += len(rows)
+
+class SqliteStore(LogStore):
+    """
+    A LogStore backed by an SQLite database (in WAL mode).
+
+    All rows live in a single table with the primary key (device_id, ts)
+    and one REAL column per channel (named c<channel>, added as needed).
+    The rows added by add_data() are written in one transaction that is
+    committed by persist(). Rows with a timestamp that is already stored
+    update the existing row instead of duplicating it. A second table
+    keeps the number of rows and the first / last timestamp per device,
+    a third one the channels with values per device (the columns of the
+    rows table are shared by all devices).
+    The store may be used from several threads, one at a time.
+
+    add_data() takes the write lock of the database (BEGIN IMMEDIATE)
+    before it reads anything, so the row counts and the rollups agree
+    with the rows other processes added; it's held until persist().
+    """
+
+    TABLE = 'log_data'
+    STATS_TABLE = 'device_stats'
+    CHANNELS_TABLE = 'device_channels'
+    ROLLUPS_SUFFIX = '.rollups'
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._db = sqlite3.connect(db_file, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS {} (device_id TEXT NOT NULL, ts INTEGER NOT NULL, '
+                         'PRIMARY KEY (device_id, ts)) WITHOUT ROWID'.format(self.TABLE))
+        if not self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (self.STATS_TABLE,)).fetchone():
+            self._db.execute('CREATE TABLE {} (device_id TEXT PRIMARY KEY, rows INTEGER NOT NULL, '
+                             'min_ts INTEGER, max_ts INTEGER)'.format(self.STATS_TABLE))
+            # databases written before the stats table existed
+            self._db.execute('INSERT INTO {} SELECT device_id, COUNT(*), MIN(ts), MAX(ts) FROM {} '
+                             'GROUP BY device_id'.format(self.STATS_TABLE, self.TABLE))
+        self._channels = self._read_channels()
+        if not self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (self.CHANNELS_TABLE,)).fetchone():
+            self._db.execute('CREATE TABLE {} (device_id TEXT NOT NULL, channel INTEGER NOT NULL, '
+                             'PRIMARY KEY (device_id, channel)) WITHOUT ROWID'.format(self.CHANNELS_TABLE))
+            # databases written before the channels table existed
+            for channel in self._channels:
+                self._db.execute('INSERT INTO {} SELECT DISTINCT device_id, ? FROM {} WHERE c{:d} IS NOT NULL'.format(
+                                 self.CHANNELS_TABLE, self.TABLE, channel), (channel,))
+        self._db.commit()
+        self._db_data_version, = self._db.execute('PRAGMA data_version').fetchone()
+
+    def _read_channels(self):
+        columns = [column[1] for column in self._db.execute('PRAGMA table_info({})'.format(self.TABLE))]
+        return [int(column[1:]) for column in columns if column.startswith('c')]
+
+    def _add_channel(self, channel):
+        self._db.execute('ALTER TABLE {} ADD COLUMN c{:d} REAL'.format(self.TABLE, channel))
+        self._channels.append(channel)
+
+    def close(self):
+        self._db.close()
+
+    def refresh(self):
+        # the rows are always read from the database, only the rollups
+        # need to be reread when another connection committed rows
+        version, = self._db.execute('PRAGMA data_version').fetchone()
+        if version == self._db_data_version: return False
+        self._db_data_version = version
+        self._channels = self._read_channels()
+        self._rollups = None
+        # (which devices got new rows isn't known)
+        for device_id in self.get_device_ids(): self._bump_data_version(device_id)
+        return True
+
+    def device_stats(self):
+        stats = {}
+        for device_id, rows, min_ts, max_ts in self._db.execute('SELECT * FROM {}'.format(self.STATS_TABLE)):
+            stats[device_id] = Object(rows=rows,
+                                      min_ts=None if min_ts is None else datetime.fromtimestamp(min_ts),
+                                      max_ts=None if max_ts is None else datetime.fromtimestamp(max_ts))
+        return stats
+
+    def get_device_ids(self):
+        return tuple(row[0] for row in self._db.execute('SELECT device_id FROM {}'.format(self.STATS_TABLE)))
+
+    def get_data(self, device_id=None):
+        if not device_id:
+            return {device_id: self.get_data(device_id) for device_id in self.get_device_ids()}
+        return self.get_range(device_id)
+
+    def get_channels(self, device_id):
+        if device_id not in self.get_device_ids(): raise KeyError(device_id)
+        return self._device_channels(device_id)
+
+    def _device_channels(self, device_id):
+        """ The channels with values of device_id (in the order of the columns) """
+        channels = {row[0] for row in self._db.execute('SELECT channel FROM {} WHERE device_id = ?'.format(self.CHANNELS_TABLE), (device_id,))}
+        return [channel for channel in self._channels if channel in channels]
+
+    def get_range(self, device_id, start=None, end=None, channels=None):
+        return self._select(device_id, None if start is None else int(start.timestamp()),
+                            None if end is None else int(end.timestamp()), channels)
+
+    def iter_range(self, device_id, start=None, end=None, channels=None, batch_rows=LogStore.BATCH_ROWS):
+        # each batch is a query continuing after the last ts of the previous one
+        first = None if start is None else int(start.timestamp())
+        last = None if end is None else int(end.timestamp())
+        while True:
+            rows = self._select(device_id, first, last, channels, limit=batch_rows)
+            if len(rows): yield rows
+            if len(rows) < batch_rows: return
+            first = rows.ts[-1] + 1
+
+    def _select(self, device_id, first=None, last=None, channels=None, limit=None):
+        """ The rows with first <= ts <= last (UNIX timestamps, None = unbounded) """
+        channels = [channel for channel in (channels if channels is not None else self._device_channels(device_id)) if channel in self._channels]
+        query = 'SELECT ts{} FROM {} WHERE device_id = ?'.format(''.join(', c{:d}'.format(channel) for channel in channels), self.TABLE)
+        params = [device_id]
+        if first is not None:
+            query += ' AND ts >= ?'
+            params.append(first)
+        if last is not None:
+            query += ' AND ts <= ?'
+            params.append(last)
+        query += ' ORDER BY ts'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        rows = LogData(columns={channel: array('f') for channel in channels})
+        columns = [rows.ts] + [rows.columns[channel] for channel in channels]
+        for values in self._db.execute(query, params):
+            for column, value in zip(columns, values):
+                column.append(NAN if value is None else value)
+        return rows
+
+    def _begin(self):
+        """ Starts a transaction holding the write lock (unless one is open) """
+        if self._db.in_transaction: return
+        self._db.execute('BEGIN IMMEDIATE')
+        # (another connection may have added channels)
+        self._channels = self._read_channels()
+
+    def add_data(self, device_id, new_data):
+        self._begin()
+        super(SqliteStore, self).add_data(device_id, new_data)
+
+    def _add_rows(self, device_id, new_data):
+        self._begin()
+        channels = new_data.channels
+        for channel in channels:
+            if channel not in self._channels: self._add_channel(channel)
+        self._db.executemany('INSERT OR IGNORE INTO {} VALUES (?, ?)'.format(self.CHANNELS_TABLE),
+                             ((device_id, channel) for channel in channels if any(value == value for value in new_data.columns[channel])))
+        columns = ''.join(', c{:d}'.format(channel) for channel in channels)
+        placeholders = ', ?' * len(channels)
+        # keep the values already stored for channels missing in the new rows
+        updates = ', '.join('c{0:d} = coalesce(excluded.c{0:d}, c{0:d})'.format(channel) for channel in channels)
+        query = 'INSERT INTO {} (device_id, ts{}) VALUES (?, ?{}) ON CONFLICT (device_id, ts) DO '.format(self.TABLE, columns, placeholders)
+        query += 'UPDATE SET ' + updates if updates else 'NOTHING'
+        # rows that only update stored ones don't count: compare the
+        # number of rows within the time span of new_data before and after
+        count = 'SELECT COUNT(*) FROM {} WHERE device_id = ? AND ts BETWEEN ? AND ?'.format(self.TABLE)
+        span = (device_id, min(new_data.ts), max(new_data.ts))
+        before, = self._db.execute(count, span).fetchone()
+        columns = [new_data.columns[channel] for channel in channels]
+        self._db.executemany(query, ((device_id, ts) + tuple(value if value == value else None for value in values)
+                                     for ts, *values in zip(new_data.ts, *columns)))
+        after, = self._db.execute(count, span).fetchone()
+        self._db.execute('INSERT INTO {0} VALUES (?, ?, ?, ?) ON CONFLICT (device_id) DO UPDATE SET '
+                         'rows = rows + excluded.rows, min_ts = min(min_ts, excluded.min_ts), '
+                         'max_ts = max(max_ts, excluded.max_ts)'.format(self.STATS_TABLE),
+                         (device_id, after - before, span[1], span[2]))
+
+    def _rollup_file(self):
+        return self.db_file + self.ROLLUPS_SUFFIX
+
+    def persist(self):
+        # without a transaction the rollups may be outdated by other connections
+        if not self._db.in_transaction: self.refresh()
+        # (saved under the write lock: they cover the rows being committed)
+        self._persist_rollups()
+        self._db.commit()
+
+class ColumnStore(LogStore):
+    """
+    A columnar LogStore for numpy / pandas consumers (requires numpy).
+
+    Each device gets a subdirectory holding fixed-width binary files:
+
+        <device_id>/columns.json - the number of rows, the channels and the generation
+        <device_id>/ts.i64       - UNIX timestamps (int64, sorted)
+        <device_id>/c<ch>.f32    - the values of channel ch (float32, NaN = missing)
+
+    The files are opened with numpy.memmap and get_columns() hands out
+    views of them: reading a time window only touches the pages of the
+    window (plus a binary search in the timestamps). Rows that are newer
+    than the stored ones are appended by persist(), anything else makes
+    it rewrite the files of the device. persist() holds an exclusive lock
+    and first rereads the columns.json files other processes changed,
+    just like refresh() (the files are mapped again on their next use).
+
+    A rewrite writes a new generation of the files (ts.i64.g<n>, ...)
+    and switches to it by replacing columns.json, so a crash or a reader
+    never pairs the timestamps of one generation with the values of
+    another. The files of the old generation are deleted afterwards.
+    """
+
+    INFO_FILE = 'columns.json'
+    ROLLUPS_FILE = 'rollups.pickle'
+    LOCK_FILE = 'lock'
+    INFO_VERSION = 1
+    TS_FILE = 'ts.i64'
+    CHANNEL_FILE = 'c{:d}.f32'
+    GENERATION_FILE = '{}.g{:d}'
+
+    def __init__(self, directory: str):
+        if np is None: raise NameError("The ColumnStore requires numpy.")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # device_id -> {'rows': ..., 'channels': [...]}
+        self._info = {}
+        for device_id in os.listdir(directory):
+            info = self._read_info(device_id)
+            if info is not None: self._info[device_id] = info
+        # device_id -> {'ts': memmap, channel: memmap}
+        self._maps = {}
+        # device_id -> rows added since the last persist()
+        self._pending = {}
+        # device_id -> Object(rows=..., min_ts=..., max_ts=...)
+        self._stats = {}
+
+    def _path(self, device_id, filename=''):
+        return os.path.join(self.directory, device_id, filename)
+
+    def _read_info(self, device_id):
+        try:
+            with open(self._path(device_id, self.INFO_FILE), 'r') as f:
+                info = json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if info.get('version') != self.INFO_VERSION:
+            raise NameError("Unsupported column store version for {}: {}".format(device_id, info.get('version')))
+        return info
+
+    def _write_info(self, device_id):
+        path = self._path(device_id, self.INFO_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self._info[device_id], f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def refresh(self):
+        with file_lock(os.path.join(self.directory, self.LOCK_FILE), exclusive=False):
+            return self._refresh()
+
+    def _refresh(self):
+        changed = False
+        for device_id in os.listdir(self.directory):
+            info = self._read_info(device_id)
+            if info is None or info == self._info.get(device_id): continue
+            self._info[device_id] = info
+            self._maps.pop(device_id, None)
+            self._stats.pop(device_id, None)
+            self._bump_data_version(device_id)
+            changed = True
+        if changed: self._rollups = None
+        return changed
+
+    def _column_file(self, channel, generation=0):
+        filename = self.TS_FILE if channel == 'ts' else self.CHANNEL_FILE.format(channel)
+        return filename if not generation else self.GENERATION_FILE.format(filename, generation)
+
+    def _map(self, device_id):
+        """ The persisted columns of device_id as read-only memmaps. If
+            another process replaced the generation of the files in the
+            meantime, the columns.json of the device is read again. """
+        while device_id not in self._maps:
+            info = self._info[device_id]
+            try:
+                self._maps[device_id] = self._map_files(device_id, info)
+            except FileNotFoundError:
+                current = self._read_info(device_id)
+                if current is None or current.get('generation', 0) == info.get('generation', 0): raise
+                self._info[device_id] = current
+                self._stats.pop(device_id, None)
+                self._bump_data_version(device_id)
+        return self._maps[device_id]
+
+    def _map_files(self, device_id, info):
+        maps = {}
+        for channel in ['ts'] + info['channels']:
+            dtype = np.int64 if channel == 'ts' else np.float32
+            if info['rows']:
+                # (a mapped file stays readable when it is deleted)
+                maps[channel] = np.memmap(self._path(device_id, self._column_file(channel, info.get('generation', 0))),
+                                          dtype=dtype, mode='r', shape=(info['rows'],))
+            else:
+                maps[channel] = np.empty(0, dtype=dtype)
+        return maps
+
+    @staticmethod
+    def _rows_to_columns(rows):
+        """ numpy views of the arrays of a LogData """
+        columns = {'ts': np.frombuffer(rows.ts, dtype=np.int64)}
+        for channel, values in rows.columns.items():
+            columns[channel] = np.frombuffer(values, dtype=np.float32)
+        return columns
+
+    def device_stats(self):
+        stats = {}
+        for device_id in self.get_device_ids():
+            stats[device_id] = Object(**self._device_stats(device_id).to_dict())
+        return stats
+
+    def _device_stats(self, device_id):
+        if device_id not in self._stats:
+            # the timestamps are sorted: only their first and last value is read
+            ts = self.get_columns(device_id)['ts']
+            self._stats[device_id] = Object(rows=len(ts),
+                                            min_ts=datetime.fromtimestamp(int(ts[0])) if len(ts) else None,
+                                            max_ts=datetime.fromtimestamp(int(ts[-1])) if len(ts) else None)
+        return self._stats[device_id]
+
+    def get_device_ids(self):
+        device_ids = list(self._info)
+        device_ids += [device_id for device_id in self._pending if device_id not in self._info]
+        return tuple(device_ids)
+
+    def get_columns(self, device_id, start=None, end=None, channels=None):
+        """ Returns the columns {'ts': int64 UNIX timestamps, channel: float32 values}
+            of device_id with start <= ts <= end (datetimes, None = unbounded).
+            The arrays are read-only views of the memory-mapped files unless
+            there are rows that haven't been persisted yet. """
+        if device_id in self._pending:
+            columns = self._merged_columns(device_id)
+        elif device_id in self._info:
+            columns = self._map(device_id)
+        else:
+            raise KeyError(device_id)
+        ts = columns['ts']
+        lo = 0 if start is None else int(np.searchsorted(ts, int(start.timestamp()), side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, int(end.timestamp()), side='right'))
+        keys = columns if channels is None else ['ts'] + [channel for channel in channels if channel in columns]
+        return {key: columns[key][lo:hi] for key in keys}
+
+    def get_channels(self, device_id):
+        return [channel for channel in self.get_columns(device_id) if channel != 'ts']
+
+    def get_frame(self, device_id, start=None, end=None, channels=None, min_points=None):
+        import pandas as pd
+        rollup = self.get_rollup(device_id, start, end, min_points, channels) if min_points else None
+        if rollup is not None: return rollup.avg.to_frame()
+        columns = self.get_columns(device_id, start, end, channels)
+        return pd.DataFrame(columns, index=local_datetime_index(columns.pop('ts')), copy=False)
+
+    def get_range(self, device_id, start=None, end=None, channels=None):
+        return LogData.from_columns(self.get_columns(device_id, start, end, channels))
+
+    def iter_range(self, device_id, start=None, end=None, channels=None, batch_rows=LogStore.BATCH_ROWS):
+        # only the pages of the current batch are read from the mapped files
+        columns = self.get_columns(device_id, start, end, channels)
+        for offset in range(0, len(columns['ts']), batch_rows):
+            yield LogData.from_columns({key: values[offset:offset+batch_rows] for key, values in columns.items()})
+
+    def get_data(self, device_id=None):
+        if not device_id:
+            return {device_id: self.get_data(device_id) for device_id in self.get_device_ids()}
+        return self.get_range(device_id)
+
+    def _add_rows(self, device_id, new_data):
+        timestamps = new_data.ts
+        appended = all(a < b for a, b in zip(timestamps, timestamps[1:]))
+        if appended and device_id in self.get_device_ids():
+            max_ts = self._device_stats(device_id).max_ts
+            appended = max_ts is None or datetime.fromtimestamp(timestamps[0]) > max_ts
+        self._pending.setdefault(device_id, LogData()).extend(new_data)
+        if appended:
+            self._stats[device_id] = self._update_stats(self._stats.get(device_id), new_data)
+        else:
+            # rows may replace stored ones: count them again when needed
+            self._stats.pop(device_id, None)
+
+    def _merged_columns(self, device_id):
+        """ The persisted columns of device_id merged with its pending rows:
+            sorted by ts, a pending row is merged into a stored one with the
+            same ts (the values of the newer row win unless they are NaN). """
+        stored = self._map(device_id) if device_id in self._info else {'ts': np.empty(0, dtype=np.int64)}
+        new = self._rows_to_columns(self._pending[device_id])
+        channels = [channel for channel in stored if channel != 'ts']
+        channels += [channel for channel in new if channel != 'ts' and channel not in stored]
+        n_stored, n_new = len(stored['ts']), len(new['ts'])
+        merged = {'ts': np.concatenate((stored['ts'], new['ts']))}
+        for channel in channels:
+            column = np.full(n_stored + n_new, np.nan, dtype=np.float32)
+            if channel in stored: column[:n_stored] = stored[channel]
+            if channel in new: column[n_stored:] = new[channel]
+            merged[channel] = column
+        if (not n_stored or not n_new or new['ts'][0] > stored['ts'][-1]) and (np.diff(new['ts']) > 0).all():
+            return merged
+        # sort (stable, so newer rows come last) and merge the rows with the
+        # same timestamp into the last one of them
+        order = np.argsort(merged['ts'], kind='stable')
+        ts = merged['ts'][order]
+        duplicates = np.flatnonzero(ts[1:] == ts[:-1]) + 1
+        keep = np.append(ts[1:] != ts[:-1], True)
+        result = {'ts': ts[keep]}
+        for channel in channels:
+            column = merged[channel][order]
+            while True:
+                fill = duplicates[np.isnan(column[duplicates]) & ~np.isnan(column[duplicates - 1])]
+                if not len(fill): break
+                column[fill] = column[fill - 1]
+            result[channel] = column[keep]
+        return result
+
+    def persist(self):
+        with file_lock(os.path.join(self.directory, self.LOCK_FILE)):
+            self._refresh()
+            for device_id, rows in self._pending.items():
+                if len(rows): self._persist_device(device_id)
+            self._pending = {}
+            self._persist_rollups()
+
+    def _rollup_file(self):
+        return os.path.join(self.directory, self.ROLLUPS_FILE)
+
+    def _persist_device(self, device_id):
+        info = self._info.get(device_id, {'version': self.INFO_VERSION, 'rows': 0, 'channels': []})
+        new = self._rows_to_columns(self._pending[device_id])
+        stored_ts = self._map(device_id)['ts'] if device_id in self._info else np.empty(0, dtype=np.int64)
+        appendable = (not len(stored_ts) or new['ts'][0] > stored_ts[-1]) and (np.diff(new['ts']) > 0).all()
+        os.makedirs(self._path(device_id), exist_ok=True)
+        self._maps.pop(device_id, None)
+        if appendable:
+            n_stored, n_new = info['rows'], len(new['ts'])
+            channels = info['channels'] + [channel for channel in new if channel != 'ts' and channel not in info['channels']]
+            for channel in ['ts'] + channels:
+                if channel in new:
+                    column = new[channel]
+                else:
+                    column = np.full(n_new, np.nan, dtype=np.float32)
+                # channels new to this device are NaN for the rows stored so far
+                fill = n_stored if channel != 'ts' and channel not in info['channels'] else 0
+                self._append_column(device_id, channel, info.get('generation', 0), n_stored - fill, column, fill)
+        else:
+            self._info[device_id] = info
+            merged = self._merged_columns(device_id)
+            self._maps.pop(device_id, None)
+            channels = [channel for channel in merged if channel != 'ts']
+            # the files of the new generation are complete before columns.json names them
+            generation = info.get('generation', 0) + 1
+            for channel, column in merged.items():
+                with open(self._path(device_id, self._column_file(channel, generation)), 'wb') as f:
+                    column.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            info['generation'] = generation
+            n_stored, n_new = 0, len(merged['ts'])
+        info['rows'] = n_stored + n_new
+        info['channels'] = channels
+        self._info[device_id] = info
+        self._write_info(device_id)
+        if not appendable:
+            # the files of the old generation (and of rewrites that were interrupted)
+            current = set(self._column_file(channel, generation) for channel in ['ts'] + channels)
+            for filename in os.listdir(self._path(device_id)):
+                if filename not in current and self._is_column_file(filename):
+                    os.remove(self._path(device_id, filename))
+
+    def _is_column_file(self, filename):
+        filename = filename.split('.g')[0]
+        return filename == self.TS_FILE or (filename.startswith('c') and filename.endswith('.f32'))
+
+    def _append_column(self, device_id, channel, generation, valid_rows, column, fill):
+        """ Appends column to the file of channel after its first valid_rows
+            values (dropping anything an interrupted write left behind),
+            preceded by fill NaN values. """
+        path = self._path(device_id, self._column_file(channel, generation))
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.truncate(valid_rows * column.itemsize)
+            f.seek(valid_rows * column.itemsize)
+            if fill: np.full(fill, np.nan, dtype=np.float32).tofile(f)
+            column.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+def open_log_store(path: str):
+    """ Opens the LogStore at path: a SqliteStore for *.sqlite / *.db files,
+        a ColumnStore for *.columns directories, a SegmentStore for other
+        directories (or paths ending with a path separator) and a
+        PickleStore otherwise. """
+    if path.endswith(SQLITE_SUFFIXES):
+        return SqliteStore(path)
+    if path.rstrip(os.sep).endswith(COLUMN_STORE_SUFFIX):
+        return ColumnStore(path)
+    if os.path.isdir(path) or path.endswith(os.sep):
+        return SegmentStore(path)
+    return PickleStore(path)
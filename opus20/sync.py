@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import math
+import time
+import logging
+import threading
+from datetime import datetime
+
+clock = time.perf_counter
+logger = logging.getLogger(__name__)
+
+class LogSync(object):
+    """
+    Keeps a LogStore up to date with the log of an OPUS20 device.
+
+    A thread (see start()) downloads the rows logged since the newest
+    row in the store on a fixed cadence: every `every` seconds, by
+    default once per logging interval of the device (learned from the
+    downloaded rows), at the time the next row is due plus DELAY. The
+    rows are added and persisted batch by batch, so a long download
+    neither keeps them in memory nor loses them when it breaks off.
+    trigger() asks for a sync right away without waiting for it.
+
+    The locks serialize the access to the device and to the store with
+    other users in the same process (like the PlotWebServer). They are
+    only held per step: the device lock while a frame of the log is
+    requested, the store lock while its batch is added.
+    """
+
+    # seconds to wait after a row is due (the device may write it late)
+    DELAY = 5
+    # the cadence until the logging interval is known
+    DEFAULT_INTERVAL = 60
+    # seconds to wait before retrying a failed sync (at most)
+    RETRY_INTERVAL = 30
+
+    def __init__(self, o20, store, every=None, auto=True, device_lock=None, store_lock=None):
+        self.o20 = o20
+        self.store = store
+        self.every = every
+        self.auto = auto
+        self.device_lock = device_lock if device_lock is not None else threading.Lock()
+        self.store_lock = store_lock if store_lock is not None else threading.RLock()
+        self.log_interval = None
+        self.syncs = 0
+        self.failures = 0
+        self.total_rows = 0
+        self.last_rows = None
+        self.last_sync = None
+        self.last_duration = None
+        self.last_error = None
+        self.next_sync = None
+        self.syncing = False
+        self.stopped = False
+        # trigger() numbers the requests, a finished sync served all made before it started
+        self.requested = 0
+        self.served = 0
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def start(self):
+        """ Starts the thread, which syncs right away and then on the cadence """
+        with self._cond:
+            if self._thread is None:
+                self.next_sync = time.time() if self.auto else None
+                self._thread = threading.Thread(target=self._run, name='LogSync', daemon=True)
+                self._thread.start()
+        return self
+
+    def trigger(self):
+        """ Asks the thread for a sync as soon as possible. Returns the
+            number of the request (served once status()['served'] reaches it). """
+        with self._cond:
+            self.requested += 1
+            self._cond.notify_all()
+            return self.requested
+
+    def stop(self):
+        """ Stops the thread (a running sync stops after the current batch) """
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+        if self._thread is not None: self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = lambda: self.requested > self.served or (self.next_sync is not None and time.time() >= self.next_sync)
+                while not self.stopped and not due():
+                    self._cond.wait(None if self.next_sync is None else max(self.next_sync - time.time(), 0))
+                if self.stopped: return
+                serving = self.requested
+            try:
+                self.sync()
+            except Exception:
+                # (sync() logged it already)
+                pass
+            with self._cond:
+                self.served = serving
+                if self.auto:
+                    self.next_sync = self._next_sync(time.time())
+
+    def _next_sync(self, now):
+        """ When the next sync is due: on the cadence, aligned to the times
+            the device logs its rows, or soon after a failed sync """
+        period = self.every or self.log_interval or self.DEFAULT_INTERVAL
+        if self.last_error is not None:
+            return now + min(period, self.RETRY_INTERVAL)
+        max_ts = self._max_ts()
+        if not self.log_interval or max_ts is None:
+            return now + period
+        period = max(math.ceil(period / self.log_interval), 1) * self.log_interval
+        base = max_ts.timestamp() + self.DELAY
+        return base + max(math.ceil((now - base) / period), 1) * period
+
+    def _max_ts(self):
+        with self.store_lock:
+            return self.store.max_ts().get(self.o20.device_id)
+
+    def sync(self):
+        """ Downloads the new rows of the device into the store (in the
+            calling thread). Returns the number of rows added. """
+        start = clock()
+        num_rows = 0
+        self.syncing = True
+        try:
+            with self.device_lock:
+                device_id = self.o20.device_id
+            with self.store_lock:
+                # (other processes, like a cron job, may have downloaded the logs)
+                self.store.refresh()
+                max_ts = self.store.max_ts().get(device_id)
+            frames = self.o20.iter_log_frames(start_datetime=max_ts)
+            while True:
+                # (per frame: other queries get their turn during a long download)
+                with self.device_lock:
+                    frame = next(frames, None)
+                if frame is None: break
+                batch = frame.decode()
+                if len(batch) > 1:
+                    self.log_interval = int(batch.ts[1] - batch.ts[0]) or self.log_interval
+                with self.store_lock:
+                    self.store.add_data(device_id, batch)
+                    self.store.persist()
+                num_rows += len(batch)
+                if self.stopped: break
+        except Exception as e:
+            self.last_error = "{}: {}".format(type(e).__name__, e) if str(e) else type(e).__name__
+            self.failures += 1
+            logger.warning("Syncing the log of {} failed: {}".format(self.o20.host, self.last_error))
+            raise
+        else:
+            self.last_error = None
+            logger.info("Synced {} new rows of device {}".format(num_rows, device_id))
+        finally:
+            self.syncing = False
+            self.syncs += 1
+            self.total_rows += num_rows
+            self.last_rows = num_rows
+            self.last_sync = datetime.now().replace(microsecond=0)
+            self.last_duration = clock() - start
+        return num_rows
+
+    def status(self):
+        """ The state of the syncing as a dict. The lag is the age of the
+            newest row in the store (in seconds). """
+        max_ts = self._max_ts()
+        iso = lambda value: value.isoformat() if value is not None else None
+        return {
+          'syncing':       self.syncing,
+          'auto':          self.auto,
+          'every':         self.every,
+          'log_interval':  self.log_interval,
+          'syncs':         self.syncs,
+          'failures':      self.failures,
+          'total_rows':    self.total_rows,
+          'last_rows':     self.last_rows,
+          'last_sync':     iso(self.last_sync),
+          'last_duration': self.last_duration,
+          'last_error':    self.last_error,
+          'next_sync':     iso(datetime.fromtimestamp(self.next_sync).replace(microsecond=0)) if self.next_sync else None,
+          'max_ts':        iso(max_ts),
+          'lag':           time.time() - max_ts.timestamp() if max_ts is not None else None,
+          'requested':     self.requested,
+          'served':        self.served,
+        }
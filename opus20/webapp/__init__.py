@@ -2,16 +2,29 @@
 # -*- coding: utf-8 -*-
 
 # local deps
-from opus20 import Opus20, OPUS20_CHANNEL_SPEC, PickleStore, Object
+from opus20 import Opus20, OPUS20_CHANNEL_SPEC, Object, open_log_store
+from opus20 import Opus20ConnectionException, LogSync
+from opus20.downsample import downsample, METHODS as DOWNSAMPLING_METHODS
 
 # std lib
 import logging
+import math
 import os
 import time
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
 
 # external deps
-from bottle import Bottle, request, response, view, static_file, TEMPLATE_PATH, jinja2_view as view
+from bottle import Bottle, HTTPResponse, request, response, abort, view, static_file, TEMPLATE_PATH, jinja2_view as view
+from bottle import http_date, parse_date
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +39,241 @@ TEMPLATE_PATH.insert(0, os.path.join(PATH, 'views'))
 
 clock = time.perf_counter
 
+class PlotCache(object):
+    """
+    An LRU cache of rendered plots, bounded by the total size of the
+    images in bytes. Each entry remembers the data version it was
+    rendered from; get() ignores entries of another version.
+    """
+
+    def __init__(self, max_bytes=32*1024*1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """ Adds entry (an Object with .version and .body) for key """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None: self.size -= len(old.body)
+            if len(entry.body) > self.max_bytes: return
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+class PlotQueueFullException(NameError):
+    """ too many plots are being rendered already """
+
+class NoPlotDataException(NameError):
+    """ there are no rows to plot """
+
+class PlotRenderer(object):
+    """
+    Renders plots (see render_history_plot()) in a pool of worker
+    processes, so rendering neither blocks the threads serving the
+    other requests nor holds their GIL. The workers import matplotlib
+    and pandas when they start, which happens right away.
+
+    Requests for a plot that is being rendered get the Future of that
+    render (they are coalesced). At most max_pending different plots
+    are queued or rendered at a time, render() raises a
+    PlotQueueFullException beyond that.
+    """
+
+    def __init__(self, workers=2, max_pending=8):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.renders = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = self._start_executor()
+
+    def _start_executor(self):
+        # (spawned: forking a process that runs server threads isn't safe)
+        executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_render_worker)
+        for i in range(self.workers): executor.submit(int)
+        return executor
+
+    def render(self, key, prepare):
+        """ Returns a Future of the plot for key. prepare() returns the
+            (args, kwargs) of render_history_plot(), it's only called if
+            the plot isn't being rendered already. """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                raise PlotQueueFullException("{} plots are being rendered already".format(len(self._pending)))
+            future = self._pending[key] = Future()
+            self.renders += 1
+        def done(work):
+            with self._lock:
+                del self._pending[key]
+            if work.exception() is not None:
+                future.set_exception(work.exception())
+            else:
+                future.set_result(work.result())
+        try:
+            args, kwargs = prepare()
+            executor = self._executor
+            try:
+                work = executor.submit(render_history_plot, *args, **kwargs)
+            except BrokenProcessPool:
+                with self._lock:
+                    # (unless another request replaced the broken pool already)
+                    if self._executor is executor:
+                        logger.warning("A plot render process died, starting new ones.")
+                        executor.shutdown(wait=False)
+                        self._executor = self._start_executor()
+                    executor = self._executor
+                work = executor.submit(render_history_plot, *args, **kwargs)
+        except Exception as e:
+            work = Future()
+            work.set_exception(e)
+        work.add_done_callback(done)
+        return future
+
+    def stats(self):
+        return {'workers': self.workers, 'pending': len(self._pending), 'max_pending': self.max_pending,
+                'renders': self.renders, 'coalesced': self.coalesced, 'rejected': self.rejected}
+
+    def shutdown(self):
+        with self._lock:
+            self._executor.shutdown(wait=False)
+
+def _init_render_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    import pandas
+
+class StatusPoller(object):
+    """
+    Reads the current values of the device (calling read()) in a thread
+    of its own once per interval and hands the latest snapshot to any
+    number of readers, so the load on the device doesn't depend on the
+    number of clients. The thread pauses when nobody has been waiting
+    for or asked for a snapshot for idle_after seconds.
+
+    A snapshot is an Object(seq, ts, values, error): seq counts the
+    reads, ts is their clock() time and error is set (and values None)
+    if the read failed.
+    """
+
+    def __init__(self, read, interval=2., idle_after=60.):
+        self.read = read
+        self.interval = interval
+        self.idle_after = idle_after
+        self.polls = 0
+        self.failed_polls = 0
+        self.stopped = False
+        self._snapshot = None
+        self._waiting = 0
+        self._last_demand = -1E13
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def _demand(self):
+        """ (called with the condition held) starts or wakes the thread """
+        self._last_demand = clock()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='StatusPoller', daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _idle(self):
+        return not self._waiting and clock() - self._last_demand > self.idle_after
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.stopped or not self._idle())
+                if self.stopped: return
+            start = clock()
+            snapshot = Object(seq=None, ts=start, values=None, error=None)
+            try:
+                snapshot.values = self.read()
+            except Exception as e:
+                snapshot.error = "{}: {}".format(type(e).__name__, e) if str(e) else type(e).__name__
+                logger.warning("Reading the current values failed: {}".format(snapshot.error))
+            with self._cond:
+                self.polls += 1
+                if snapshot.error: self.failed_polls += 1
+                snapshot.seq = self.polls
+                self._snapshot = snapshot
+                self._cond.notify_all()
+                # (the readers' notifications wake us, too)
+                while not self.stopped and clock() < start + self.interval:
+                    self._cond.wait(start + self.interval - clock())
+
+    def current(self, timeout=None):
+        """ The latest snapshot if it's at most two intervals old, else
+            the next one (waiting up to timeout seconds for it). None if
+            there's no fresh snapshot after that (the thread was idle or
+            the read is stuck, e.g. waiting for the device). """
+        fresh = lambda: self._snapshot is not None and clock() - self._snapshot.ts < 2 * self.interval
+        with self._cond:
+            self._demand()
+            self._waiting += 1
+            try:
+                self._cond.wait_for(lambda: self.stopped or fresh(), timeout)
+            finally:
+                self._waiting -= 1
+            return self._snapshot if fresh() else None
+
+    def next_snapshot(self, after=0, timeout=None):
+        """ The first snapshot with a seq larger than after, waiting up to
+            timeout seconds for it (None if there was none or the poller
+            was stopped) """
+        newer = lambda: self._snapshot is not None and self._snapshot.seq > after
+        with self._cond:
+            self._demand()
+            self._waiting += 1
+            try:
+                self._cond.wait_for(lambda: self.stopped or newer(), timeout)
+            finally:
+                self._waiting -= 1
+            return self._snapshot if newer() and not self.stopped else None
+
+    def stats(self):
+        return {'interval': self.interval, 'polls': self.polls, 'failed_polls': self.failed_polls,
+                'waiting': self._waiting, 'running': self._thread is not None and not self._idle()}
+
+    def stop(self):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+        if self._thread is not None: self._thread.join()
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """ A WSGIServer handling each request in a thread of its own
+        (pass it to PlotWebServer.run() as server_class) """
+    daemon_threads = True
+
 class PlotWebServer(Bottle):
 
     DPI = 72
@@ -35,6 +283,17 @@ class PlotWebServer(Bottle):
       'png': 'image/png',
       'svg': 'image/svg+xml'
     }
+    PLOT_CACHE_BYTES = 32 * 1024 * 1024
+    RENDER_WORKERS = 2
+    MAX_PENDING_RENDERS = 8
+    RENDER_TIMEOUT = 60.
+    STATUS_INTERVAL = 2.
+    # the longest a status stream stays silent (some proxies close idle connections)
+    STREAM_KEEPALIVE = 15.
+    DATA_POINTS = 400
+    MAX_DATA_POINTS = 10000
+    # buckets of a rollup tier per downsampled point (for long ranges)
+    ROLLUP_OVERSAMPLING = 4
 
     def __init__(self, host, log_file, **kwargs):
         # check for different requirements at object instatiation
@@ -44,23 +303,39 @@ class PlotWebServer(Bottle):
             del kwargs['debug']
         else:
             self.debug = False
+        self.plot_cache = PlotCache(kwargs.pop('plot_cache_bytes', self.PLOT_CACHE_BYTES))
+        self.renderer = PlotRenderer(kwargs.pop('render_workers', self.RENDER_WORKERS),
+                                     kwargs.pop('max_pending_renders', self.MAX_PENDING_RENDERS))
+        self.status_poller = StatusPoller(self._read_current_values, kwargs.pop('status_interval', self.STATUS_INTERVAL))
+        sync_kwargs = {'every': kwargs.pop('sync_interval', None), 'auto': kwargs.pop('sync', True)}
+        # the requests may be served by several threads
+        self._device_lock = threading.Lock()
+        self._store_lock = threading.RLock()
+        # ETags are only valid for this process (the data versions start anew)
+        self._etag_salt = '{}-{}'.format(os.getpid(), time.time())
+        # device_id -> (data version, time it was first seen)
+        self._data_modified = {}
         self.TPL_GLOBALS['debug_mode'] = self.debug
-        self.o20 = Opus20(host, **kwargs)
-        self.o20.disconnect()
+        # the connection to the device is kept open (and re-established when needed)
+        self.o20 = Opus20(host, keepalive=60, **kwargs)
         self.logfile = log_file
-        self.ps = PickleStore(log_file)
-        self._current_values_last_call = -1E13
-        self._download_device_data_last_call = -1E13
+        self.ps = open_log_store(log_file)
+        # keeps the store up to date in the background
+        self.log_sync = LogSync(self.o20, self.ps, device_lock=self._device_lock, store_lock=self._store_lock, **sync_kwargs)
         super(PlotWebServer, self).__init__()
         self.route('/list/devices', callback = self._list_devices)
         self.route('/download/<device_id>', callback = self._download_device_data)
+        self.route('/sync/<device_id>', callback = self._sync_status)
         self.route('/status/<device_id>', callback = self._status_device)
+        self.route('/stream/status/<device_id>', callback = self._status_stream)
         self.route('/plot/<device_id>_history.<fileformat>', callback = self._plot_history)
+        self.route('/data/<device_id>.json', callback = self._data_series)
         self.route('/static/<filename:path>', callback = self._serve_static)
         if self.debug: self.route('/debug', callback = self._debug_page)
         self.route('/plots', callback = self._plots_page)
         self.route('/about', callback = self._about_page)
         self.route('/', callback = self._status_page)
+        self.log_sync.start()
 
     def _atg(self, vals):
         """ Add template globals
@@ -86,19 +361,29 @@ class PlotWebServer(Bottle):
         return self._atg({
           'active': 'debug',
           'debug_dict': {
-            'self._current_values_last_call': self._current_values_last_call,
-            'self._download_device_data_last_call': self._download_device_data_last_call,
+            'self.status_poller.stats()': self.status_poller.stats(),
+            'self.log_sync.status()': self.log_sync.status(),
+            'self.o20.session_stats()': self.o20.session_stats(),
+            'self.plot_cache.stats()': self.plot_cache.stats(),
+            'self.renderer.stats()': self.renderer.stats(),
           }
         })
 
     @property
     def current_values(self):
-        """ the current values """
-        if  clock() - self._current_values_last_call < 2.0:
-            return self._cached_current_values
-        self._current_values_last_call = clock()
+        """ the current values (as last read by the status poller) """
+        snapshot = self.status_poller.current(timeout=self.o20.timeout)
+        if snapshot is None:
+            raise Opus20ConnectionException("No current values read from the device in the last {:.0f} s.".format(2 * self.status_poller.interval))
+        if snapshot.values is None:
+            raise Opus20ConnectionException(snapshot.error)
+        return snapshot.values
+
+    def _read_current_values(self):
+        """ Reads the current values from the device (in the status poller's thread) """
         cur = Object()
-        values = self.o20.multi_channel_value( [0x0064, 0x006E, 0x00C8, 0x00CD, 0x2724] )
+        with self._device_lock:
+            values = self.o20.multi_channel_value( [0x0064, 0x006E, 0x00C8, 0x00CD, 0x2724] )
         cur.device_id =         self.o20.device_id
         cur.temperature =       values[0]
         cur.dewpoint =          values[1]
@@ -106,18 +391,51 @@ class PlotWebServer(Bottle):
         cur.absolute_humidity = values[3]
         cur.battery_voltage =   values[4]
         cur.ts = datetime.now().replace(microsecond=0)
-        self._cached_current_values = cur
         return cur
 
-    def _status_device(self, device_id):
-        assert device_id == self._connected_device
-        status = self.current_values.to_dict()
+    @staticmethod
+    def _status_message(values):
+        status = values.to_dict()
         status['ts'] = status['ts'].isoformat()
         return {
                 'success': True,
                 'status': status,
                }
 
+    def _status_device(self, device_id):
+        assert device_id == self._connected_device
+        try:
+            values = self.current_values
+        except Opus20ConnectionException as e:
+            body = json.dumps({'success': False, 'error': str(e)})
+            return HTTPResponse(body, status=503, headers={'Content-Type': 'application/json', 'Retry-After': str(math.ceil(self.status_poller.interval))})
+        return self._status_message(values)
+
+    def _status_stream(self, device_id):
+        """ The current values as a stream of Server-Sent Events: a message
+            with the data of /status/<device_id> for every snapshot of the
+            status poller, a 'failure' event if reading the device failed """
+        if device_id != self._connected_device: abort(404, "Unknown device: " + device_id)
+        response.content_type = 'text/event-stream'
+        response.set_header('Cache-Control', 'no-cache')
+        # (for nginx, which would buffer the stream otherwise)
+        response.set_header('X-Accel-Buffering', 'no')
+        def events():
+            yield 'retry: {}\n\n'.format(int(self.status_poller.interval * 1000))
+            seq = 0
+            while not self.status_poller.stopped:
+                snapshot = self.status_poller.next_snapshot(seq, timeout=self.STREAM_KEEPALIVE)
+                if snapshot is None:
+                    # a comment: lets us notice clients that went away
+                    yield ': keepalive\n\n'
+                    continue
+                seq = snapshot.seq
+                if snapshot.error:
+                    yield 'event: failure\ndata: {}\n\n'.format(json.dumps({'success': False, 'error': snapshot.error}))
+                else:
+                    yield 'data: {}\n\n'.format(json.dumps(self._status_message(snapshot.values)))
+        return events()
+
     def _serve_static(self, filename):
         return static_file(filename, root=os.path.join(PATH, 'static'))
 
@@ -128,97 +446,238 @@ class PlotWebServer(Bottle):
         return self.o20.device_id
 
     def _list_devices(self):
+        with self._store_lock:
+            self.ps.refresh()
+            device_ids = self.ps.get_device_ids()
         return {
                 'success': True,
-                'devices': list(set([self._connected_device]) | set(self.ps.get_device_ids()))
+                'devices': list(set([self._connected_device]) | set(device_ids))
                }
 
     def _download_device_data(self, device_id):
-        if  clock() - self._download_device_data_last_call < 10.0:
-            return {'success': True, 'cached': True}
-        self._download_device_data_last_call = clock()
-        try:
-            max_ts = self.ps.max_ts()[device_id]
-        except KeyError:
-            max_ts = None
-        log_data = self.o20.download_logs(start_datetime=max_ts)
-        self.o20.disconnect()
-        self.ps.add_data(self.o20.device_id, log_data)
-        self.ps.persist()
-        return {'success': True}
+        """ Asks the LogSync for a sync now and returns right away with the
+            number of the request: the sync is done once /sync/<device_id>
+            reports a 'served' number as large """
+        if device_id != self._connected_device: abort(404, "Unknown device: " + device_id)
+        return {'success': True, 'request': self.log_sync.trigger()}
 
-    def _plot_history(self, device_id, fileformat):
-        from io import BytesIO
-        import matplotlib
-        matplotlib.use('Agg')
-        import matplotlib.pyplot as plt
-        import numpy as np
-        import pandas as pd
-
-        df = pd.DataFrame(self.ps.get_data(device_id))
-
-        df = df.set_index('ts', drop=True)
-        df.columns = [OPUS20_CHANNEL_SPEC[col]['name'] for col in df.columns]
-
-        # Handling of URL query variables
-        color = request.query.get('color', 'b,m,y,r,g,k').split(',')
-        ylabel =  request.query.get('ylabel',  'temperature [°C]')
-        y2label = request.query.get('y2label', 'humidity [%]')
-        q_range = request.query.range
-        if q_range:
-            if ',' in q_range:
-                q_range = q_range.split(',')
-                df = df[q_range[0]:q_range[1]]
-            else:
-                df = df[q_range]
-        else:
-            q_range = 'All Time'
-        figsize = request.query.figsize or '10,6'
-        figsize = (float(num) for num in figsize.split(','))
-        dpi = request.query.dpi or self.DPI
-        dpi = float(dpi)
-        #resample = request.query.resample or '2min'
-        measures = request.query.measures
-        if not measures:
-            measures = ('temperature', 'relative humidity')
-        else:
-            measures = measures.split(',')
-        right = request.query.get('right', None)
-        if right is None:
-            right = ('relative humidity',)
+    def _sync_status(self, device_id):
+        if device_id != self._connected_device: abort(404, "Unknown device: " + device_id)
+        return {'success': True, 'sync': self.log_sync.status()}
+
+    def _plot_params(self):
+        """ The query variables of a plot with their defaults applied, as a
+            normalized (hashable) tuple of (name, value) pairs """
+        query = request.query
+        split = lambda value: tuple(item for item in value.split(',') if item)
+        return (
+          ('color',    split(query.get('color', 'b,m,y,r,g,k'))),
+          ('ylabel',   query.get('ylabel', 'temperature [°C]')),
+          ('y2label',  query.get('y2label', 'humidity [%]')),
+          ('range',    query.range.strip()),
+          ('figsize',  tuple(float(num) for num in (query.figsize or '10,6').split(','))),
+          ('dpi',      float(query.dpi or self.DPI)),
+          ('measures', split(query.measures) or ('temperature', 'relative humidity')),
+          ('right',    ('relative humidity',) if query.get('right', None) is None else split(query.right)),
+        )
+
+    def _data_last_modified(self, device_id, version):
+        """ The time the server first saw the data version of device_id.
+            Last-Modified has a resolution of a second: a new version gets
+            a later time than the one before, even within the same second,
+            so If-Modified-Since never matches outdated data. """
+        previous, modified = self._data_modified.get(device_id, (None, None))
+        if previous != version:
+            now = int(time.time())
+            modified = now if modified is None else max(now, modified + 1)
+            self._data_modified[device_id] = (version, modified)
+        return modified
+
+    def _validators(self, device_id, key):
+        """ The data version of device_id (picking up the rows other
+            processes added), the ETag / Last-Modified headers of the
+            response for key and whether the request is conditional and
+            the client has it already """
+        with self._store_lock:
+            self.ps.refresh()
+            version = self.ps.data_version(device_id)
+            last_modified = self._data_last_modified(device_id, version)
+        etag = '"{}"'.format(hashlib.sha1(repr((self._etag_salt, version, key)).encode('utf-8')).hexdigest())
+        headers = {'ETag': etag, 'Last-Modified': http_date(last_modified), 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            not_modified = if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
         else:
-            right = right.split(',')
-        #selected_cols = df.columns
-        selected_cols = []
-        for measure in measures:
-            for col in df.columns:
-                if measure in col:
-                    if col not in selected_cols: selected_cols.append(col)
-        right_cols = []
-        for col in selected_cols:
-            for measure in right:
-                if measure in col:
-                    if col not in right_cols: right_cols.append(col)
-        # / End handling URL query variables
-
-        fig, ax = plt.subplots(figsize=figsize)
-        if len(selected_cols) == 1: color = color[0]
-        df.ix[:,selected_cols].plot(ax=ax, color=color, grid=True, secondary_y=right_cols, x_compat=True)
-        ax.set_xlabel('')
-        ax.set_ylabel(ylabel)
-        if len(right_cols): plt.ylabel(y2label)
-        ax.set_title("OPUS20 device: " + device_id)
-        #start, end = ax.get_xlim()
-        #ax.xaxis.set_ticks(np.arange(start, end, 1.0))
-        #ax.xaxis.grid(True, which="minor")
-        #ax.legend()
-
-        io = BytesIO()
-        plt.savefig(io, format=fileformat, dpi=dpi)
-        plt.close()
+            if_modified_since = parse_date(request.headers.get('If-Modified-Since', '').split(';')[0].strip())
+            not_modified = if_modified_since is not None and if_modified_since >= last_modified
+        return version, headers, not_modified
+
+    def _has_data(self, device_id, start, end):
+        """ Whether the store has rows of device_id between its first and
+            last timestamp that overlap start <= ts <= end (datetimes, None
+            = unbounded). Only the stats are looked at, not the rows. """
+        with self._store_lock:
+            stats = self.ps.device_stats().get(device_id)
+        if stats is None or not stats.rows: return False
+        return (start is None or start <= stats.max_ts) and (end is None or end >= stats.min_ts)
+
+    def _plot_history(self, device_id, fileformat):
+        if fileformat not in self.MIME_MAP: abort(404, "Unsupported file format: " + fileformat)
+        params = self._plot_params()
+        key = (device_id, fileformat, params)
+
+        # the data version and the request decide if the plot needs to be sent or rendered
+        version, headers, not_modified = self._validators(device_id, key)
+        if not_modified:
+            return HTTPResponse(status=304, **headers)
+
+        entry = self.plot_cache.get(key, version)
+        if entry is None:
+            kwargs = dict(params)
+            start, end = plot_range(kwargs['range'])
+            no_data = "No data for device {} in range {}".format(device_id, kwargs['range'] or 'All Time')
+            if not self._has_data(device_id, start, end): abort(404, no_data)
+            def prepare():
+                # only the selected window is read from the store, long ranges
+                # come from the rollups (about one point per pixel is enough)
+                with self._store_lock:
+                    df = self.ps.get_frame(device_id, start, end, min_points=int(kwargs['figsize'][0] * kwargs['dpi']))
+                # (the range may fall into a gap of the log)
+                if df.empty: raise NoPlotDataException(no_data)
+                return (df, device_id, fileformat), kwargs
+            try:
+                body = self.renderer.render(key + (version,), prepare).result(self.RENDER_TIMEOUT)
+            except (PlotQueueFullException, TimeoutError):
+                return HTTPResponse("The server is busy rendering plots, please retry.", status=503, headers={'Retry-After': '5'})
+            except NoPlotDataException as e:
+                abort(404, str(e))
+            entry = Object(version=version, body=body)
+            self.plot_cache.put(key, entry)
+
+        for name, value in headers.items(): response.set_header(name, value)
         response.content_type = self.MIME_MAP[fileformat]
-        return io.getvalue()
+        return entry.body
+
+    def _data_params(self):
+        """ The query variables of a data series request (range, channels
+            as numbers like 100 or 0x64, points, method) with their
+            defaults applied, as a normalized tuple of (name, value) pairs """
+        query = request.query
+        try:
+            channels = tuple(int(channel, 0) for channel in query.channels.split(',') if channel.strip())
+            points = int(query.points or self.DATA_POINTS)
+        except ValueError:
+            abort(400, "The channels and points must be integers.")
+        method = query.method or DOWNSAMPLING_METHODS[0]
+        if method not in DOWNSAMPLING_METHODS: abort(400, "Unknown downsampling method: " + method)
+        return (
+          ('range',    query.range.strip()),
+          ('channels', channels),
+          ('points',   min(max(points, 3), self.MAX_DATA_POINTS)),
+          ('method',   method),
+        )
+
+    def _data_series(self, device_id):
+        """ The series of device_id downsampled to about points points as
+            JSON: {'series': [{'channel', 'name', 'unit', 'ts', 'values'}, ...],
+            'interval': the width of the rollup buckets used (None: raw rows)} """
+        import numpy as np
+        params = self._data_params()
+        version, headers, not_modified = self._validators(device_id, ('data', device_id, params))
+        if not_modified:
+            return HTTPResponse(status=304, **headers)
+
+        kwargs = dict(params)
+        start, end = plot_range(kwargs['range'])
+        channels = kwargs['channels'] or None
+        # long ranges are downsampled from a rollup tier with a few buckets
+        # per point, so the work doesn't depend on the length of the history
+        with self._store_lock:
+            rollup = self.ps.get_rollup(device_id, start, end, kwargs['points'] * self.ROLLUP_OVERSAMPLING, channels)
+            if rollup is None:
+                try:
+                    data = self.ps.get_range(device_id, start, end, channels)
+                except KeyError:
+                    data = None
+        if rollup is None and not data:
+            abort(404, "No data for device {} in range {}".format(device_id, kwargs['range'] or 'All Time'))
+        # (for minmax, the minima of the buckets are kept in avg's place)
+        source = data if rollup is None else rollup.min if kwargs['method'] == 'minmax' else rollup.avg
+        ts = np.frombuffer(source.ts, dtype=np.int64)
+        series = []
+        for channel in source.channels:
+            values = np.frombuffer(source.columns[channel], dtype=np.float32)
+            max_values = None if rollup is None else np.frombuffer(rollup.max.columns[channel], dtype=np.float32)
+            s_ts, s_values = downsample(ts, values, kwargs['points'], kwargs['method'], max_values)
+            spec = OPUS20_CHANNEL_SPEC.get(channel, {})
+            series.append({
+                'channel': channel,
+                'name':    spec.get('name', 'channel {}'.format(channel)),
+                'unit':    spec.get('unit', ''),
+                'ts':      s_ts.tolist(),
+                'values':  np.round(s_values.astype(np.float64), 3).tolist(),
+            })
+
+        for name, value in headers.items(): response.set_header(name, value)
+        return {
+                'success': True,
+                'device_id': device_id,
+                'range': kwargs['range'],
+                'method': kwargs['method'],
+                'interval': None if rollup is None else rollup.interval,
+                'series': series,
+               }
 
     def disconnect_opus20(self):
-        self.o20.close()
+        self.o20.disconnect()
+
+    def shutdown(self):
+        self.log_sync.stop()
+        self.status_poller.stop()
+        self.renderer.shutdown()
+        self.disconnect_opus20()
+
+
+def plot_range(q_range):
+    """ The start and end (datetimes or None) of a plot range like
+        '2015-08' or '2015-08-19,2015-08-21 12:00': the range covers
+        the complete periods given (like df['2015-08']). """
+    if not q_range: return None, None
+    import pandas as pd
+    first, _, last = q_range.partition(',')
+    return pd.Period(first).start_time.to_pydatetime(), pd.Period(last or first).end_time.to_pydatetime()
+
+def render_history_plot(df, device_id, fileformat, color, ylabel, y2label, figsize, dpi, measures, right, **params):
+    """ Renders the history plot of the DataFrame df (as returned by
+        LogStore.get_frame()) and returns the image in fileformat.
+        The keyword arguments are those of PlotWebServer._plot_params(). """
+    from io import BytesIO
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    color = list(color)
+    df.columns = [OPUS20_CHANNEL_SPEC[col]['name'] for col in df.columns]
+    selected_cols = []
+    for measure in measures:
+        for col in df.columns:
+            if measure in col:
+                if col not in selected_cols: selected_cols.append(col)
+    right_cols = []
+    for col in selected_cols:
+        for measure in right:
+            if measure in col:
+                if col not in right_cols: right_cols.append(col)
+
+    fig, ax = plt.subplots(figsize=figsize)
+    if len(selected_cols) == 1: color = color[0]
+    df.loc[:,selected_cols].plot(ax=ax, color=color, grid=True, secondary_y=right_cols, x_compat=True)
+    ax.set_xlabel('')
+    ax.set_ylabel(ylabel)
+    if len(right_cols): plt.ylabel(y2label)
+    ax.set_title("OPUS20 device: " + device_id)
 
+    io = BytesIO()
+    plt.savefig(io, format=fileformat, dpi=dpi)
+    plt.close()
+    return io.getvalue()
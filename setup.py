@@ -35,6 +35,7 @@ setup(name='opus20',
           'opus20_web = opus20.opus20_web:main',
           'opus20_discovery = opus20.opus20_discovery:main',
           'opus20_fakeserver = opus20.opus20_fakeserver:main',
+          'opus20_fleet = opus20.opus20_fleet:main',
         ],
       },
       install_requires = [],
@@ -0,0 +1,60 @@
+import asyncio
+import struct
+
+import pytest
+
+from opus20 import Frame, Opus20FakeServer, Opus20Exception
+from opus20.asyncclient import AsyncOpus20
+
+class LogServer(object):
+    """ Answers a log download of frames, the data frames with a broken CRC
+        from the frame number corrupt on (the requests are counted) """
+
+    def __init__(self, frames, corrupt=None):
+        self.frames = frames
+        self.corrupt = corrupt
+        self.data_requests = 0
+
+    async def handle(self, reader, writer):
+        while True:
+            request = await reader.read(1024)
+            if not request: break
+            request = Frame(request)
+            request.validate()
+            payload = bytes(request.props.payload)
+            if payload[:1] == b'\x10':
+                answer = Frame.from_cmd_and_payload(0x24, b'\x00\x10' + struct.pack('<I', len(self.frames)) + b'\x00' * 4)
+            else:
+                answer = self.frames[min(self.data_requests, len(self.frames) - 1)]
+                if self.corrupt is not None and self.data_requests >= self.corrupt:
+                    answer = Frame(answer.data[:-3] + bytes([answer.data[-3] ^ 0xFF]) + answer.data[-2:])
+                self.data_requests += 1
+            writer.write(answer.data)
+            await writer.drain()
+        writer.close()
+
+async def download(server):
+    listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    o20 = AsyncOpus20('127.0.0.1', port=port, timeout=5.)
+    try:
+        return await o20.download_logs()
+    finally:
+        await o20.close()
+        listener.close()
+
+def frames(num_rows):
+    return list(Opus20FakeServer.synthetic_log_frames(num_rows, rows_per_frame=100, seed=0))
+
+def test_download():
+    server = LogServer(frames(350))
+    data = asyncio.run(download(server))
+    assert len(data) == 350
+    assert server.data_requests == 4
+
+def test_invalid_log_frame_is_not_requested_again():
+    # asking again would make the device send the next frame
+    server = LogServer(frames(350), corrupt=1)
+    with pytest.raises(Opus20Exception):
+        asyncio.run(download(server))
+    assert server.data_requests == 2
@@ -0,0 +1,104 @@
+import io
+import math
+import pickle
+import struct
+from array import array
+
+import pytest
+
+from opus20 import LogData
+from opus20 import codec
+
+@pytest.fixture(params=['numpy', 'pure'])
+def use_numpy(request, monkeypatch):
+    """ Runs a test with the numpy and with the pure Python transforms """
+    if request.param == 'numpy':
+        if codec.np is None: pytest.skip("numpy is not installed")
+        return True
+    monkeypatch.setattr(codec, 'np', None)
+    return False
+
+def columns(num_rows, channels=(160, 170, 260)):
+    return {channel: array('f', (math.sin(i / 50.) * channel for i in range(num_rows))) for channel in channels}
+
+def bits(values):
+    """ The float32 values as raw words (NaN == NaN, 0.0 != -0.0) """
+    return array('f', values).tobytes()
+
+def assert_decodes_to(stream, ts, cols):
+    decoded_ts, decoded_columns = codec.decode(stream)
+    assert list(decoded_ts) == list(ts)
+    assert list(decoded_columns) == list(cols)
+    for channel, values in cols.items():
+        assert bits(decoded_columns[channel]) == bits(values)
+
+@pytest.mark.parametrize('num_rows', [1, 2, 3, 4095, 4096, 4097, 10000])
+def test_identity(use_numpy, num_rows):
+    ts = array('q', (1440000000 + 60 * i for i in range(num_rows)))
+    cols = columns(num_rows)
+    assert_decodes_to(codec.encode(ts, cols), ts, cols)
+
+def test_empty(use_numpy):
+    # the channels are part of the blocks: without rows there are none
+    stream = codec.encode(array('q'), columns(0))
+    assert stream == codec.HEADER.pack(codec.MAGIC, codec.VERSION)
+    assert_decodes_to(stream, [], {})
+
+def test_irregular_timestamps(use_numpy):
+    ts = array('q', [0, 1, 1, 3, -5, 2**40, 2**40 + 7, 1440000000, -2**62, 2**62])
+    cols = columns(len(ts))
+    assert_decodes_to(codec.encode(ts, cols, block_rows=3), ts, cols)
+
+def test_special_values(use_numpy):
+    special = [0.0, -0.0, float('nan'), float('inf'), float('-inf'), 1e-45, 3.4028235e38, -1.0, 23.5]
+    # a NaN with a payload stays the same word, too
+    special.append(struct.unpack('<f', struct.pack('<I', 0x7fc00123))[0])
+    ts = array('q', range(len(special)))
+    cols = {160: array('f', special), 170: array('f', reversed(special))}
+    assert_decodes_to(codec.encode(ts, cols, block_rows=4), ts, cols)
+
+def test_no_channels(use_numpy):
+    ts = array('q', range(100))
+    assert_decodes_to(codec.encode(ts, {}), ts, {})
+
+def test_blocks_can_be_appended(use_numpy):
+    ts = array('q', range(300))
+    cols = columns(300)
+    stream = codec.encode(ts[:100], {channel: values[:100] for channel, values in cols.items()})
+    stream += codec.encode(ts[100:], {channel: values[100:] for channel, values in cols.items()}, block_rows=64, header=False)
+    blocks = list(codec.iter_decode(io.BytesIO(stream)))
+    assert [len(block_ts) for block_ts, block_columns in blocks] == [100, 64, 64, 64, 8]
+    assert_decodes_to(stream, ts, cols)
+
+def test_blocks_with_other_channels(use_numpy):
+    # channels missing in a block are filled with NaN
+    stream = codec.encode(array('q', [1, 2]), {160: array('f', [1., 2.])})
+    stream += codec.encode(array('q', [3]), {170: array('f', [3.])}, header=False)
+    ts, cols = codec.decode(stream)
+    assert list(ts) == [1, 2, 3]
+    assert bits(cols[160]) == bits([1., 2., float('nan')])
+    assert bits(cols[170]) == bits([float('nan'), float('nan'), 3.])
+
+def test_compresses_regular_data(use_numpy):
+    ts = array('q', (1440000000 + 60 * i for i in range(10000)))
+    cols = {channel: array('f', (round(20 + i // 100 * 0.1, 1) for i in range(10000))) for channel in (160, 170)}
+    raw_size = len(ts) * 8 + sum(len(values) * 4 for values in cols.values())
+    assert len(codec.encode(ts, cols)) < raw_size / 10
+
+@pytest.mark.parametrize('stream, message', [
+  (b'',                                   "Unexpected end"),
+  (b'XXXX\x01',                           "Not an encoded"),
+  (codec.MAGIC + b'\x09',                 "Unsupported"),
+  (codec.encode(array('q', [1, 2]), columns(2))[:-3], "Unexpected end"),
+])
+def test_bad_streams(stream, message):
+    with pytest.raises(codec.CodecException, match=message):
+        codec.decode(stream)
+
+def test_log_data_pickle(use_numpy):
+    data = LogData(array('q', range(1000)), columns(1000))
+    data.columns[160][5] = float('nan')
+    copy = pickle.loads(pickle.dumps(data, 3))
+    assert list(copy.ts) == list(data.ts)
+    assert {channel: bits(values) for channel, values in copy.columns.items()} == \
+           {channel: bits(values) for channel, values in data.columns.items()}
@@ -0,0 +1,114 @@
+import math
+import struct
+from datetime import datetime, timedelta
+
+import pytest
+
+from opus20 import Frame, Opus20FakeServer, LogData
+from opus20.opus20 import np
+
+def row_log_data(frame):
+    """ The former row by row decoder of log data answers (a dict per row) """
+    payload = frame.props.payload
+    is_final, begin, end, interval, num_blocks = struct.unpack('<xx?xxxxiiIH', payload[0:21])
+    ts = datetime.fromtimestamp(begin)
+    interval = timedelta(seconds=interval)
+    offset = 21
+    table = []
+    for i in range(num_blocks):
+        num_entries = payload[offset]
+        offset += 1
+        row = {'ts': ts}
+        ts = ts + interval
+        for j in range(num_entries):
+            channel_value = Frame.read_channel_value(payload, offset)
+            row[channel_value.channel] = channel_value.value
+            offset += 9
+        table.append(row)
+    return table
+
+def log_frame(blocks, begin=1440000000, interval=60):
+    """ A log data answer with a block per entry of blocks ([(channel, value), ...]) """
+    payload = [bytes([0x00, 0x20]), struct.pack('<?xxxxiiIH', True, begin, begin + (len(blocks) - 1) * interval, interval, len(blocks))]
+    for block in blocks:
+        payload.append(bytes([len(block)]))
+        for channel, value in block:
+            payload.append(struct.pack('<BBHBf', 8, 0, channel, 0x16, value))
+    frame = Frame.from_cmd_and_payload(0x24, b''.join(payload))
+    frame.validate()
+    return frame
+
+def synthetic_frames(num_rows, **kwargs):
+    frames = list(Opus20FakeServer.synthetic_log_frames(num_rows, seed=1, **kwargs))
+    for frame in frames:
+        frame.validate()
+    return frames
+
+def as_rows(columns):
+    """ The rows of decoded columns like those of row_log_data() """
+    table = []
+    for i, ts in enumerate(columns['ts']):
+        row = {'ts': datetime.fromtimestamp(int(ts))}
+        for channel, values in columns.items():
+            if channel != 'ts' and not math.isnan(values[i]): row[channel] = float(values[i])
+        table.append(row)
+    return table
+
+USE_NUMPY = [False] + ([True] if np is not None else [])
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+@pytest.mark.parametrize('num_rows, channels, rows_per_frame', [
+  (1,    (160,),                1500),
+  (1500, (160, 260, 265, 170),  1500),
+  (4000, (160, 170),            1500),
+  (2999, tuple(range(100, 120)), 300),
+])
+def test_regular_frames(use_numpy, num_rows, channels, rows_per_frame):
+    for frame in synthetic_frames(num_rows, channels=channels, rows_per_frame=rows_per_frame):
+        columns = frame.get_log_columns(use_numpy=use_numpy)
+        assert list(columns) == ['ts'] + list(channels)
+        assert as_rows(columns) == row_log_data(frame)
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+@pytest.mark.parametrize('blocks', [
+  # a channel missing in some blocks
+  [[(160, 1.5), (170, 2.5)], [(160, 3.5)], [(170, 4.5), (160, 5.5)]],
+  # the channels in another order
+  [[(160, 1.5), (170, 2.5)], [(170, 3.5), (160, 4.5)]],
+  # a block without entries
+  [[(160, 1.5)], [], [(160, 2.5)]],
+  # NaN and infinite values as logged
+  [[(160, float('nan')), (170, float('inf'))], [(160, -0.0), (170, float('-inf'))]],
+])
+def test_irregular_frames(use_numpy, blocks):
+    frame = log_frame(blocks)
+    columns = frame.get_log_columns(use_numpy=use_numpy)
+    expected = row_log_data(frame)
+    # (the former decoder kept NaN values, the columns can't tell them from missing ones)
+    expected = [{key: value for key, value in row.items() if key == 'ts' or not math.isnan(value)} for row in expected]
+    assert as_rows(columns) == expected
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_empty_frame(use_numpy):
+    frame = log_frame([])
+    columns = frame.get_log_columns(use_numpy=use_numpy)
+    assert len(columns['ts']) == 0
+    assert row_log_data(frame) == []
+
+def test_get_log_data():
+    for frame in synthetic_frames(3000):
+        data = frame.get_log_data()
+        assert isinstance(data, LogData)
+        assert list(data) == row_log_data(frame)
+        assert list(data) == list(LogData.from_rows(frame.decode()))
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+def test_numpy_and_struct_agree():
+    for frame in synthetic_frames(5000, channels=(160, 170, 260)):
+        with_numpy = frame.get_log_columns(use_numpy=True)
+        with_struct = frame.get_log_columns(use_numpy=False)
+        assert with_numpy['ts'].dtype == np.int64
+        assert with_numpy['ts'].tobytes() == with_struct['ts'].tobytes()
+        for channel in (160, 170, 260):
+            assert with_numpy[channel].dtype == np.float32
+            assert with_numpy[channel].tobytes() == with_struct[channel].tobytes()
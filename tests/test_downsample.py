@@ -0,0 +1,89 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from opus20.downsample import lttb, minmax, downsample, METHODS
+
+def series(n):
+    x = np.arange(n, dtype=np.float64) * 60
+    y = np.sin(np.arange(n) / 30.)
+    return x, y
+
+@pytest.mark.parametrize('n_out, expected', [(-1, []), (0, []), (1, [0]), (2, [0, 99])])
+def test_lttb_fewer_than_three_points(n_out, expected):
+    x, y = series(100)
+    assert list(lttb(x, y, n_out)) == expected
+
+@pytest.mark.parametrize('n, n_out', [(0, 0), (0, 5), (1, 2), (2, 2), (5, 5), (5, 100)])
+def test_lttb_short_series(n, n_out):
+    x, y = series(n)
+    assert list(lttb(x, y, n_out)) == list(range(n))
+
+@pytest.mark.parametrize('n_out', [3, 4, 10, 99])
+def test_lttb_selection(n_out):
+    x, y = series(100)
+    y[50] = 10.
+    index = lttb(x, y, n_out)
+    assert len(index) == n_out
+    assert index[0] == 0 and index[-1] == 99
+    assert (np.diff(index) > 0).all()
+    # the spike spans the largest triangles of its bucket
+    assert 50 in index
+
+@pytest.mark.parametrize('n_out', [0, 1, 2])
+def test_minmax_one_bucket(n_out):
+    x, y = series(100)
+    mins, maxs = minmax(y, n_out)
+    assert list(mins) == [int(np.argmin(y))]
+    assert list(maxs) == [int(np.argmax(y))]
+
+def test_minmax_buckets():
+    x, y = series(1000)
+    y[123], y[777] = -5., 5.
+    mins, maxs = minmax(y, 20)
+    assert len(mins) == len(maxs) == 10
+    assert 123 in mins and 777 in maxs
+    for first, index_min, index_max in zip(range(0, 1000, 100), mins, maxs):
+        assert y[index_min] == y[first:first+100].min()
+        assert y[index_max] == y[first:first+100].max()
+
+def test_minmax_short_series():
+    x, y = series(5)
+    mins, maxs = minmax(y, 10)
+    assert list(mins) == list(maxs) == list(range(5))
+
+@pytest.mark.parametrize('method', METHODS)
+def test_downsample_skips_nan(method):
+    x, y = series(1000)
+    y[::3] = np.nan
+    ts, values = downsample(x, y, 50, method)
+    assert len(ts) and not np.isnan(values).any()
+    assert (np.diff(ts) >= 0).all()
+    # only points of the series are returned
+    valid = dict(zip(x[~np.isnan(y)], y[~np.isnan(y)]))
+    assert all(valid[t] == value for t, value in zip(ts, values))
+
+@pytest.mark.parametrize('method', METHODS)
+def test_downsample_all_nan(method):
+    x, y = series(100)
+    ts, values = downsample(x, np.full(100, np.nan), 10, method)
+    assert len(ts) == len(values) == 0
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('points', [0, 1, 2])
+def test_downsample_few_points(method, points):
+    x, y = series(100)
+    ts, values = downsample(x, y, points, method)
+    assert len(ts) == len(values) <= 2
+
+def test_downsample_minmax_max_values():
+    x, y = series(100)
+    ts, values = downsample(x, y, 2, 'minmax', max_values=y + 1.)
+    # the minimum of the bucket from y, its maximum from max_values
+    assert list(ts) == sorted([x[np.argmin(y)], x[np.argmax(y)]])
+    assert sorted(values) == [y.min(), y.max() + 1.]
+
+def test_downsample_unknown_method():
+    x, y = series(10)
+    with pytest.raises(ValueError):
+        downsample(x, y, 5, 'median')
@@ -0,0 +1,221 @@
+import os
+import time
+from array import array
+from datetime import datetime
+
+import pytest
+
+from opus20 import LogData, Rollups, PickleStore, SegmentStore, SqliteStore, ColumnStore, open_log_store
+from opus20 import codec
+
+BEGIN = 1440000000
+DEVICE = 'EC9C0A06B183'
+
+# the path of each kind of store, as told apart by open_log_store()
+STORES = [
+  ('store.p',        PickleStore),
+  ('segments' + os.sep, SegmentStore),
+  ('store.sqlite',   SqliteStore),
+  ('store.columns',  ColumnStore),
+]
+
+def log_data(first, num_rows, interval=60, channels=(160, 170), offset=0.):
+    """ num_rows rows from row number first on with values that tell the row and channel apart """
+    ts = array('q', (BEGIN + (first + i) * interval for i in range(num_rows)))
+    columns = {channel: array('f', (channel + (first + i) / 8. + offset for i in range(num_rows))) for channel in channels}
+    return LogData(ts, columns)
+
+def rows(data):
+    """ The rows as comparable dicts (missing values left out) """
+    return list(LogData.from_rows(data))
+
+@pytest.fixture(params=STORES, ids=[cls.__name__ for path, cls in STORES])
+def store_path(request, tmp_path):
+    path, cls = request.param
+    if cls is ColumnStore and codec.np is None: pytest.skip("the ColumnStore requires numpy")
+    # (a trailing separator makes it a SegmentStore, pathlib would drop it)
+    return os.path.join(str(tmp_path), path)
+
+def reopen(store, path):
+    if hasattr(store, 'close'): store.close()
+    return open_log_store(path)
+
+def test_open_log_store_kind(store_path):
+    kinds = {os.path.join(os.path.dirname(store_path.rstrip(os.sep)), path): cls for path, cls in STORES}
+    assert type(open_log_store(store_path)) is kinds[store_path]
+
+def test_round_trip(store_path):
+    store = open_log_store(store_path)
+    data = log_data(0, 500)
+    store.add_data(DEVICE, data)
+    store.persist()
+    store = reopen(store, store_path)
+    assert store.get_device_ids() == (DEVICE,)
+    assert rows(store.get_data(DEVICE)) == rows(data)
+    stats = store.device_stats()[DEVICE]
+    assert stats.rows == 500
+    assert stats.min_ts == datetime.fromtimestamp(BEGIN)
+    assert stats.max_ts == datetime.fromtimestamp(BEGIN + 499 * 60)
+    assert sorted(store.get_channels(DEVICE)) == [160, 170]
+    window = store.get_range(DEVICE, datetime.fromtimestamp(BEGIN + 100 * 60), datetime.fromtimestamp(BEGIN + 199 * 60), [170])
+    assert rows(window) == rows(data[100:200].select([170]))
+    batches = list(store.iter_range(DEVICE, batch_rows=64))
+    assert all(len(batch) <= 64 for batch in batches)
+    assert sum((rows(batch) for batch in batches), []) == rows(data)
+
+def test_dict_rows(store_path):
+    store = open_log_store(store_path)
+    data = log_data(0, 10)
+    store.add_data(DEVICE, list(data))
+    store.persist()
+    assert rows(reopen(store, store_path).get_data(DEVICE)) == rows(data)
+
+def test_overlap_merge(store_path):
+    store = open_log_store(store_path)
+    store.add_data(DEVICE, log_data(0, 100))
+    # rows 50..149: the values of channel 160 are replaced, channel 170
+    # isn't part of the new rows and keeps its stored values
+    update = log_data(50, 100, channels=(160,), offset=1000.)
+    store.add_data(DEVICE, update)
+    expected = LogData()
+    expected.merge(log_data(0, 100))
+    expected.merge(update)
+    assert len(expected) == 150
+    assert rows(store.get_data(DEVICE)) == rows(expected)
+    assert store.device_stats()[DEVICE].rows == 150
+    store.persist()
+    store = reopen(store, store_path)
+    assert rows(store.get_data(DEVICE)) == rows(expected)
+    assert store.device_stats()[DEVICE].rows == 150
+    overlap = store.get_data(DEVICE)[60]
+    assert overlap[160] == 160 + 60 / 8. + 1000.
+    assert overlap[170] == 170 + 60 / 8.
+
+def test_unsorted_and_duplicate_rows(store_path):
+    store = open_log_store(store_path)
+    store.add_data(DEVICE, log_data(0, 20))
+    data = log_data(10, 20)
+    shuffled = LogData()
+    # rows 15, 29, 10, 22 and 15 again: two of them are new
+    for index in [5, 19, 0, 12, 5]:
+        shuffled.extend(data[index:index+1])
+    store.add_data(DEVICE, shuffled)
+    store.persist()
+    store = reopen(store, store_path)
+    ts = store.get_data(DEVICE).ts
+    assert list(ts) == sorted(set(ts))
+    assert len(ts) == store.device_stats()[DEVICE].rows == 22
+
+@pytest.fixture
+def fall_back_tz(monkeypatch):
+    """ A local time zone with a DST fall-back (2015-10-25 03:00 -> 02:00) """
+    if not hasattr(time, 'tzset'): pytest.skip("time.tzset() is not available")
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_merge_across_dst_fall_back(fall_back_tz):
+    # 01:45 .. 03:00 local time every 15 minutes: 02:00 .. 02:45 twice
+    ts = array('q', range(1445730300, 1445730300 + 10 * 900, 900))
+    data = LogData(array('q', ts[:6]), {160: array('f', range(6))})
+    update = LogData(array('q', [ts[9], ts[5], ts[2], ts[6], ts[7], ts[8]]), {160: array('f', [19, 15, 12, 16, 17, 18])})
+    assert data.merge(update) == 4
+    assert list(data.ts) == list(ts)
+    assert list(data.columns[160]) == [0, 1, 12, 3, 4, 15, 16, 17, 18, 19]
+
+def test_reopen_and_append(store_path):
+    store = open_log_store(store_path)
+    store.add_data(DEVICE, log_data(0, 100))
+    store.add_data('000000000001', log_data(0, 10, channels=(200,)))
+    store.persist()
+    store = reopen(store, store_path)
+    store.add_data(DEVICE, log_data(100, 100))
+    store.persist()
+    store = reopen(store, store_path)
+    assert set(store.get_device_ids()) == {DEVICE, '000000000001'}
+    assert rows(store.get_data(DEVICE)) == rows(log_data(0, 200))
+    assert rows(store.get_data('000000000001')) == rows(log_data(0, 10, channels=(200,)))
+    assert store.max_ts()[DEVICE] == datetime.fromtimestamp(BEGIN + 199 * 60)
+    # each device has its own channels
+    assert sorted(store.get_channels(DEVICE)) == [160, 170]
+    assert store.get_channels('000000000001') == [200]
+    assert store.get_data('000000000001').channels == [200]
+
+def test_refresh_picks_up_other_writers(store_path):
+    reader = open_log_store(store_path)
+    writer = open_log_store(store_path)
+    writer.add_data(DEVICE, log_data(0, 100))
+    writer.persist()
+    version = reader.data_version(DEVICE)
+    assert reader.refresh()
+    assert reader.data_version(DEVICE) != version
+    assert reader.device_stats()[DEVICE].rows == 100
+    assert rows(reader.get_data(DEVICE)) == rows(log_data(0, 100))
+
+def test_rollups_follow_the_rows(store_path):
+    store = open_log_store(store_path)
+    store.add_data(DEVICE, log_data(0, 3000))
+    store.persist()
+    store = reopen(store, store_path)
+    store.add_data(DEVICE, log_data(3000, 1000))
+    store.add_data(DEVICE, log_data(2900, 200, channels=(160,), offset=1000.))
+    expected = Rollups()
+    expected.rebuild(DEVICE, store.get_data(DEVICE))
+    for min_points in (10, 100, 1000):
+        rollup, fresh = store.get_rollup(DEVICE, min_points=min_points), expected.query(DEVICE, min_points=min_points)
+        assert rollup.interval == fresh.interval
+        for kind in ('min', 'max', 'avg'):
+            assert rows(getattr(rollup, kind)) == rows(getattr(fresh, kind))
+
+def test_sqlite_store_channels_of_older_databases(tmp_path):
+    path = os.path.join(str(tmp_path), 'store.sqlite')
+    store = open_log_store(path)
+    store.add_data(DEVICE, log_data(0, 10))
+    store.add_data('000000000001', log_data(0, 10, channels=(200,)))
+    store.persist()
+    store._db.execute('DROP TABLE {}'.format(SqliteStore.CHANNELS_TABLE))
+    store._db.commit()
+    store = reopen(store, path)
+    assert store.get_channels(DEVICE) == [160, 170]
+    assert store.get_channels('000000000001') == [200]
+
+@pytest.fixture
+def column_store_path(tmp_path):
+    if codec.np is None: pytest.skip("the ColumnStore requires numpy")
+    return os.path.join(str(tmp_path), 'store.columns')
+
+def test_column_store_rewrite_switches_generation(column_store_path):
+    store = open_log_store(column_store_path)
+    store.add_data(DEVICE, log_data(0, 100))
+    store.persist()
+    # a reader that knows the first generation but hasn't mapped its files yet
+    reader = open_log_store(column_store_path)
+    store.add_data(DEVICE, log_data(50, 100, channels=(160,), offset=1000.))
+    store.persist()
+    files = sorted(os.listdir(os.path.join(column_store_path, DEVICE)))
+    assert files == ['c160.f32.g1', 'c170.f32.g1', 'columns.json', 'ts.i64.g1']
+    expected = LogData()
+    expected.merge(log_data(0, 100))
+    expected.merge(log_data(50, 100, channels=(160,), offset=1000.))
+    assert rows(reader.get_data(DEVICE)) == rows(expected)
+    assert rows(reopen(store, column_store_path).get_data(DEVICE)) == rows(expected)
+
+def test_column_store_interrupted_rewrite(column_store_path):
+    store = open_log_store(column_store_path)
+    store.add_data(DEVICE, log_data(0, 100))
+    store.persist()
+    # files of a rewrite that crashed before columns.json named them
+    directory = os.path.join(column_store_path, DEVICE)
+    for filename in ('ts.i64.g1', 'c160.f32.g1', 'c999.f32.g1'):
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(b'\xff' * 80)
+    store = reopen(store, column_store_path)
+    assert rows(store.get_data(DEVICE)) == rows(log_data(0, 100))
+    store.add_data(DEVICE, log_data(0, 10, offset=5.))
+    store.persist()
+    assert 'c999.f32.g1' not in os.listdir(directory)
+    expected = log_data(0, 100)
+    expected.merge(log_data(0, 10, offset=5.))
+    assert rows(reopen(store, column_store_path).get_data(DEVICE)) == rows(expected)